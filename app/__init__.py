@@ -1,29 +1,86 @@
 import os
+import time
+import weakref
+
+_import_started = time.perf_counter()
+
 from flask import Flask
 from flask_cors import CORS
 from dotenv import load_dotenv
 
 # Load .env file only for local development
-if os.getenv('RAILWAY_ENVIRONMENT') != 'production':
-    print("Not in Railway production, loading .env file for local development.")
+_local_development = os.getenv('RAILWAY_ENVIRONMENT') != 'production'
+if _local_development:
     load_dotenv()
 
 from .config import config_by_name
-from .extensions import db, migrate, jwt, limiter
+from .extensions import admission, db, jwt, limiter, metrics, request_log, cache, tenancy, init_migrate
+from .tokens import revocations
+
+_import_ms = (time.perf_counter() - _import_started) * 1000
+
+
+def dispose_engines(app):
+    """
+    Drops pooled connections inherited from a parent process. Runs in every
+    forked child (e.g. gunicorn workers under --preload) so workers never share
+    sockets opened by the master.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+# Apps built in this process. One at-fork hook serves all of them, and apps that
+# are gone are dropped from the set instead of being kept alive by the hook.
+_apps = weakref.WeakSet()
 
-def create_app():
-    """Application factory function."""
+
+def _dispose_all_engines():
+    for app in list(_apps):
+        dispose_engines(app)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_dispose_all_engines)
+
+
+def create_app(config_name=None, with_cli=None):
+    """
+    Application factory function.
+
+    ``with_cli`` controls whether migrations and custom CLI commands are set up.
+    It defaults to true only when running under the ``flask`` command, so web
+    workers never import Alembic.
+    """
+    started = time.perf_counter()
     app = Flask(__name__)
+    if with_cli is None:
+        with_cli = os.environ.get('FLASK_RUN_FROM_CLI') == 'true'
 
     # Set config based on environment
-    config_name = 'production' if os.getenv('RAILWAY_ENVIRONMENT') == 'production' else 'development'
+    if config_name is None:
+        config_name = 'production' if os.getenv('RAILWAY_ENVIRONMENT') == 'production' else 'development'
     app.config.from_object(config_by_name[config_name])
 
     # Initialize extensions with the app
+    # The request log and metrics go first so their request hooks also time requests rejected by the limiter.
+    request_log.init_app(app)
+    if _local_development:
+        app.logger.info('Not in Railway production, loaded .env file for local development.')
+    metrics.init_app(app)
+    # Sheds excess load before any database work is done for the request
+    admission.init_app(app)
     db.init_app(app)
-    migrate.init_app(app, db)
+    # Resolves each request's organization before the limiter counts it
+    tenancy.init_app(app)
     jwt.init_app(app)
+    revocations.init_app(app)
     limiter.init_app(app)
+    cache.init_app(app)
+    if with_cli:
+        init_migrate(app)
+    extensions_done = time.perf_counter()
 
     # Setup CORS
     cors_origin = os.getenv('CORS_ORIGIN', "http://localhost:3000")
@@ -33,5 +90,18 @@ def create_app():
     with app.app_context():
         from .api import api_bp
         app.register_blueprint(api_bp, url_prefix='/api')
+    blueprints_done = time.perf_counter()
+
+    if with_cli:
+        from .cli import register_commands
+        register_commands(app)
+
+    _apps.add(app)
 
-    return app
\ No newline at end of file
+    app.extensions['startup_profile'] = {
+        'package_import_ms': round(_import_ms, 1),
+        'extensions_ms': round((extensions_done - started) * 1000, 1),
+        'blueprints_ms': round((blueprints_done - extensions_done) * 1000, 1),
+        'create_app_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+    return app
@@ -0,0 +1,182 @@
+"""
+Admission control: per-worker concurrency limits with priority classes.
+
+When a timed exam opens, a whole cohort logs in, opens the quiz and starts it
+within seconds. Rather than letting every request queue for a database
+connection until it times out, each worker admits a bounded number of
+requests at once (ADMISSION_MAX_CONCURRENT) and answers the rest immediately
+with 503 and a Retry-After header.
+
+Endpoints are mapped to priority classes (ADMISSION_PRIORITIES). A class may
+only use its share of the worker's slots (ADMISSION_CLASS_SHARES), so when
+the worker fills up, catalogue browsing and timer polls are turned away
+first and the remaining slots stay free for submissions. Critical requests
+are never rejected for capacity straight away: they wait up to
+ADMISSION_CRITICAL_WAIT_MS for a slot. Individual endpoints can also be
+capped (ADMISSION_ENDPOINT_LIMITS), e.g. exports that hold a connection for
+a long time.
+
+Requests that have already waited too long in front of the worker are shed
+too: when the router in front of the app sets X-Request-Start, a request
+older than its class's ADMISSION_MAX_QUEUE_MS is rejected before any work is
+done, since its client has most likely given up on it.
+
+With ADMISSION_START_WINDOW_SECONDS set, rejected quiz starts are spread
+over a window instead: each student is told to retry after an offset
+derived from their token and the quiz, so a cohort turned away together
+comes back spread out over the window rather than all at once.
+
+Limits apply per worker process; the total across a deployment is the
+per-worker limit times the number of workers.
+"""
+
+import random
+import threading
+import time
+import zlib
+
+from flask import current_app, g, jsonify, request
+
+CLASSES = ('critical', 'high', 'normal', 'low')
+REQUEST_START_HEADER = 'X-Request-Start'
+START_ENDPOINT = 'api.submission.start_quiz'
+
+
+def _queued_ms(header, now):
+    """
+    Milliseconds since the router received the request, from an X-Request-Start
+    header in seconds, milliseconds or microseconds since the epoch, optionally
+    prefixed with ``t=`` (nginx, Heroku and most load balancers use one of these).
+    """
+    try:
+        started = float(header.strip().removeprefix('t='))
+    except ValueError:
+        return None
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max(0.0, (now - started) * 1000)
+
+
+class AdmissionControl:
+    """Flask extension admitting or shedding requests by priority class; see the module docstring."""
+
+    def __init__(self, app=None):
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self._by_endpoint = {}
+        self._by_class = dict.fromkeys(CLASSES, 0)
+        self.rejected = {}  # (endpoint, class, reason) -> count
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ADMISSION_ENABLED', True)
+        app.config.setdefault('ADMISSION_MAX_CONCURRENT', 16)
+        app.config.setdefault('ADMISSION_DEFAULT_PRIORITY', 'normal')
+        app.config.setdefault('ADMISSION_PRIORITIES', {})
+        app.config.setdefault('ADMISSION_CLASS_SHARES', {'critical': 1.0, 'high': 0.85, 'normal': 0.7, 'low': 0.5})
+        app.config.setdefault('ADMISSION_ENDPOINT_LIMITS', {})
+        app.config.setdefault('ADMISSION_MAX_QUEUE_MS', {})
+        app.config.setdefault('ADMISSION_CRITICAL_WAIT_MS', 2000)
+        app.config.setdefault('ADMISSION_RETRY_AFTER', 2)
+        app.config.setdefault('ADMISSION_START_WINDOW_SECONDS', 0)
+        app.extensions['admission'] = self
+
+        if not app.config['ADMISSION_ENABLED']:
+            return
+        app.before_request(self._admit)
+        app.teardown_request(self._release)
+
+    def _priority(self, config):
+        """The request's class, or None if its endpoint is exempt (health checks, metrics)."""
+        priorities = config['ADMISSION_PRIORITIES']
+        if request.endpoint in priorities:
+            return priorities[request.endpoint]
+        return config['ADMISSION_DEFAULT_PRIORITY']
+
+    def _fits(self, config, priority, limit):
+        share = config['ADMISSION_CLASS_SHARES'].get(priority, 1.0)
+        if self.in_flight >= max(1, int(config['ADMISSION_MAX_CONCURRENT'] * share)):
+            return False
+        return limit is None or self._by_endpoint.get(request.endpoint, 0) < limit
+
+    def _admit(self):
+        if request.endpoint is None:
+            return None  # no such route; the 404 costs nothing
+        config = current_app.config
+        priority = self._priority(config)
+        if priority is None:
+            return None
+
+        max_queue_ms = config['ADMISSION_MAX_QUEUE_MS'].get(priority)
+        header = request.headers.get(REQUEST_START_HEADER)
+        if max_queue_ms and header:
+            queued = _queued_ms(header, time.time())
+            if queued is not None and queued > max_queue_ms:
+                return self._reject(config, priority, 'queue_timeout')
+
+        limit = config['ADMISSION_ENDPOINT_LIMITS'].get(request.endpoint)
+        with self._cond:
+            admitted = self._fits(config, priority, limit)
+            if not admitted and priority == 'critical':
+                deadline = time.monotonic() + config['ADMISSION_CRITICAL_WAIT_MS'] / 1000
+                while not admitted and (remaining := deadline - time.monotonic()) > 0:
+                    self._cond.wait(remaining)
+                    admitted = self._fits(config, priority, limit)
+            if admitted:
+                self.in_flight += 1
+                self._by_endpoint[request.endpoint] = self._by_endpoint.get(request.endpoint, 0) + 1
+                self._by_class[priority] = self._by_class.get(priority, 0) + 1
+        if not admitted:
+            return self._reject(config, priority, 'capacity')
+        g.admission = (request.endpoint, priority)
+        return None
+
+    def _release(self, exc=None):
+        admitted = g.pop('admission', None)
+        if admitted is None:
+            return
+        endpoint, priority = admitted
+        with self._cond:
+            self.in_flight -= 1
+            self._by_endpoint[endpoint] -= 1
+            self._by_class[priority] -= 1
+            self._cond.notify()
+
+    def _retry_after(self, config):
+        window = config['ADMISSION_START_WINDOW_SECONDS']
+        if window and request.endpoint == START_ENDPOINT:
+            # Stable per student and quiz, so retries land in the student's own slot of the window.
+            who = request.headers.get('Authorization') or request.remote_addr or ''
+            quiz_id = (request.view_args or {}).get('quiz_id')
+            return 1 + zlib.crc32(f'{who}:{quiz_id}'.encode()) % int(window)
+        base = config['ADMISSION_RETRY_AFTER']
+        # Jittered, so clients turned away together do not all come back in the same second.
+        return random.randint(base, 2 * base) if base else 0
+
+    def _reject(self, config, priority, reason):
+        key = (request.endpoint, priority, reason)
+        with self._cond:
+            self.rejected[key] = self.rejected.get(key, 0) + 1
+        retry_after = self._retry_after(config)
+        response = jsonify({'msg': 'Server busy, please retry', 'retry_after': retry_after})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    def render_prometheus(self):
+        lines = ['# HELP quiz_admission_in_flight Requests admitted and not yet finished, by priority class.',
+                 '# TYPE quiz_admission_in_flight gauge']
+        with self._cond:
+            for priority, count in sorted(self._by_class.items()):
+                lines.append(f'quiz_admission_in_flight{{priority="{priority}"}} {count}')
+            rejected = sorted(self.rejected.items())
+        if rejected:
+            lines.append('# HELP quiz_admission_rejected_total Requests rejected with 503 by admission control.')
+            lines.append('# TYPE quiz_admission_rejected_total counter')
+            for (endpoint, priority, reason), count in rejected:
+                lines.append(f'quiz_admission_rejected_total{{endpoint="{endpoint}",priority="{priority}",'
+                             f'reason="{reason}"}} {count}')
+        return '\n'.join(lines) + '\n'
@@ -1,22 +1,33 @@
 from functools import wraps
 from flask import jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
 
 from ...extensions import db
 from ...models import User
 
+def is_admin():
+    """
+    Whether the current request's token belongs to an admin. The role is read
+    from the token's claim; only tokens issued before the claim existed fall back to the database.
+    """
+    claims = get_jwt()
+    if not claims:
+        return False
+    if 'role' in claims:
+        return claims['role'] == 'admin'
+    user = db.session.get(User, get_jwt_identity())
+    return bool(user and user.role == 'admin')
+
 def admin_required(fn):
     """
     A decorator to protect routes that require admin privileges.
     It checks for a valid JWT and ensures the user has the 'admin' role.
+    Role changes revoke the user's tokens, so the claim can be trusted.
     """
     @wraps(fn)
     @jwt_required()
     def wrapper(*args, **kwargs):
-        identity = get_jwt_identity()
-        user = db.session.get(User, identity)
-        
-        if not user or user.role != 'admin':
+        if not is_admin():
             return jsonify({'msg': 'Admin access required'}), 403
             
         return fn(*args, **kwargs)
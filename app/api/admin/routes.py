@@ -1,21 +1,48 @@
-from flask import Blueprint, request, jsonify
+import io
+
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from datetime import datetime
 
-from ...extensions import db
+from ...extensions import db, cache
 # --- MODIFICATION: Import Question model ---
-from ...models import Submission, QuizAttempt, Question 
+from ...models import Submission, QuizAttempt, Question, Quiz, User
 from .. import api_bp
 from .decorators import admin_required
+from ...grading import RegradeError, grade_submissions, regrade_quiz
+from ...gradebook import ExportError, stream_gradebook
+from ...provisioning import RosterError, read_roster, provision_users
+from ...search import search_questions
+from ...similarity import clusters, similar_submissions
+from ...tokens import revocations
+from ...tenancy import tenant_id
 
 admin_bp = Blueprint('admin', __name__)
 
+BULK_GRADE_MAX = 5000
+
+def _tenant_submission(submission_id):
+    """The submission, if it belongs to an attempt of the request's organization."""
+    return (
+        Submission.query
+        .join(QuizAttempt, QuizAttempt.id == Submission.attempt_id)
+        .filter(Submission.id == submission_id, QuizAttempt.organization_id == tenant_id())
+        .first()
+    )
+
+def _tenant_get(model, object_id):
+    """Loads a User or Quiz by id, or None if it belongs to another organization."""
+    obj = db.session.get(model, object_id)
+    return obj if obj is not None and obj.organization_id == tenant_id() else None
+
 @admin_bp.route('/admin/pending_coding', methods=['GET'])
 @admin_required
 def get_pending_coding_submissions():
     """Admin endpoint to get all ungraded coding submissions."""
     submissions = (
         Submission.query
-        .filter_by(graded=False)
+        .join(QuizAttempt, QuizAttempt.id == Submission.attempt_id)
+        .filter(QuizAttempt.organization_id == tenant_id())
+        .filter(Submission.graded.is_(False))
         .filter(Submission.code.isnot(None))
         .order_by(Submission.submitted_at.asc())
         .all()
@@ -38,7 +65,7 @@ def get_pending_coding_submissions():
 @admin_required
 def get_submission_details(submission_id):
     """Admin endpoint to get details for a single submission."""
-    submission = db.session.get(Submission, submission_id)
+    submission = _tenant_submission(submission_id)
 
     if not submission:
         return jsonify({'msg': 'Submission not found'}), 404
@@ -61,7 +88,8 @@ def get_submission_details(submission_id):
             'id': question.id,
             'text': question.text,
             'points': question.points
-        }
+        },
+        'similar_submissions': similar_submissions(submission)
     })
 # --- END: New Endpoint ---
 
@@ -76,26 +104,198 @@ def grade_submission(submission_id):
     if score is None:
         return jsonify({'msg': 'Score is required'}), 400
 
-    submission = db.session.get(Submission, submission_id)
+    submission = _tenant_submission(submission_id)
     if not submission:
         return jsonify({'msg': 'Submission not found'}), 404
 
-    submission.score = float(score)
-    submission.feedback = feedback
-    submission.graded = True
-    submission.graded_at = datetime.utcnow()
-    
-    attempt = db.session.get(QuizAttempt, submission.attempt_id)
-    if attempt:
-        all_submissions = Submission.query.filter_by(attempt_id=attempt.id).all()
-        all_graded = all(s.graded for s in all_submissions)
-        
-        if all_graded:
-            total_score = sum(s.score for s in all_submissions if s.score is not None)
-            attempt.final_score = total_score
-            attempt.status = 'graded'
+    grade_submissions([submission], score, feedback)
+    return jsonify({'msg': 'Submission graded successfully'})
 
+@admin_bp.route('/admin/grade/bulk', methods=['POST'])
+@admin_required
+def grade_submissions_bulk():
+    """
+    Admin endpoint to give the same score and feedback to many submissions at
+    once, e.g. a cluster of identical solutions. Body: submission_ids, score,
+    optional feedback.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        ids = {int(i) for i in data.get('submission_ids') or []}
+        score = float(data['score'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'msg': 'submission_ids (integers) and score (a number) are required'}), 400
+    if not ids:
+        return jsonify({'msg': 'submission_ids (integers) and score (a number) are required'}), 400
+    if len(ids) > BULK_GRADE_MAX:
+        return jsonify({'msg': f'At most {BULK_GRADE_MAX} submissions can be graded at once'}), 400
+
+    submissions = (
+        Submission.query
+        .join(QuizAttempt, QuizAttempt.id == Submission.attempt_id)
+        .filter(Submission.id.in_(ids), QuizAttempt.organization_id == tenant_id())
+        .all()
+    )
+    completed = grade_submissions(submissions, score, data.get('feedback', ''))
+    return jsonify({'msg': 'Submissions graded successfully', 'graded': len(submissions),
+                    'missing': sorted(ids - {s.id for s in submissions}), 'attempts_graded': completed})
+
+@admin_bp.route('/admin/questions/<int:question_id>/code-clusters', methods=['GET'])
+@admin_required
+def code_clusters(question_id):
+    """
+    Admin endpoint listing groups of identical and near-identical coding
+    submissions to a question. ?threshold= sets the minimum similarity (0-1),
+    ?ungraded=1 leaves out graded submissions.
+    """
+    question = db.session.get(Question, question_id)
+    if not question or _tenant_get(Quiz, question.quiz_id) is None:
+        return jsonify({'msg': 'Question not found'}), 404
+    threshold = request.args.get('threshold', type=float)
+    if threshold is not None and not 0 < threshold <= 1:
+        return jsonify({'msg': 'threshold must be between 0 and 1'}), 400
+    ungraded = request.args.get('ungraded', '').lower() in ('1', 'true', 'yes')
+    return jsonify({'question_id': question_id,
+                    'clusters': clusters(question_id, threshold=threshold, ungraded_only=ungraded)})
+
+@admin_bp.route('/admin/quizzes/<int:quiz_id>/close', methods=['POST'])
+@admin_required
+def close_quiz(quiz_id):
+    """
+    Admin endpoint to close a quiz: it is unpublished, no new attempts can be
+    started, and its finalized attempts become eligible for archival.
+    """
+    quiz = _tenant_get(Quiz, quiz_id)
+    if not quiz:
+        return jsonify({'msg': 'Quiz not found'}), 404
+    if not quiz.closed_at:
+        quiz.closed_at = datetime.utcnow()
+    quiz.is_published = False
     db.session.commit()
-    return jsonify({'msg': 'Submission graded successfully'})
+    cache.invalidate_tags('quizzes', f'quiz:{quiz_id}')
+    return jsonify({'msg': 'Quiz closed', 'closed_at': quiz.closed_at.isoformat()})
+
+@admin_bp.route('/admin/quizzes/<int:quiz_id>/regrade', methods=['POST'])
+@admin_required
+def regrade(quiz_id):
+    """
+    Admin endpoint to re-score the multiple-choice submissions of a quiz, or of
+    one question with question_id. correct_choice_ids (with question_id) first
+    corrects that question's answer key. ?dry_run=1 only reports the changes.
+    """
+    quiz = _tenant_get(Quiz, quiz_id)
+    if not quiz:
+        return jsonify({'msg': 'Quiz not found'}), 404
+    data = request.get_json(silent=True) or {}
+    dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+    try:
+        question_id = int(data['question_id']) if data.get('question_id') is not None else None
+        correct = data.get('correct_choice_ids')
+        correct = [int(c) for c in correct] if correct is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'msg': 'question_id and correct_choice_ids must be integers'}), 400
+
+    try:
+        report = regrade_quiz(quiz, question_id=question_id, correct_choice_ids=correct, dry_run=dry_run)
+    except RegradeError as err:
+        return jsonify({'msg': str(err)}), 400
+    return jsonify(report)
+
+@admin_bp.route('/admin/questions/search', methods=['GET'])
+@admin_required
+def search_question_bank():
+    """
+    Admin endpoint to full-text search question and choice text across the
+    organization's quizzes, best matches first. Parameters: q, optional qtype
+    and quiz_id filters, limit (at most 100) and offset.
+    """
+    terms = request.args.get('q', '').strip()
+    if not terms:
+        return jsonify({'msg': 'q is required'}), 400
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    results, has_more = search_questions(terms, qtype=request.args.get('qtype'),
+                                         quiz_id=request.args.get('quiz_id', type=int), limit=limit, offset=offset)
+    return jsonify({'results': results, 'next_offset': offset + limit if has_more else None})
+
+@admin_bp.route('/admin/users/bulk', methods=['POST'])
+@admin_required
+def bulk_provision_users():
+    """
+    Admin endpoint to create users from a CSV roster (columns username, email,
+    optional password and role), sent as the 'roster' file of a multipart form
+    or as a text/csv body. ?dry_run=1 only validates. Returns a per-row report.
+    """
+    upload = request.files.get('roster')
+    text = upload.read().decode('utf-8-sig') if upload else request.get_data(as_text=True)
+    dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+    try:
+        rows = read_roster(io.StringIO(text), max_rows=current_app.config['PROVISION_MAX_ROWS'])
+    except (RosterError, UnicodeDecodeError) as err:
+        return jsonify({'msg': str(err)}), 400
+
+    result = provision_users(rows, dry_run=dry_run, workers=current_app.config['PROVISION_HASH_WORKERS'],
+                             organization_id=tenant_id())
+    return jsonify(result)
+
+@admin_bp.route('/admin/users/<int:user_id>/role', methods=['PUT'])
+@admin_required
+def set_user_role(user_id):
+    """
+    Admin endpoint to change a user's role. The user's existing tokens are
+    revoked, so the new role applies from their next login.
+    """
+    role = (request.get_json(silent=True) or {}).get('role')
+    if role not in ('user', 'admin'):
+        return jsonify({'msg': "role must be 'user' or 'admin'"}), 400
+
+    user = _tenant_get(User, user_id)
+    if not user:
+        return jsonify({'msg': 'User not found'}), 404
+
+    if user.role != role:
+        user.role = role
+        revocations.revoke_user(user)
+        db.session.commit()
+    return jsonify({'msg': 'Role updated', 'user_id': user.id, 'role': user.role})
+
+@admin_bp.route('/admin/users/<int:user_id>/revoke-tokens', methods=['POST'])
+@admin_required
+def revoke_user_tokens(user_id):
+    """Admin endpoint to sign a user out everywhere by revoking all their tokens."""
+    user = _tenant_get(User, user_id)
+    if not user:
+        return jsonify({'msg': 'User not found'}), 404
+    revocations.revoke_user(user)
+    db.session.commit()
+    return jsonify({'msg': 'Tokens revoked', 'user_id': user.id})
+
+@admin_bp.route('/admin/gradebook', methods=['GET'])
+@admin_required
+def export_gradebook():
+    """
+    Admin endpoint to stream a gradebook as CSV (or Parquet with ?format=parquet).
+    Filters: quiz_id, and since/until as ISO dates on the attempt start time.
+    """
+    fmt = request.args.get('format', 'csv')
+    quiz_id = request.args.get('quiz_id', type=int)
+    try:
+        since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+        until = datetime.fromisoformat(request.args['until']) if request.args.get('until') else None
+    except ValueError:
+        return jsonify({'msg': 'since and until must be ISO 8601 dates'}), 400
+
+    try:
+        chunks = stream_gradebook(fmt, quiz_id=quiz_id, since=since, until=until, organization_id=tenant_id())
+    except ExportError as err:
+        return jsonify({'msg': str(err)}), 400
+
+    name = f"gradebook-quiz-{quiz_id}" if quiz_id else "gradebook"
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/vnd.apache.parquet'
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{name}.{fmt}"'}
+    )
 
 api_bp.register_blueprint(admin_bp)
\ No newline at end of file
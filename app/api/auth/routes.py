@@ -1,11 +1,14 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
 from marshmallow import ValidationError
+from sqlalchemy.exc import IntegrityError
 
 # Correctly import extensions, models, and schemas from the new structure
 from ...extensions import db, limiter
 from ...models import User
 from ...schemas import RegisterSchema, LoginSchema
+from ...tenancy import tenant_id
+from ...tokens import revocations, issue_tokens, decode_refresh_token
 # Import the main api_bp to register this blueprint onto it
 from .. import api_bp
 
@@ -15,42 +18,91 @@ auth_bp = Blueprint('auth', __name__)
 @auth_bp.route('/auth/register', methods=['POST'])
 @limiter.limit("10 per minute")
 def register():
-    """Registers a new user."""
+    """Registers a new user in the request's organization (see the X-Organization header)."""
     data = request.get_json()
     try:
         payload = RegisterSchema().load(data)
     except ValidationError as err:
         return jsonify({'errors': err.messages}), 400
 
-    if User.query.filter((User.username == payload['username']) | (User.email == payload['email'])).first():
+    # Usernames and emails are unique within an organization only.
+    taken = User.query.filter(
+        User.organization_id == tenant_id(),
+        (User.username == payload['username']) | (User.email == payload['email']),
+    ).first()
+    if taken:
         return jsonify({'msg': 'Username or email already exists'}), 400
 
-    user = User(username=payload['username'], email=payload['email'])
+    user = User(username=payload['username'], email=payload['email'], organization_id=tenant_id())
     user.set_password(payload['password'])
     db.session.add(user)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent registration took the username or email.
+        db.session.rollback()
+        return jsonify({'msg': 'Username or email already exists'}), 400
     return jsonify({'msg': 'User registered successfully'}), 201
 
 @auth_bp.route('/auth/login', methods=['POST'])
 @limiter.limit("20 per minute")
 def login():
-    """Logs in a user and returns a JWT."""
+    """Logs in a user of the request's organization and returns a JWT."""
     data = request.get_json()
     try:
         payload = LoginSchema().load(data)
     except ValidationError as err:
         return jsonify({'errors': err.messages}), 400
 
-    user = User.query.filter_by(username=payload['username']).first()
+    user = User.query.filter_by(username=payload['username'], organization_id=tenant_id()).first()
     if not user or not user.check_password(payload['password']):
         return jsonify({'msg': 'Invalid credentials'}), 401
 
-    access_token = create_access_token(identity=str(user.id))
+    tokens = issue_tokens(user)
     return jsonify({
-        'access_token': access_token,
+        'access_token': tokens['access_token'],
+        'refresh_token': tokens['refresh_token'],
         'user': {'id': user.id, 'username': user.username, 'role': user.role}
     })
 
+@auth_bp.route('/auth/refresh', methods=['POST'])
+@limiter.limit("30 per minute")
+@jwt_required(refresh=True)
+def refresh():
+    """
+    Exchanges a refresh token for a new access/refresh token pair. The presented
+    refresh token is revoked, so each one can be used only once.
+    """
+    user = db.session.get(User, get_jwt_identity())
+    if not user:
+        return jsonify({'msg': 'User not found'}), 401
+
+    # Two concurrent refreshes with the same token both pass the blocklist check; only one may rotate it.
+    try:
+        rotated = revocations.revoke(get_jwt(), reason='rotated')
+        db.session.commit()
+    except IntegrityError:
+        rotated = False
+    if not rotated:
+        db.session.rollback()
+        return jsonify({'msg': 'refresh token already used'}), 401
+    # The role is re-read here, so a role change reaches the client at its next refresh.
+    return jsonify(issue_tokens(user))
+
+@auth_bp.route('/auth/logout', methods=['POST'])
+@jwt_required()
+def logout():
+    """Revokes the access token, and the refresh token if one is passed as 'refresh_token' in the body."""
+    claims = get_jwt()
+    revocations.revoke(claims, reason='logout')
+    data = request.get_json(silent=True) or {}
+    if data.get('refresh_token'):
+        refresh_claims = decode_refresh_token(data['refresh_token'])
+        if refresh_claims and refresh_claims['sub'] == claims['sub']:
+            revocations.revoke(refresh_claims, reason='logout')
+    db.session.commit()
+    return jsonify({'msg': 'Logged out'})
+
 # This line is crucial: it registers the auth routes with the main API blueprint.
 api_bp.register_blueprint(auth_bp)
 
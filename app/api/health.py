@@ -1,12 +1,108 @@
-from flask import Blueprint
-from ..extensions import limiter
+import threading
+import time
+
+from flask import Blueprint, current_app, jsonify
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool
+
+from ..extensions import db, limiter
 from . import api_bp
 
 health_bp = Blueprint('health', __name__)
 
+# Readiness results are cached per worker so frequent probes stay cheap.
+_readiness_lock = threading.Lock()
+_readiness_cache = {'checked_at': 0.0, 'result': None}
+
+
+def _pool_status():
+    """Returns checked-out connections, capacity and saturation of the engine's pool."""
+    pool = db.engine.pool
+    if not isinstance(pool, QueuePool):
+        return {'type': type(pool).__name__, 'checked_out': None, 'capacity': None, 'saturation': None}
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    checked_out = pool.checkedout()
+    return {
+        'type': 'QueuePool',
+        'checked_out': checked_out,
+        'capacity': capacity,
+        'saturation': round(checked_out / capacity, 3) if capacity else None,
+    }
+
+
+def _check_database(pool):
+    # An exhausted pool would make the probe itself block for pool_timeout seconds.
+    if pool['saturation'] is not None and pool['saturation'] >= 1.0:
+        return {'status': 'unavailable', 'error': 'connection pool exhausted'}
+    start = time.perf_counter()
+    try:
+        with db.engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+    except Exception as err:
+        return {'status': 'unavailable', 'error': type(err).__name__}
+    latency_ms = round((time.perf_counter() - start) * 1000, 2)
+    status = 'degraded' if latency_ms > current_app.config['HEALTH_DB_LATENCY_WARN_MS'] else 'ok'
+    return {'status': status, 'latency_ms': latency_ms}
+
+
+def _check_limiter_storage():
+    if not current_app.config.get('RATELIMIT_ENABLED', True):
+        return {'status': 'ok', 'enabled': False}
+    start = time.perf_counter()
+    try:
+        available = limiter.storage.check()
+    except Exception as err:
+        return {'status': 'unavailable', 'error': type(err).__name__}
+    latency_ms = round((time.perf_counter() - start) * 1000, 2)
+    return {'status': 'ok' if available else 'unavailable', 'latency_ms': latency_ms}
+
+
+def _run_readiness_checks():
+    pool = _pool_status()
+    database = _check_database(pool)
+    if pool['saturation'] is not None and pool['saturation'] >= current_app.config['HEALTH_POOL_SATURATION_WARN']:
+        pool['status'] = 'degraded'
+    else:
+        pool['status'] = 'ok'
+    checks = {'database': database, 'pool': pool, 'rate_limit_storage': _check_limiter_storage()}
+
+    statuses = {c['status'] for c in checks.values()}
+    if 'unavailable' in statuses:
+        status = 'unavailable'
+    elif 'degraded' in statuses:
+        status = 'degraded'
+    else:
+        status = 'ok'
+    return {'status': status, 'checks': checks}
+
+
 @health_bp.route('/health')
+@health_bp.route('/health/live')
 @limiter.exempt
 def health():
+    """Liveness probe: the worker is up and serving requests."""
     return {'status': 'ok'}
 
+
+@health_bp.route('/health/ready')
+@limiter.exempt
+def readiness():
+    """
+    Readiness probe. Reports database round-trip time, pool saturation and
+    rate-limit storage availability, and answers 503 when the worker cannot
+    serve traffic. Results are cached for HEALTH_CACHE_SECONDS.
+    """
+    now = time.monotonic()
+    with _readiness_lock:
+        cached = _readiness_cache['result']
+        fresh = cached is not None and now - _readiness_cache['checked_at'] < current_app.config['HEALTH_CACHE_SECONDS']
+        if not fresh:
+            cached = _run_readiness_checks()
+            _readiness_cache['result'] = cached
+            _readiness_cache['checked_at'] = now
+
+    unhealthy = cached['status'] == 'unavailable' or (
+        cached['status'] == 'degraded' and current_app.config['HEALTH_FAIL_ON_DEGRADED'])
+    return jsonify(cached), 503 if unhealthy else 200
+
 api_bp.register_blueprint(health_bp)
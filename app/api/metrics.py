@@ -0,0 +1,30 @@
+import hmac
+
+from flask import Blueprint, Response, current_app, jsonify, request
+from ..extensions import admission, limiter, metrics as perf_metrics
+from . import api_bp
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+def _authorized():
+    """True if METRICS_TOKEN is unset or the request presents it as a bearer token."""
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        return True
+    scheme, _, presented = request.headers.get('Authorization', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(presented.strip().encode(), token.encode())
+
+
+@metrics_bp.route('/metrics')
+@limiter.exempt
+def metrics():
+    """Exposes request and SQL timings and admission control counters in the Prometheus text format."""
+    if not _authorized():
+        response = jsonify({'msg': 'A valid metrics token is required'})
+        response.headers['WWW-Authenticate'] = 'Bearer'
+        return response, 401
+    body = perf_metrics.render_prometheus() + admission.render_prometheus()
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+api_bp.register_blueprint(metrics_bp)
@@ -1,16 +1,44 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import func
 
 # Correctly import from the new structure
-from ...extensions import db
-from ...models import Quiz, Question, Choice, User
+from ...extensions import db, cache
+from ...models import Quiz, Question, Choice, QuizAttempt
 from ...schemas import QuizSchema
+from ...randomization import is_randomized, attempt_layout, apply_layout
+from ...quiz_versions import snapshot_quiz, current_version, attempt_version, load_version
+from ...search import index_questions
+from ...tenancy import tenant_id
 from .. import api_bp
-from ..admin.decorators import admin_required
+from ..admin.decorators import admin_required, is_admin
 
 # Create a blueprint for quiz-related routes
 quiz_bp = Blueprint('quiz', __name__)
 
+
+def _catalogue_key():
+    # Admins and everyone else see different catalogues; all members of each group share one entry.
+    return 'quizzes:all' if is_admin() else 'quizzes:published'
+
+
+def _quiz_state(quiz_id):
+    """
+    Returns the live, mutable part of a quiz (publication state and current
+    version), cached so a burst of requests for a popular quiz loads it once.
+    """
+    def load():
+        quiz = db.session.get(Quiz, quiz_id)
+        if quiz is None or quiz.organization_id != tenant_id():
+            return None
+        version = current_version(quiz)
+        if version is None:
+            return None
+        return {'is_published': quiz.is_published, 'current_version_id': version.id}
+    return cache.get_or_load(f'quiz:{quiz_id}:state', load, tags=('quizzes', f'quiz:{quiz_id}'),
+                             should_cache=lambda state: state is not None)
+
+
 @quiz_bp.route('/quizzes', methods=['POST'])
 @admin_required
 def create_quiz():
@@ -22,12 +50,16 @@ def create_quiz():
         return jsonify({'errors': str(err)}), 400
 
     quiz = Quiz(
+        organization_id=tenant_id(),
         title=payload['title'],
         description=payload.get('description'),
         is_published=payload.get('is_published', False),
         # --- Add this line ---
-        time_limit_minutes=payload.get('time_limit_minutes')
+        time_limit_minutes=payload.get('time_limit_minutes'),
         # --- End of change ---
+        question_pool_size=payload.get('question_pool_size'),
+        shuffle_questions=payload.get('shuffle_questions', False),
+        shuffle_choices=payload.get('shuffle_choices', False)
     )
 
     for q_data in payload.get('questions', []):
@@ -46,47 +78,71 @@ def create_quiz():
         quiz.questions.append(question)
 
     db.session.add(quiz)
+    db.session.flush()
+    snapshot_quiz(quiz)
+    index_questions(q.id for q in quiz.questions)
     db.session.commit()
+    cache.invalidate_tags('quizzes')
     return jsonify({'msg': 'Quiz created successfully', 'quiz_id': quiz.id}), 201
 
 @quiz_bp.route('/quizzes', methods=['GET'])
 @jwt_required(optional=True)
+@cache.cached(key=_catalogue_key, ttl=60, tags=lambda: ('quizzes',))
 def list_quizzes():
     """
     Lists quizzes. Admins see all, others see only published quizzes.
     If no token is provided, it lists only published quizzes.
+    Only admins get the questions; everyone else gets a question count,
+    since answers and the unsampled part of a pool must not leak.
     """
-    identity = get_jwt_identity()
-    user = db.session.get(User, identity) if identity else None
-
-    if user and user.role == 'admin':
-        quizzes = Quiz.query.order_by(Quiz.created_at.desc()).all()
-    else:
-        quizzes = Quiz.query.filter_by(is_published=True).order_by(Quiz.created_at.desc()).all()
+    query = Quiz.query.filter_by(organization_id=tenant_id())
+    if is_admin():
+        quizzes = query.order_by(Quiz.created_at.desc()).all()
+        return jsonify(QuizSchema(many=True).dump(quizzes))
 
-    schema = QuizSchema(many=True)
-    return jsonify(schema.dump(quizzes))
+    quizzes = query.filter_by(is_published=True).order_by(Quiz.created_at.desc()).all()
+    counts = dict(
+        db.session.query(Question.quiz_id, func.count(Question.id))
+        .filter(Question.quiz_id.in_([quiz.id for quiz in quizzes]))
+        .group_by(Question.quiz_id)
+    )
+    data = QuizSchema(many=True, exclude=('questions',)).dump(quizzes)
+    for entry, quiz in zip(data, quizzes):
+        total = counts.get(quiz.id, 0)
+        entry['question_count'] = min(quiz.question_pool_size, total) if quiz.question_pool_size else total
+    return jsonify(data)
 
 @quiz_bp.route('/quizzes/<int:quiz_id>', methods=['GET'])
 @jwt_required()
 def get_quiz(quiz_id):
     """Gets a single quiz by its ID. Requires authentication."""
-    quiz = db.session.get(Quiz, quiz_id)
-    if not quiz:
+    state = _quiz_state(quiz_id)
+    if not state:
         return jsonify({"msg": "Quiz not found"}), 404
-        
+
     identity = get_jwt_identity()
-    user = db.session.get(User, identity)
+
+    # Quiz content is served from its immutable snapshot, not the Question/Choice tables
+    snapshot = load_version(state['current_version_id'])
+    if snapshot is None:
+        return jsonify({"msg": "Quiz version not found"}), 404
+    if is_admin():
+        return jsonify(dict(snapshot.data, is_published=state['is_published']))
 
     # Hide the 'is_correct' flag for non-admin users
-    schema = QuizSchema()
-    data = schema.dump(quiz)
-    if not user or user.role != 'admin':
-        for q in data.get('questions', []):
-            if 'choices' in q:
-                for c in q.get('choices', []):
-                    c.pop('is_correct', None)
-    return jsonify(data)
+    data = snapshot.public_data
+    if is_randomized(snapshot):
+        # Students see their attempt's own sample and order; the full pool stays hidden.
+        attempt = QuizAttempt.query.filter_by(user_id=identity, quiz_id=quiz_id).first()
+        if attempt:
+            attempt_snapshot = attempt_version(attempt)
+            if attempt_snapshot is None:
+                return jsonify({"msg": "Quiz version not found"}), 404
+            data = apply_layout(attempt_snapshot.public_data, attempt_layout(attempt_snapshot, attempt.id))
+        elif snapshot.question_pool_size:
+            data = dict(data, questions=[],
+                        question_count=min(snapshot.question_pool_size, len(data['questions'])))
+    return jsonify(dict(data, is_published=state['is_published']))
 
 # Register this blueprint with the main API blueprint
 api_bp.register_blueprint(quiz_bp)
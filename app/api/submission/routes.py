@@ -1,62 +1,54 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from datetime import datetime, timedelta, timezone
-from ...extensions import db
-from ...models import Submission, Question, Quiz, QuizAttempt, User
+from datetime import datetime, timezone
+from sqlalchemy.exc import IntegrityError
+from ...extensions import db, cache
+from ...models import Submission, Quiz, QuizAttempt, User, QuizAttemptArchive, SubmissionArchive
 from .. import api_bp
-from ...schemas import QuizAttemptSchema, QuizSchema
+from ..admin.decorators import is_admin
+from ...schemas import QuizAttemptSchema
+from ...randomization import is_randomized, attempt_layout, apply_layout
+from ...idempotency import idempotent
+from ...quiz_versions import current_version, attempt_version
+from ...grading import grade_question_auto, attempts_tag
+from ...similarity import record_fingerprints
+from ...summaries import dashboard as user_dashboard, refresh_summaries
+from ...attempt_state import forget_states, load_state, state_of, store_state
+from ...tenancy import tenant_id
 
 
 # Create a blueprint for submission-related routes
 submission_bp = Blueprint('submission', __name__)
 
-def grade_question_auto(question: Question, selected_choice_ids):
+def finalize_attempt(attempt, **values):
     """
-    Automatically grades a multiple-choice or multiple-select question.
+    Moves an in-progress attempt to a final state with a conditional UPDATE
+    (compare-and-set on status), so concurrent submits cannot both finalize it,
+    and refreshes the user's summary of the quiz in the same transaction.
+    Returns False if another request already did.
     """
-    if question.qtype not in ('mcq', 'msq'):
-        return 0.0
-    
-    correct_choices = [c.id for c in question.choices if c.is_correct]
-    all_choice_ids = [c.id for c in question.choices]
-    
-    # Ensure selected_choice_ids is a list of integers if provided
-    try:
-        selected_ids = [int(i) for i in selected_choice_ids] if selected_choice_ids else []
-    except (ValueError, TypeError):
-        selected_ids = []
-
-    selected_set = set(selected_ids)
-    correct_set = set(correct_choices)
-
-    correct_selected = len(selected_set & correct_set)
-    wrong_selected = len(selected_set - correct_set)
-    total_correct = len(correct_set)
-    total_choices = len(all_choice_ids) if all_choice_ids else 1
-
-    if question.qtype == 'mcq':
-        # For MCQ, score is all or nothing
-        return float(question.points) if selected_set == correct_set else 0.0
-    
-    if total_correct == 0:
-        # If there are no correct answers, score is full if nothing is selected
-        return float(question.points) if len(selected_set) == 0 else 0.0
-
-    # For MSQ, apply partial scoring with a penalty for incorrect selections
-    raw_score = (correct_selected / total_correct) - (wrong_selected / total_choices)
-    score = max(0.0, raw_score)
-    
-    return round(score * question.points, 3)
+    claimed = (
+        QuizAttempt.query
+        .filter_by(id=attempt.id, status='in-progress')
+        .update(values, synchronize_session=False)
+    )
+    if claimed != 1:
+        return False
+    refresh_summaries([(attempt.user_id, attempt.quiz_id)])
+    return True
 
 @submission_bp.route('/quizzes/<int:quiz_id>/start', methods=['POST'])
 @jwt_required()
+@idempotent
 def start_quiz(quiz_id):
     """Endpoint for a user to start a quiz attempt."""
     user_id = get_jwt_identity()
 
     quiz = db.session.get(Quiz, quiz_id)
-    if not quiz:
+    if not quiz or quiz.organization_id != tenant_id():
         return jsonify({"msg": "Quiz not found"}), 404
+    if quiz.closed_at:
+        return jsonify({"msg": "This quiz is closed."}), 409
 
     # Check for ANY existing attempt for this quiz by this user
     existing_attempt = QuizAttempt.query.filter_by(user_id=user_id, quiz_id=quiz_id).first()
@@ -67,9 +59,26 @@ def start_quiz(quiz_id):
             'status': existing_attempt.status
         }), 409
 
-    new_attempt = QuizAttempt(user_id=user_id, quiz_id=quiz_id)
+    # Pin the quiz content this attempt will be rendered and graded against
+    snapshot = current_version(quiz)
+    if snapshot is None:
+        return jsonify({"msg": "Quiz version not found"}), 404
+    new_attempt = QuizAttempt(user_id=user_id, quiz_id=quiz_id, organization_id=quiz.organization_id,
+                              quiz_version_id=snapshot.id)
     db.session.add(new_attempt)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent start for the same user and quiz won the unique constraint.
+        db.session.rollback()
+        existing_attempt = QuizAttempt.query.filter_by(user_id=user_id, quiz_id=quiz_id).first()
+        return jsonify({
+            'msg': 'You have already attempted this quiz.',
+            'attempt_id': existing_attempt.id if existing_attempt else None,
+            'status': existing_attempt.status if existing_attempt else None
+        }), 409
+    cache.invalidate_tags(attempts_tag(user_id))
+    store_state(state_of(new_attempt, snapshot))
 
     return jsonify({
         'msg': 'Quiz started successfully.',
@@ -80,13 +89,15 @@ def start_quiz(quiz_id):
 
 @submission_bp.route('/quizzes/attempts/<int:attempt_id>/submit', methods=['POST'])
 @jwt_required()
+@idempotent
 def submit_answers(attempt_id):
     """Endpoint for users to submit their answers for a quiz attempt."""
     data = request.get_json()
     user_id = get_jwt_identity() # This is a string, needs to be converted to int for comparison
     answers = data.get('answers', [])
 
-    attempt = db.session.get(QuizAttempt, attempt_id)
+    # Owner, status and deadline come from the attempt state cache; finalize_attempt re-checks the status.
+    attempt = load_state(attempt_id)
 
     # --- Validation ---
     if not attempt:
@@ -96,30 +107,43 @@ def submit_answers(attempt_id):
     if attempt.status != 'in-progress':
         return jsonify({'msg': f'This quiz was already submitted or expired.'}), 409
 
-    quiz = db.session.get(Quiz, attempt.quiz_id)
+    snapshot = attempt_version(attempt)
+    if snapshot is None:
+        return jsonify({'msg': 'Quiz version not found.'}), 404
     
     # --- Time Limit Check ---
-    if quiz.time_limit_minutes:
-        time_limit = timedelta(minutes=quiz.time_limit_minutes)
-        elapsed_time = datetime.utcnow() - attempt.start_time
-        if elapsed_time > time_limit:
-            attempt.status = 'time_expired'
-            attempt.final_score = 0
-            attempt.end_time = datetime.utcnow()
-            db.session.commit()
-            return jsonify({'msg': 'Time limit exceeded. Your submission was not graded.'}), 408 # Using 408 Request Timeout
+    if attempt.deadline and datetime.utcnow() > attempt.deadline:
+        end_time = datetime.utcnow()
+        expired = finalize_attempt(attempt, status='time_expired', final_score=0, end_time=end_time)
+        db.session.commit()
+        cache.invalidate_tags(attempts_tag(attempt.user_id))
+        if not expired:
+            forget_states([attempt.id])
+            return jsonify({'msg': 'This quiz was already submitted or expired.'}), 409
+        store_state(attempt._replace(status='time_expired', final_score=0, end_time=end_time))
+        return jsonify({'msg': 'Time limit exceeded. Your submission was not graded.'}), 408 # Using 408 Request Timeout
 
     total_auto_score = 0.0
     has_manual_grading = False
     submissions_created = []
 
+    # Grade against the attempt's pinned snapshot; no question or choice queries needed.
+    questions = snapshot.questions
+    if is_randomized(snapshot):
+        # Only the questions sampled for this attempt count.
+        sampled = {qid for qid, _ in attempt_layout(snapshot, attempt.id)}
+        questions = {qid: q for qid, q in questions.items() if qid in sampled}
+
     for ans in answers:
-        qid = ans.get('question_id')
-        question = db.session.get(Question, qid)
+        try:
+            qid = int(ans.get('question_id'))
+        except (TypeError, ValueError):
+            continue
+        question = questions.get(qid)
         if not question:
             continue
 
-        submission = Submission(attempt_id=attempt.id, user_id=user_id, quiz_id=quiz.id, question_id=qid)
+        submission = Submission(attempt_id=attempt.id, user_id=user_id, quiz_id=attempt.quiz_id, question_id=qid)
         
         if question.qtype in ('mcq', 'msq'):
             selected = ans.get('selected_choice_ids', [])
@@ -136,20 +160,25 @@ def submit_answers(attempt_id):
             submission.score = None
             has_manual_grading = True # Flag that this attempt needs manual grading
             
-        db.session.add(submission)
         submissions_created.append(submission)
 
-    # Update the attempt record
-    attempt.end_time = datetime.utcnow()
-    attempt.final_score = total_auto_score
-    
-    # If there are no coding questions, the attempt is fully graded immediately.
-    if not has_manual_grading:
-        attempt.status = 'graded'
-    else:
-        attempt.status = 'submitted' # Otherwise, it's submitted and pending review.
-    
+    # Finalize the attempt record. If there are no coding questions, the attempt is
+    # fully graded immediately; otherwise it's submitted and pending review.
+    status = 'submitted' if has_manual_grading else 'graded'
+    end_time = datetime.utcnow()
+    if not finalize_attempt(attempt, status=status, final_score=total_auto_score, end_time=end_time):
+        # A concurrent submit finalized the attempt between our status check and now.
+        db.session.rollback()
+        forget_states([attempt.id])
+        return jsonify({'msg': 'This quiz was already submitted or expired.'}), 409
+
+    db.session.add_all(submissions_created)
+    if has_manual_grading:
+        db.session.flush()
+        record_fingerprints(s for s in submissions_created if s.code)
     db.session.commit()
+    cache.invalidate_tags(attempts_tag(attempt.user_id))
+    store_state(attempt._replace(status=status, final_score=total_auto_score, end_time=end_time))
     
     return jsonify({
         'msg': 'Submission received successfully.', 
@@ -160,27 +189,39 @@ def submit_answers(attempt_id):
 
 @submission_bp.route('/submissions/mine', methods=['GET'])
 @jwt_required()
+@cache.cached(key=lambda: f'submissions:mine:{get_jwt_identity()}', tags=lambda: (attempts_tag(get_jwt_identity()),))
 def get_my_submissions():
     """Endpoint for users to retrieve their own submission history."""
     user_id = get_jwt_identity()
-    attempts = (
-        db.session.query(QuizAttempt, Quiz.title)
-        .join(Quiz, QuizAttempt.quiz_id == Quiz.id)
-        .filter(QuizAttempt.user_id == user_id)
-        .order_by(QuizAttempt.start_time.desc())
-        .limit(50)
-        .all()
-    )
-    
-    result = []
-    for attempt, quiz_title in attempts:
-        submissions = Submission.query.filter_by(attempt_id=attempt.id).all()
-        submission_details = [{
-            'question_id': s.question_id,
-            'score': s.score,
-            'feedback': s.feedback
-        } for s in submissions]
+    # History spans live attempts and attempts moved to the archive (see app/archive.py).
+    attempts = []
+    for attempt_model, submission_model in ((QuizAttempt, Submission), (QuizAttemptArchive, SubmissionArchive)):
+        rows = (
+            db.session.query(attempt_model, Quiz.title)
+            .join(Quiz, attempt_model.quiz_id == Quiz.id)
+            .filter(attempt_model.user_id == user_id)
+            .order_by(attempt_model.start_time.desc())
+            .limit(50)
+            .all()
+        )
+        attempts.extend((attempt, quiz_title, submission_model) for attempt, quiz_title in rows)
+    attempts = sorted(attempts, key=lambda row: row[0].start_time, reverse=True)[:50]
+
+    # One query per table for all details instead of one per attempt
+    details = {}
+    for submission_model in (Submission, SubmissionArchive):
+        attempt_ids = [attempt.id for attempt, _, model in attempts if model is submission_model]
+        if not attempt_ids:
+            continue
+        for s in submission_model.query.filter(submission_model.attempt_id.in_(attempt_ids)).order_by(submission_model.id):
+            details.setdefault(s.attempt_id, []).append({
+                'question_id': s.question_id,
+                'score': s.score,
+                'feedback': s.feedback
+            })
 
+    result = []
+    for attempt, quiz_title, _ in attempts:
         result.append({
             'attempt_id': attempt.id,
             'quiz_id': attempt.quiz_id,
@@ -189,17 +230,24 @@ def get_my_submissions():
             'final_score': attempt.final_score,
             'start_time': attempt.start_time.isoformat(),
             'end_time': attempt.end_time.isoformat() if attempt.end_time else None,
-            'details': submission_details
+            'details': details.get(attempt.id, [])
         })
     
     return jsonify(result)
 
+@submission_bp.route('/dashboard', methods=['GET'])
+@jwt_required()
+@cache.cached(key=lambda: f'dashboard:{get_jwt_identity()}', tags=lambda: (attempts_tag(get_jwt_identity()),))
+def get_dashboard():
+    """Endpoint for a user's dashboard: attempt counts and scores per quiz, from the summary table."""
+    return jsonify(user_dashboard(int(get_jwt_identity())))
+
 @submission_bp.route('/quizzes/attempts/<int:attempt_id>', methods=['GET'])
 @jwt_required()
 def get_attempt(attempt_id):
     """Endpoint for a user to get details of a quiz attempt."""
     user_id = get_jwt_identity()
-    attempt = db.session.get(QuizAttempt, attempt_id)
+    attempt = load_state(attempt_id)
 
     if not attempt:
         return jsonify({"msg": "Attempt not found"}), 404
@@ -207,7 +255,9 @@ def get_attempt(attempt_id):
     if attempt.user_id != int(user_id):
         return jsonify({"msg": "This is not your quiz attempt"}), 403
 
-    quiz = db.session.get(Quiz, attempt.quiz_id)
+    snapshot = attempt_version(attempt)
+    if snapshot is None:
+        return jsonify({"msg": "Quiz version not found"}), 404
 
     # --- START: Robust Elapsed Time Calculation ---
     elapsed_seconds = 0
@@ -222,11 +272,15 @@ def get_attempt(attempt_id):
     # --- END ---
 
     attempt_schema = QuizAttemptSchema()
-    quiz_schema = QuizSchema()
+
+    # The answer key stays hidden from students, as in get_quiz.
+    quiz_data = snapshot.data if is_admin() else snapshot.public_data
+    if is_randomized(snapshot):
+        quiz_data = apply_layout(quiz_data, attempt_layout(snapshot, attempt.id))
 
     return jsonify({
         'attempt': attempt_schema.dump(attempt),
-        'quiz': quiz_schema.dump(quiz),
+        'quiz': quiz_data,
         'elapsed_seconds': elapsed_seconds
     })
 
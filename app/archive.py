@@ -0,0 +1,153 @@
+"""
+Archival of historical attempts and monthly partitions of ``submission``.
+
+Finalized attempts of closed quizzes older than a cutoff are moved, with
+their submissions, into quiz_attempt_archive and submission_archive in
+batches of set-based INSERT ... SELECT and DELETE statements, one transaction
+per batch. Archived rows keep their ids, and get_my_submissions reads both
+sides, so students still see their whole history; the gradebook export
+includes archived attempts as well.
+
+On Postgres ``submission`` is range-partitioned by month on submitted_at (see
+the migration that introduced this module). Partitions for upcoming months
+are created ahead of time by ``ensure_submission_partitions``; partitions left
+empty by archival can be dropped, which is far cheaper than vacuuming the rows
+they held.
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, literal, select, text
+
+from .attempt_state import forget_states
+from .extensions import db
+from .models import CodeFingerprint, CodeSignature, Quiz, QuizAttempt, QuizAttemptArchive, Submission, SubmissionArchive
+
+# Statuses that will never change again; 'submitted' attempts still await manual grading.
+ARCHIVABLE_STATUSES = ('graded', 'time_expired')
+
+_ATTEMPT_COLUMNS = ('id', 'user_id', 'quiz_id', 'start_time', 'end_time', 'status', 'final_score', 'quiz_version_id')
+_SUBMISSION_COLUMNS = ('id', 'attempt_id', 'user_id', 'quiz_id', 'question_id', 'selected_choice_ids', 'code',
+                       'language', 'score', 'graded', 'feedback', 'submitted_at', 'graded_at')
+
+
+def archivable_attempts(older_than_days, limit=None):
+    """Select of the ids of attempts eligible for archival, oldest first."""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    stmt = (
+        select(QuizAttempt.id)
+        .join(Quiz, Quiz.id == QuizAttempt.quiz_id)
+        .where(
+            Quiz.closed_at.isnot(None),
+            QuizAttempt.status.in_(ARCHIVABLE_STATUSES),
+            QuizAttempt.start_time < cutoff,
+        )
+        .order_by(QuizAttempt.id)
+    )
+    return stmt.limit(limit) if limit else stmt
+
+
+def _copy(source, target, columns, where, archived_at):
+    return insert(target).from_select(
+        list(columns) + ['archived_at'],
+        select(*[getattr(source, c) for c in columns], literal(archived_at)).where(where),
+    )
+
+
+def archive_batch(older_than_days, batch_size=1000):
+    """Moves one batch of attempts and their submissions to the archive. Returns ``(attempts, submissions)``."""
+    ids = [row[0] for row in db.session.execute(archivable_attempts(older_than_days, batch_size))]
+    if not ids:
+        return 0, 0
+    now = datetime.utcnow()
+    db.session.execute(_copy(QuizAttempt, QuizAttemptArchive, _ATTEMPT_COLUMNS, QuizAttempt.id.in_(ids), now))
+    db.session.execute(_copy(Submission, SubmissionArchive, _SUBMISSION_COLUMNS, Submission.attempt_id.in_(ids), now))
+    # Similarity fingerprints only serve grading, which is over for archived attempts.
+    moved = select(Submission.id).where(Submission.attempt_id.in_(ids))
+    db.session.execute(delete(CodeFingerprint).where(CodeFingerprint.submission_id.in_(moved)))
+    db.session.execute(delete(CodeSignature).where(CodeSignature.submission_id.in_(moved)))
+    submissions = db.session.execute(delete(Submission).where(Submission.attempt_id.in_(ids))).rowcount
+    db.session.execute(delete(QuizAttempt).where(QuizAttempt.id.in_(ids)))
+    db.session.commit()
+    forget_states(ids)
+    return len(ids), submissions
+
+
+def archive_attempts(older_than_days, batch_size=1000, max_batches=None, log=None):
+    """Archives batches until nothing eligible is left (or ``max_batches`` ran). Returns the totals."""
+    total_attempts = total_submissions = batches = 0
+    while max_batches is None or batches < max_batches:
+        attempts, submissions = archive_batch(older_than_days, batch_size)
+        if not attempts:
+            break
+        batches += 1
+        total_attempts += attempts
+        total_submissions += submissions
+        if log:
+            log(f'batch {batches}: archived {attempts} attempts, {submissions} submissions')
+    return total_attempts, total_submissions
+
+
+def _is_postgres():
+    # The session's bind, not db.engine: an organization may have a database of its own.
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+
+def _month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def _next_month(value):
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'submission_p{month:%Y%m}'
+
+
+def ensure_submission_partitions(months_ahead=3):
+    """Creates monthly partitions of ``submission`` up to ``months_ahead`` months from now. Postgres only."""
+    if not _is_postgres():
+        return []
+    created = []
+    month = _month_start(datetime.utcnow())
+    for _ in range(months_ahead + 1):
+        name = partition_name(month)
+        exists = db.session.execute(text('SELECT to_regclass(:name)'), {'name': name}).scalar()
+        if exists is None:
+            db.session.execute(text(
+                f"CREATE TABLE {name} PARTITION OF submission "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_next_month(month):%Y-%m-%d}')"
+            ))
+            created.append(name)
+        month = _next_month(month)
+    db.session.commit()
+    return created
+
+
+def drop_empty_partitions(older_than_days):
+    """Drops monthly partitions that ended before the cutoff and hold no rows. Postgres only."""
+    if not _is_postgres():
+        return []
+    cutoff = _month_start(datetime.utcnow() - timedelta(days=older_than_days))
+    names = db.session.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = 'submission' AND child.relname LIKE 'submission_p%' ORDER BY child.relname"
+    )).scalars().all()
+    dropped = []
+    for name in names:
+        try:
+            month = datetime.strptime(name[len('submission_p'):], '%Y%m')
+        except ValueError:
+            continue
+        if _next_month(month) > cutoff:
+            continue
+        if db.session.execute(text(f'SELECT EXISTS (SELECT 1 FROM {name})')).scalar():
+            continue
+        db.session.execute(text(f'ALTER TABLE submission DETACH PARTITION {name}'))
+        db.session.execute(text(f'DROP TABLE {name}'))
+        dropped.append(name)
+    db.session.commit()
+    return dropped
@@ -0,0 +1,94 @@
+"""
+Cached state of quiz attempts.
+
+During an exam almost every request concerns an in-progress attempt: timer
+polls read it and the final submit checks its owner, status and deadline.
+That state does not change until the attempt is submitted or expires, so
+rather than loading the attempt row on every request it is kept in the
+two-tier cache (app/cache.py) as an AttemptState: owner, quiz, pinned quiz
+version, status, start time, deadline and final score.
+
+The cache is written through: start_quiz stores the state of the attempt it
+created, and submit and the expiry check store the final state after their
+transaction commits. Only the request whose compare-and-set on the status
+won (see finalize_attempt) writes; the database stays the authority, so a
+submit that passes a cached check can still lose to a concurrent one and is
+rejected then. Grading and regrading change final scores, so their
+invalidation of the user's attempts tag drops the cached states as well,
+and archival forgets the states of the attempts it moves. Another worker's
+local tier can serve a superseded state for up to CACHE_LOCAL_TTL seconds.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from .extensions import cache, db
+from .grading import attempts_tag
+from .models import QuizAttempt
+from .quiz_versions import attempt_version
+
+_DATETIMES = ('start_time', 'end_time', 'deadline')
+
+AttemptState = namedtuple('AttemptState', 'id user_id quiz_id quiz_version_id status start_time end_time '
+                                          'final_score deadline')
+
+
+def _key(attempt_id):
+    return f'attempt:{attempt_id}:state'
+
+
+def _naive_utc(value):
+    # Attempts created in this process carry an aware start time until they are reloaded.
+    return value.replace(tzinfo=None) if value is not None and value.tzinfo else value
+
+
+def state_of(attempt, snapshot=None):
+    """
+    The AttemptState of a QuizAttempt row; ``snapshot`` is its quiz version, if
+    already loaded. None if that version does not exist.
+    """
+    if snapshot is None:
+        snapshot = attempt_version(attempt)
+        if snapshot is None:
+            return None
+    start_time = _naive_utc(attempt.start_time)
+    deadline = None
+    if snapshot.time_limit_minutes:
+        deadline = start_time + timedelta(minutes=snapshot.time_limit_minutes)
+    return AttemptState(attempt.id, attempt.user_id, attempt.quiz_id, attempt.quiz_version_id, attempt.status,
+                        start_time, _naive_utc(attempt.end_time), attempt.final_score, deadline)
+
+
+def store_state(state):
+    """Writes ``state`` to the cache. Call after the transaction that produced it has committed."""
+    entry = state._asdict()
+    for name in _DATETIMES:
+        if entry[name] is not None:
+            entry[name] = entry[name].isoformat()
+    cache.set(_key(state.id), entry, tags=(attempts_tag(state.user_id),))
+
+
+def forget_states(attempt_ids):
+    for attempt_id in attempt_ids:
+        cache.delete(_key(attempt_id))
+
+
+def load_state(attempt_id):
+    """
+    The state of an attempt, from the cache or else the database; None if
+    there is no such attempt or its quiz version is missing.
+    """
+    entry = cache.get(_key(attempt_id))
+    if entry is not None:
+        entry = dict(entry)  # the local tier returns the dict it holds; convert a copy
+        for name in _DATETIMES:
+            if entry[name] is not None:
+                entry[name] = datetime.fromisoformat(entry[name])
+        return AttemptState(**entry)
+    attempt = db.session.get(QuizAttempt, attempt_id)
+    if attempt is None:
+        return None
+    state = state_of(attempt)
+    if state is not None:
+        store_state(state)
+    return state
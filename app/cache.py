@@ -0,0 +1,425 @@
+"""
+Two-tier cache with tag invalidation and single-flight loading.
+
+Reads go to a small in-process LRU first and then to a shared backend that
+all workers on a host can see (SQLite by default; any class implementing
+CacheBackend can be plugged in through CACHE_TYPE). Entries carry tags so
+writes can invalidate every cached view of a quiz or a user's attempts at
+once. Local entries live at most CACHE_LOCAL_TTL seconds, which bounds how
+long another worker's invalidation takes to become visible here.
+
+Concurrent misses for the same key are collapsed: one caller loads the value
+while the others wait for it, first within the process and then across
+processes through a short-lived lock entry in the shared backend.
+"""
+
+import abc
+import hashlib
+import importlib
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, make_response
+
+_MISSING = object()
+
+
+class CacheBackend(abc.ABC):
+    """Interface of a shared cache tier. Values are JSON-serializable."""
+
+    def __init__(self, app):
+        pass
+
+    @abc.abstractmethod
+    def get(self, key):
+        """Returns the cached value or ``_MISSING``."""
+
+    @abc.abstractmethod
+    def set(self, key, value, ttl, tags=()):
+        pass
+
+    @abc.abstractmethod
+    def add(self, key, value, ttl):
+        """Stores ``value`` only if ``key`` is absent. Returns True if it was stored."""
+
+    @abc.abstractmethod
+    def delete(self, key):
+        pass
+
+    @abc.abstractmethod
+    def invalidate_tags(self, tags):
+        pass
+
+    @abc.abstractmethod
+    def clear(self):
+        pass
+
+
+class NullBackend(CacheBackend):
+    """A shared tier that stores nothing; the local tier still works."""
+
+    def get(self, key):
+        return _MISSING
+
+    def set(self, key, value, ttl, tags=()):
+        pass
+
+    def add(self, key, value, ttl):
+        return True
+
+    def delete(self, key):
+        pass
+
+    def invalidate_tags(self, tags):
+        pass
+
+    def clear(self):
+        pass
+
+
+class SQLiteBackend(CacheBackend):
+    """Shared tier in a local SQLite file, visible to every worker process on the host."""
+
+    def __init__(self, app):
+        path = app.config.get('CACHE_SQLITE_PATH')
+        if not path:
+            # One file per database, so two apps on the same host never share entries.
+            digest = hashlib.sha1(str(app.config.get('SQLALCHEMY_DATABASE_URI')).encode()).hexdigest()[:10]
+            path = os.path.join(tempfile.gettempdir(), f'quiz-api-cache-{digest}.sqlite3')
+        self.path = path
+        self._local = threading.local()
+        _sqlite_backends.add(self)
+        with self._conn() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_entry '
+                         '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_tag '
+                         '(tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key))')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_tag_key ON cache_tag (key)')
+
+    def _reset(self):
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _conn(self):
+        """A write transaction; it takes the database's write lock, so reads do not use it."""
+        return _Transaction(self._connection())
+
+    def get(self, key):
+        # A single autocommit SELECT: under WAL it reads a snapshot without waiting for writers.
+        row = self._connection().execute(
+            'SELECT value, expires_at FROM cache_entry WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] <= time.time():
+            return _MISSING
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl, tags=()):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute('INSERT OR REPLACE INTO cache_entry (key, value, expires_at) VALUES (?, ?, ?)',
+                         (key, json.dumps(value), now + ttl))
+            conn.execute('DELETE FROM cache_tag WHERE key = ?', (key,))
+            conn.executemany('INSERT OR IGNORE INTO cache_tag (tag, key) VALUES (?, ?)',
+                             [(tag, key) for tag in tags])
+            if random.random() < 0.01:
+                conn.execute('DELETE FROM cache_tag WHERE key IN '
+                             '(SELECT key FROM cache_entry WHERE expires_at <= ?)', (now,))
+                conn.execute('DELETE FROM cache_entry WHERE expires_at <= ?', (now,))
+
+    def add(self, key, value, ttl):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute('DELETE FROM cache_entry WHERE key = ? AND expires_at <= ?', (key, now))
+            cursor = conn.execute('INSERT OR IGNORE INTO cache_entry (key, value, expires_at) VALUES (?, ?, ?)',
+                                  (key, json.dumps(value), now + ttl))
+            return cursor.rowcount == 1
+
+    def delete(self, key):
+        with self._conn() as conn:
+            conn.execute('DELETE FROM cache_entry WHERE key = ?', (key,))
+            conn.execute('DELETE FROM cache_tag WHERE key = ?', (key,))
+
+    def invalidate_tags(self, tags):
+        with self._conn() as conn:
+            for tag in tags:
+                conn.execute('DELETE FROM cache_entry WHERE key IN (SELECT key FROM cache_tag WHERE tag = ?)', (tag,))
+                conn.execute('DELETE FROM cache_tag WHERE tag = ?', (tag,))
+
+    def clear(self):
+        with self._conn() as conn:
+            conn.execute('DELETE FROM cache_entry')
+            conn.execute('DELETE FROM cache_tag')
+
+
+# Connections do not survive a fork; children open their own.
+_sqlite_backends = weakref.WeakSet()
+
+
+def _reset_backends():
+    for backend in list(_sqlite_backends):
+        backend._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_backends)
+
+
+class _Transaction:
+    """Runs a block of statements on an autocommit sqlite3 connection as one IMMEDIATE transaction."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+BACKENDS = {
+    'null': NullBackend,
+    'local': NullBackend,
+    'sqlite': SQLiteBackend,
+}
+
+
+class _LocalLRU:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value, _ = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl, tags=()):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value, frozenset(tags))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_tags(self, tags):
+        tags = set(tags)
+        with self._lock:
+            for key in [k for k, (_, _, entry_tags) in self._data.items() if entry_tags & tags]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def _is_memory_database(uri):
+    if not uri:
+        return False
+    from sqlalchemy.engine import make_url
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def _load_backend(name):
+    if name in BACKENDS:
+        return BACKENDS[name]
+    module_name, _, class_name = name.replace(':', '.').rpartition('.')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+class Cache:
+    """Flask extension exposing the two-tier cache; see the module docstring."""
+
+    def __init__(self, app=None):
+        self.local = _LocalLRU(1024)
+        self.backend = NullBackend(None)
+        self.default_ttl = 300
+        self.local_ttl = 5
+        self.lock_timeout = 10
+        self.enabled = True
+        # Optional callable returning a prefix for every key and tag (e.g. the current tenant).
+        self.namespace = None
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_TYPE', 'sqlite')
+        app.config.setdefault('CACHE_DEFAULT_TTL', 300)
+        app.config.setdefault('CACHE_LOCAL_TTL', 5)
+        app.config.setdefault('CACHE_LOCAL_MAXSIZE', 1024)
+        app.config.setdefault('CACHE_LOCK_TIMEOUT', 10)
+        app.config.setdefault('CACHE_SQLITE_PATH', None)
+
+        backend = app.config['CACHE_TYPE']
+        if backend == 'sqlite' and _is_memory_database(app.config.get('SQLALCHEMY_DATABASE_URI')):
+            # An in-memory database lives and dies with the process; sharing its cache makes no sense.
+            backend = 'local'
+        self.enabled = backend != 'null'
+        self.backend = _load_backend(backend)(app)
+        self.local = _LocalLRU(app.config['CACHE_LOCAL_MAXSIZE'])
+        self.default_ttl = app.config['CACHE_DEFAULT_TTL']
+        self.local_ttl = app.config['CACHE_LOCAL_TTL']
+        self.lock_timeout = app.config['CACHE_LOCK_TIMEOUT']
+        app.extensions['cache'] = self
+
+    def _scoped(self, key):
+        prefix = self.namespace() if self.namespace else None
+        return f'{prefix}:{key}' if prefix else key
+
+    def get(self, key, default=None):
+        return self._get(self._scoped(key), default)
+
+    def set(self, key, value, ttl=None, tags=()):
+        self._set(self._scoped(key), value, ttl, [self._scoped(t) for t in tags])
+
+    def delete(self, key):
+        key = self._scoped(key)
+        self.local.delete(key)
+        self.backend.delete(key)
+
+    def invalidate_tags(self, *tags):
+        """Drops every entry carrying any of ``tags``. Call after the write has been committed."""
+        tags = [self._scoped(t) for t in tags]
+        self.local.invalidate_tags(tags)
+        self.backend.invalidate_tags(tags)
+
+    def clear(self):
+        """Drops every entry, in all namespaces."""
+        self.local.clear()
+        self.backend.clear()
+
+    def _get(self, key, default=None):
+        if not self.enabled:
+            return default
+        value = self.local.get(key)
+        if value is not _MISSING:
+            return value
+        value = self.backend.get(key)
+        if value is _MISSING:
+            return default
+        self.local.set(key, value, self.local_ttl)
+        return value
+
+    def _set(self, key, value, ttl, tags):
+        if not self.enabled:
+            return
+        ttl = ttl or self.default_ttl
+        self.backend.set(key, value, ttl, tags)
+        self.local.set(key, value, min(ttl, self.local_ttl), tags)
+
+    def get_or_load(self, key, loader, ttl=None, tags=(), should_cache=None):
+        """
+        Returns the cached value for ``key``, calling ``loader()`` on a miss.
+        Concurrent misses for the same key share a single ``loader()`` call.
+        """
+        if not self.enabled:
+            return loader()
+        key = self._scoped(key)
+        tags = [self._scoped(t) for t in tags]
+        value = self._get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        with self._inflight_lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+        if not leader:
+            event.wait(self.lock_timeout)
+            value = self._get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            return loader()
+
+        try:
+            return self._load_across_processes(key, loader, ttl, tags, should_cache)
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def _load_across_processes(self, key, loader, ttl, tags, should_cache):
+        lock_key = f'lock:{key}'
+        locked = self.backend.add(lock_key, 1, self.lock_timeout)
+        if not locked:
+            # Another worker is loading this key; wait for its result instead of hitting the database. If it
+            # releases the lock without storing a value (the result was not cacheable), stop waiting.
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.02)
+                released = self.backend.get(lock_key) is _MISSING
+                value = self.backend.get(key)
+                if value is not _MISSING:
+                    self.local.set(key, value, self.local_ttl, tags)
+                    return value
+                if released:
+                    break
+        try:
+            value = loader()
+            if should_cache is None or should_cache(value):
+                self._set(key, value, ttl, tags)
+            return value
+        finally:
+            if locked:
+                # Only the holder releases the lock; a waiter that gave up must not free it for a third caller.
+                self.backend.delete(lock_key)
+
+    def cached(self, key, ttl=None, tags=None):
+        """
+        Caches a Flask view's successful JSON responses.
+
+        ``key`` and ``tags`` are callables receiving the view's keyword
+        arguments; ``key`` may return None to bypass the cache for a request.
+        Stack it below ``jwt_required`` so the identity is available to them.
+        """
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                cache_key = key(**kwargs)
+                if cache_key is None:
+                    return fn(*args, **kwargs)
+
+                def load():
+                    response = make_response(fn(*args, **kwargs))
+                    return {'status': response.status_code, 'mimetype': response.mimetype,
+                            'body': response.get_data(as_text=True)}
+
+                entry = self.get_or_load(
+                    f'view:{cache_key}', load, ttl=ttl, tags=tags(**kwargs) if tags else (),
+                    should_cache=lambda entry: entry['status'] == 200,
+                )
+                return Response(entry['body'], status=entry['status'], mimetype=entry['mimetype'])
+            return wrapper
+        return decorator
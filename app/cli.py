@@ -0,0 +1,297 @@
+import json
+import os
+import subprocess
+import sys
+
+import click
+
+from .extensions import db, cache
+from .models import User
+from .tenancy import DEFAULT_TENANT
+
+
+def ensure_admin():
+    """Creates the default admin user from environment variables. Returns False if it already exists."""
+    username = os.environ.get('ADMIN_USERNAME', 'admin')
+    email = os.environ.get('ADMIN_EMAIL', 'admin@example.com')
+    password = os.environ.get('ADMIN_PASSWORD', 'adminpass')
+
+    # The default admin belongs to the default organization.
+    if User.query.filter_by(username=username, organization_id=DEFAULT_TENANT.id).first():
+        return False
+
+    user = User(username=username, email=email, role='admin', organization_id=DEFAULT_TENANT.id)
+    user.set_password(password)
+    db.session.add(user)
+    db.session.commit()
+    return True
+
+
+def _organization(slug):
+    """Looks up an organization by slug for the --organization options."""
+    from .extensions import tenancy
+    tenant = tenancy.get(slug=slug)
+    if tenant is None:
+        raise click.ClickException(f"Unknown organization '{slug}'.")
+    return tenant
+
+
+def register_commands(app):
+    """Registers the project's custom CLI commands on ``app``."""
+
+    @app.cli.command("create-admin")
+    def create_admin():
+        """Creates a default admin user from environment variables."""
+        username = os.environ.get('ADMIN_USERNAME', 'admin')
+        if ensure_admin():
+            print(f"Admin user '{username}' created successfully.")
+        else:
+            print("Admin user already exists.")
+
+    @app.cli.command("release")
+    def release():
+        """Runs every release step (migrations, default admin) in a single process."""
+        from flask_migrate import upgrade
+        upgrade()
+        print("Database upgraded.")
+        from .archive import ensure_submission_partitions
+        for name in ensure_submission_partitions():
+            print(f"Created partition {name}.")
+        if ensure_admin():
+            print("Admin user created.")
+
+    @app.cli.command("create-organization")
+    @click.argument('slug')
+    @click.argument('name')
+    @click.option('--bind-key', default=None, help='TENANT_DATABASE_URLS key of a dedicated database.')
+    @click.option('--rate-limit', default=None, help='Limit shared by all its requests, e.g. "6000 per minute".')
+    def create_organization(slug, name, bind_key, rate_limit):
+        """Creates an organization (tenant)."""
+        from .extensions import tenancy
+        from .models import Organization
+        if bind_key and bind_key not in (app.config.get('SQLALCHEMY_BINDS') or {}):
+            raise click.ClickException(f"'{bind_key}' is not configured in TENANT_DATABASE_URLS.")
+        if Organization.query.filter_by(slug=slug).first():
+            raise click.ClickException(f"Organization '{slug}' already exists.")
+        org = Organization(slug=slug, name=name, bind_key=bind_key, rate_limit=rate_limit)
+        db.session.add(org)
+        db.session.commit()
+        tenancy.invalidate()
+        print(f"Organization '{slug}' created with id {org.id}.")
+
+    @app.cli.command("purge-idempotency-keys")
+    def purge_idempotency_keys():
+        """Deletes stored idempotent responses past their TTL."""
+        from .idempotency import purge_expired_keys
+        print(f"Removed {purge_expired_keys()} expired idempotency keys.")
+
+    @app.cli.command("purge-revoked-tokens")
+    def purge_revoked_tokens():
+        """Deletes revocation entries for tokens that have expired anyway."""
+        from .tokens import purge_expired_tokens
+        print(f"Removed {purge_expired_tokens()} expired revocation entries.")
+
+    @app.cli.command("snapshot-quizzes")
+    @click.option('--organization', default='default', show_default=True, help='Organization slug.')
+    def snapshot_quizzes(organization):
+        """Takes a version snapshot of every quiz and pins unpinned attempts to it."""
+        from .models import Quiz, QuizAttempt
+        from .quiz_versions import snapshot_quiz
+        from .tenancy import use_tenant
+        with use_tenant(_organization(organization)) as tenant:
+            for quiz in Quiz.query.filter_by(organization_id=tenant.id).order_by(Quiz.id):
+                version = snapshot_quiz(quiz)
+                pinned = (
+                    QuizAttempt.query
+                    .filter_by(quiz_id=quiz.id, quiz_version_id=None)
+                    .update({'quiz_version_id': version.id}, synchronize_session=False)
+                )
+                db.session.commit()
+                print(f"Quiz {quiz.id}: version {version.id} ({version.content_hash[:12]}), pinned {pinned} attempts.")
+            cache.invalidate_tags('quizzes')
+
+    @app.cli.command("regrade")
+    @click.argument('quiz_id', type=int)
+    @click.option('--question-id', type=int, default=None, help='Only this question.')
+    @click.option('--correct-choice-ids', default=None, help='Comma-separated corrected answer key of --question-id.')
+    @click.option('--dry-run', is_flag=True, help='Only report what would change.')
+    @click.option('--organization', default='default', show_default=True, help='Organization slug.')
+    def regrade(quiz_id, question_id, correct_choice_ids, dry_run, organization):
+        """Re-scores the multiple-choice submissions of a quiz, optionally after correcting an answer key."""
+        from .grading import RegradeError, regrade_quiz
+        from .models import Quiz
+        from .tenancy import use_tenant
+        with use_tenant(_organization(organization)) as tenant:
+            quiz = db.session.get(Quiz, quiz_id)
+            if quiz is None or quiz.organization_id != tenant.id:
+                raise click.ClickException(f"Quiz {quiz_id} not found.")
+            try:
+                correct = [int(c) for c in correct_choice_ids.split(',') if c.strip()] if correct_choice_ids else None
+                report = regrade_quiz(quiz, question_id=question_id, correct_choice_ids=correct, dry_run=dry_run)
+            except (RegradeError, ValueError) as err:
+                raise click.ClickException(str(err))
+        for question in report['questions']:
+            for change in question['changes']:
+                print(f"question {question['question_id']}: {change['submissions']} submissions selecting "
+                      f"{change['selected_choice_ids'] or 'nothing'}: {change['old_score']} -> {change['new_score']}")
+        verb = 'Would change' if dry_run else 'Changed'
+        print(f"{verb} {report['submissions_changed']} submissions in {report['attempts_changed']} attempts.")
+
+    @app.cli.command("reindex-questions")
+    @click.option('--organization', default='default', show_default=True,
+                  help='Organization slug; its database is reindexed.')
+    def reindex_questions(organization):
+        """Rebuilds the question search index (SQLite only; Postgres maintains its own indexes)."""
+        from .search import rebuild_index
+        from .tenancy import use_tenant
+        with use_tenant(_organization(organization)):
+            count = rebuild_index()
+        print(f"Indexed {count} questions.")
+
+    @app.cli.command("fingerprint-submissions")
+    @click.option('--batch-size', type=int, default=500, show_default=True)
+    @click.option('--organization', default='default', show_default=True,
+                  help='Organization slug; its database is processed.')
+    def fingerprint_submissions(batch_size, organization):
+        """Fingerprints coding submissions made before similarity detection existed."""
+        from .similarity import backfill
+        from .tenancy import use_tenant
+        with use_tenant(_organization(organization)):
+            done = backfill(batch_size=batch_size, log=print)
+        print(f"Fingerprinted {done} submissions.")
+
+    @app.cli.command("rebuild-summaries")
+    @click.option('--batch-size', type=int, default=1000, show_default=True, help='Users per transaction.')
+    @click.option('--organization', default='default', show_default=True,
+                  help='Organization slug; its database is processed.')
+    def rebuild_summaries_command(batch_size, organization):
+        """Recomputes the per-user dashboard summaries from the attempt tables."""
+        from .summaries import rebuild_summaries
+        from .tenancy import use_tenant
+        with use_tenant(_organization(organization)):
+            written = rebuild_summaries(batch_size=batch_size, log=print)
+        print(f"Rebuilt {written} summaries.")
+
+    @app.cli.command("provision-users")
+    @click.argument('roster', type=click.File('r', encoding='utf-8-sig'))
+    @click.option('--dry-run', is_flag=True, help='Validate the roster without creating anyone.')
+    @click.option('--workers', type=int, default=None, help='Password hashing processes (default: CPU count).')
+    @click.option('--report', type=click.Path(dir_okay=False), default=None, help='Write the per-row report as CSV.')
+    @click.option('--organization', default='default', show_default=True, help='Organization slug.')
+    def provision_users(roster, dry_run, workers, report, organization):
+        """Creates users from a CSV roster (username, email, optional password and role)."""
+        import csv
+        from .provisioning import RosterError, read_roster, provision_users as provision
+        from .tenancy import use_tenant
+        try:
+            rows = read_roster(roster)
+        except RosterError as err:
+            raise click.ClickException(str(err))
+        with use_tenant(_organization(organization)) as tenant:
+            result = provision(rows, dry_run=dry_run, workers=workers or app.config['PROVISION_HASH_WORKERS'],
+                               organization_id=tenant.id, processes=True)
+        for entry in result['rows']:
+            if entry['status'] == 'error':
+                print(f"line {entry['line']} ({entry['username']}): {json.dumps(entry['errors'])}")
+        if report:
+            with open(report, 'w', newline='') as fh:
+                writer = csv.writer(fh)
+                writer.writerow(['line', 'username', 'status', 'errors', 'password'])
+                for entry in result['rows']:
+                    writer.writerow([entry['line'], entry['username'], entry['status'],
+                                     json.dumps(entry['errors']) if 'errors' in entry else '', entry.get('password', '')])
+        verb = 'Validated' if dry_run else 'Created'
+        print(f"{verb} {result['valid']} users, {result['errors']} rows with errors.")
+
+    @app.cli.command("archive-attempts")
+    @click.option('--older-than-days', type=int, default=180, show_default=True,
+                  help='Only attempts started more than this many days ago.')
+    @click.option('--batch-size', type=int, default=1000, show_default=True)
+    @click.option('--max-batches', type=int, default=None, help='Stop after this many batches.')
+    @click.option('--drop-empty-partitions', is_flag=True, help='Afterwards drop emptied monthly partitions (Postgres).')
+    @click.option('--organization', default='default', show_default=True,
+                  help='Organization slug; its database is processed.')
+    def archive_attempts(older_than_days, batch_size, max_batches, drop_empty_partitions, organization):
+        """Moves finalized attempts of closed quizzes, with their submissions, to the archive tables."""
+        from . import archive
+        from .tenancy import use_tenant
+        with use_tenant(_organization(organization)):
+            attempts, submissions = archive.archive_attempts(older_than_days, batch_size, max_batches, log=print)
+            print(f"Archived {attempts} attempts and {submissions} submissions.")
+            if drop_empty_partitions:
+                for name in archive.drop_empty_partitions(older_than_days):
+                    print(f"Dropped empty partition {name}.")
+
+    @app.cli.command("partition-submissions")
+    @click.option('--months-ahead', type=int, default=3, show_default=True)
+    @click.option('--organization', default='default', show_default=True,
+                  help='Organization slug; its database is processed.')
+    def partition_submissions(months_ahead, organization):
+        """Creates upcoming monthly partitions of the submission table (Postgres)."""
+        from .archive import ensure_submission_partitions
+        from .tenancy import use_tenant
+        with use_tenant(_organization(organization)):
+            created = ensure_submission_partitions(months_ahead)
+        print(f"Created {len(created)} partitions." + (f" ({', '.join(created)})" if created else ''))
+
+    @app.cli.command("export-gradebook")
+    @click.option('--quiz-id', type=int, default=None, help='Export a single quiz (one column per question).')
+    @click.option('--since', type=click.DateTime(), default=None, help='Only attempts started on/after this date.')
+    @click.option('--until', type=click.DateTime(), default=None, help='Only attempts started before this date.')
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'parquet']), default='csv')
+    @click.option('--batch-size', type=int, default=5000)
+    @click.option('--output', '-o', type=click.Path(dir_okay=False), default='-', help='Output file (default: stdout).')
+    @click.option('--organization', default='default', show_default=True, help='Organization slug.')
+    def export_gradebook(quiz_id, since, until, fmt, batch_size, output, organization):
+        """Streams a gradebook export to a file or stdout."""
+        from .gradebook import ExportError, stream_gradebook
+        from .tenancy import use_tenant
+        with use_tenant(_organization(organization)) as tenant:
+            try:
+                chunks = stream_gradebook(fmt, quiz_id=quiz_id, since=since, until=until, batch_size=batch_size,
+                                          organization_id=tenant.id, processes=True)
+            except ExportError as err:
+                raise click.ClickException(str(err))
+            # The export is a generator; it must be consumed while the organization is active.
+            with click.open_file(output, 'wb') as fh:
+                for chunk in chunks:
+                    fh.write(chunk.encode() if isinstance(chunk, str) else chunk)
+
+    @app.cli.command("startup-profile")
+    @click.option('--top', default=15, help='Number of slowest imports to show.')
+    def startup_profile(top):
+        """Measures a cold start of the web app in a fresh interpreter."""
+        script = (
+            "import json, time\n"
+            "t = time.perf_counter()\n"
+            "from app import create_app\n"
+            "app = create_app(with_cli=False)\n"
+            "profile = dict(app.extensions['startup_profile'])\n"
+            "profile['total_ms'] = round((time.perf_counter() - t) * 1000, 1)\n"
+            "print(json.dumps(profile))\n"
+        )
+        env = dict(os.environ)
+        env.pop('FLASK_RUN_FROM_CLI', None)
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', script],
+            capture_output=True, text=True, env=env, cwd=os.path.dirname(app.root_path),
+        )
+        if proc.returncode != 0:
+            raise click.ClickException(proc.stderr[-2000:])
+
+        # Lines look like "import time: <self us> | <cumulative us> | <indented module name>",
+        # with two more spaces of indentation per nesting level. Keep the first two levels.
+        imports = []
+        for line in proc.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative_us, name = line[len('import time:'):].split('|')
+            if len(name) - len(name.lstrip()) <= 3:
+                imports.append((int(cumulative_us), name.strip()))
+
+        profile = json.loads(proc.stdout.strip().splitlines()[-1])
+        for key, value in profile.items():
+            print(f"{key:<20}{value:>10} ms")
+        print("\nSlowest imports:")
+        for cumulative_us, name in sorted(imports, reverse=True)[:top]:
+            print(f"  {name:<40}{cumulative_us / 1000:>10.1f} ms")
@@ -1,3 +1,4 @@
+import json
 import os
 from datetime import timedelta
 
@@ -6,9 +7,98 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
-    JWT_ACCESS_TOKEN_EXPIRES = timedelta(days=7)
+    # Access tokens are short-lived; clients renew them at /api/auth/refresh with a rotating refresh token.
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=int(os.environ.get('JWT_ACCESS_TOKEN_MINUTES', 15)))
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=int(os.environ.get('JWT_REFRESH_TOKEN_DAYS', 14)))
+    # Revocation list (see app/tokens.py): how often workers pick up revocations made elsewhere
+    REVOCATION_SYNC_SECONDS = float(os.environ.get('REVOCATION_SYNC_SECONDS', 5))
+    REVOCATION_BLOOM_CAPACITY = int(os.environ.get('REVOCATION_BLOOM_CAPACITY', 100000))
     RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL', 'memory://')
     RATELIMIT_DEFAULT = "200 per day;50 per hour"
+    # How long responses to requests with an Idempotency-Key header are kept for replay
+    IDEMPOTENCY_KEY_TTL_HOURS = float(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+    # A key claimed by a request that never finished (e.g. its worker was killed) is freed after this long;
+    # keep it above the gunicorn timeout (see gunicorn.conf.py)
+    IDEMPOTENCY_CLAIM_LEASE_SECONDS = float(os.environ.get('IDEMPOTENCY_CLAIM_LEASE_SECONDS', 120))
+    # Secret mixed into per-attempt question sampling/shuffling; changing it reshuffles open attempts.
+    ATTEMPT_SHUFFLE_SEED = os.environ.get('ATTEMPT_SHUFFLE_SEED', os.environ.get('SECRET_KEY', ''))
+    # Performance instrumentation (see app/instrumentation.py)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    # Bearer token required by /api/metrics; unset leaves the endpoint open (set it wherever the API is public)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 500))
+    SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', 100))
+    SERVER_TIMING_HEADER = os.environ.get('SERVER_TIMING_HEADER', 'true').lower() == 'true'
+    # Structured JSON request/event log (see app/request_log.py); an empty path means stderr, '-' stdout
+    REQUEST_LOG_ENABLED = os.environ.get('REQUEST_LOG_ENABLED', 'true').lower() == 'true'
+    REQUEST_LOG_PATH = os.environ.get('REQUEST_LOG_PATH', '')
+    REQUEST_LOG_LEVEL = os.environ.get('REQUEST_LOG_LEVEL', 'INFO')
+    REQUEST_LOG_SAMPLE_RATE = float(os.environ.get('REQUEST_LOG_SAMPLE_RATE', 1.0))
+    # Fraction of successful, fast requests logged per endpoint; failed and slow ones are always logged
+    REQUEST_LOG_SAMPLING = json.loads(os.environ.get('REQUEST_LOG_SAMPLING') or json.dumps({
+        'api.submission.get_attempt': 0.05,
+        'api.health.health': 0.01,
+        'api.health.readiness': 0.01,
+        'api.metrics.metrics': 0.01,
+    }))
+    REQUEST_LOG_QUEUE_SIZE = int(os.environ.get('REQUEST_LOG_QUEUE_SIZE', 10000))
+    # Admission control (see app/admission.py): requests each worker serves at once, and how they are shed
+    ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true').lower() == 'true'
+    ADMISSION_MAX_CONCURRENT = int(os.environ.get('ADMISSION_MAX_CONCURRENT', 16))
+    # Priority class per endpoint (critical, high, normal, low; null exempts it); others are normal
+    ADMISSION_PRIORITIES = json.loads(os.environ.get('ADMISSION_PRIORITIES') or json.dumps({
+        'api.submission.submit_answers': 'critical',
+        'api.auth.refresh': 'critical',
+        'api.submission.start_quiz': 'high',
+        'api.quiz.get_quiz': 'high',
+        'api.auth.login': 'high',
+        'api.submission.get_attempt': 'low',
+        'api.quiz.list_quizzes': 'low',
+        'api.submission.get_my_submissions': 'low',
+        'api.submission.get_dashboard': 'low',
+        'api.health.health': None,
+        'api.health.readiness': None,
+        'api.metrics.metrics': None,
+    }))
+    # Fraction of ADMISSION_MAX_CONCURRENT each class may fill
+    ADMISSION_CLASS_SHARES = json.loads(os.environ.get('ADMISSION_CLASS_SHARES') or json.dumps({
+        'critical': 1.0, 'high': 0.85, 'normal': 0.7, 'low': 0.5,
+    }))
+    # Concurrent requests allowed per endpoint, for ones that hold a connection for long
+    ADMISSION_ENDPOINT_LIMITS = json.loads(os.environ.get('ADMISSION_ENDPOINT_LIMITS') or json.dumps({
+        'api.admin.export_gradebook': 2,
+        'api.admin.bulk_provision_users': 1,
+        'api.admin.regrade': 1,
+    }))
+    # Requests older than this (per class, from the router's X-Request-Start header) are shed unserved
+    ADMISSION_MAX_QUEUE_MS = json.loads(os.environ.get('ADMISSION_MAX_QUEUE_MS') or json.dumps({
+        'high': 15000, 'normal': 10000, 'low': 3000,
+    }))
+    ADMISSION_CRITICAL_WAIT_MS = int(os.environ.get('ADMISSION_CRITICAL_WAIT_MS', 2000))
+    ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 2))
+    # Spreads rejected quiz starts over this many seconds (0 turns it off)
+    ADMISSION_START_WINDOW_SECONDS = int(os.environ.get('ADMISSION_START_WINDOW_SECONDS', 0))
+    # Readiness probe (/api/health/ready)
+    HEALTH_CACHE_SECONDS = float(os.environ.get('HEALTH_CACHE_SECONDS', 2))
+    HEALTH_DB_LATENCY_WARN_MS = float(os.environ.get('HEALTH_DB_LATENCY_WARN_MS', 250))
+    HEALTH_POOL_SATURATION_WARN = float(os.environ.get('HEALTH_POOL_SATURATION_WARN', 0.8))
+    HEALTH_FAIL_ON_DEGRADED = os.environ.get('HEALTH_FAIL_ON_DEGRADED', 'false').lower() == 'true'
+    # Organizations with a database of their own: {"bind key": "database url", ...} (see app/tenancy.py)
+    SQLALCHEMY_BINDS = json.loads(os.environ.get('TENANT_DATABASE_URLS') or '{}')
+    # Default request budget per organization, e.g. "6000 per minute"; Organization.rate_limit overrides it
+    TENANT_RATE_LIMIT = os.environ.get('TENANT_RATE_LIMIT')
+    # Bulk user provisioning (see app/provisioning.py); workers default to the CPU count
+    PROVISION_MAX_ROWS = int(os.environ.get('PROVISION_MAX_ROWS', 5000))
+    PROVISION_HASH_WORKERS = int(os.environ['PROVISION_HASH_WORKERS']) if os.environ.get('PROVISION_HASH_WORKERS') else None
+    # Coding submissions at least this similar (Jaccard index of fingerprints) are clustered (see app/similarity.py)
+    SIMILARITY_THRESHOLD = float(os.environ.get('SIMILARITY_THRESHOLD', 0.8))
+    # Response/data cache (see app/cache.py). CACHE_TYPE is null, local, sqlite or a dotted backend class path.
+    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'sqlite')
+    CACHE_SQLITE_PATH = os.environ.get('CACHE_SQLITE_PATH')
+    CACHE_DEFAULT_TTL = int(os.environ.get('CACHE_DEFAULT_TTL', 300))
+    CACHE_LOCAL_TTL = int(os.environ.get('CACHE_LOCAL_TTL', 5))
+    CACHE_LOCAL_MAXSIZE = int(os.environ.get('CACHE_LOCAL_MAXSIZE', 1024))
+    CACHE_LOCK_TIMEOUT = float(os.environ.get('CACHE_LOCK_TIMEOUT', 10))
 
 class DevelopmentConfig(Config):
     """Development configuration."""
@@ -23,8 +113,26 @@ class ProductionConfig(Config):
     # --- END OF CHANGE ---
     RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL')
 
+class BenchmarkConfig(Config):
+    """Configuration used by the benchmark harness in bench/."""
+    SQLALCHEMY_DATABASE_URI = os.environ.get('BENCH_DATABASE_URL', 'sqlite:///bench.db')
+    # Concurrent submits queue on SQLite's single writer lock; wait instead of failing.
+    SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 30}} if SQLALCHEMY_DATABASE_URI.startswith('sqlite') else {}
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'bench-secret-key')
+    JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'bench-jwt-secret-key-that-is-long-enough')
+    RATELIMIT_ENABLED = False
+    RATELIMIT_STORAGE_URL = 'memory://'
+    # The harness measures every request itself; don't flood the log with warnings.
+    SLOW_REQUEST_MS = 60_000
+    SLOW_QUERY_MS = 60_000
+    # Request logging stays on so its cost is measured, but the output is discarded.
+    REQUEST_LOG_PATH = os.devnull
+    # Admission control runs so its cost is measured, but never sheds the harness's load.
+    ADMISSION_MAX_CONCURRENT = 10_000
+
 config_by_name = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
+    'benchmark': BenchmarkConfig,
     'default': DevelopmentConfig
 }
\ No newline at end of file
@@ -1,11 +1,30 @@
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
+from flask_limiter import ApplicationLimit, Limiter
 
+from .admission import AdmissionControl
+from .cache import Cache
+from .instrumentation import Metrics
+from .request_log import RequestLog
+from .tenancy import Tenancy, TenantSession, client_key, organization_key, organization_rate_limit
 
-db = SQLAlchemy()
-migrate = Migrate()
+
+db = SQLAlchemy(session_options={'class_': TenantSession})
 jwt = JWTManager()
-limiter = Limiter(key_func=get_remote_address)
\ No newline at end of file
+limiter = Limiter(
+    key_func=client_key,
+    # One budget shared by all requests of an organization, if it (or TENANT_RATE_LIMIT) sets one
+    application_limits=[ApplicationLimit(organization_rate_limit, key_function=organization_key, scope='organization')],
+)
+metrics = Metrics()
+admission = AdmissionControl()
+request_log = RequestLog()
+cache = Cache()
+tenancy = Tenancy()
+
+
+def init_migrate(app):
+    """Sets up Flask-Migrate. Alembic is slow to import, so only CLI processes load it."""
+    from flask_migrate import Migrate
+    from .search import include_name
+    Migrate(app, db, include_name=include_name)
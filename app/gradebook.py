@@ -0,0 +1,191 @@
+"""
+Streaming gradebook export.
+
+Attempts are read joined with their submissions in a single query executed
+with ``yield_per`` (a server-side cursor on Postgres), grouped on the fly and
+written out batch by batch, so memory stays flat however many attempts match.
+Attempts moved to the archive tables (app/archive.py) are exported alongside
+the live ones.
+
+For a single quiz the gradebook is wide: one row per attempt and one score
+column per question. Without a quiz filter it is long: one row per attempt and
+question, and one row with empty question columns for an attempt without
+submissions, so both layouts list the same attempts.
+"""
+
+import csv
+import io
+
+from sqlalchemy import select, union_all
+
+from .extensions import db
+from .models import Question, QuizAttempt, QuizAttemptArchive, Submission, SubmissionArchive, User
+
+ATTEMPT_COLUMNS = ['attempt_id', 'user_id', 'username', 'quiz_id', 'status', 'start_time', 'end_time', 'final_score']
+LONG_COLUMNS = ATTEMPT_COLUMNS + ['question_id', 'score', 'graded']
+
+FORMATS = ('csv', 'parquet')
+
+
+class ExportError(Exception):
+    pass
+
+
+def gradebook_columns(quiz_id=None):
+    """Returns the column names and, for a single quiz, the ordered question ids."""
+    if quiz_id is None:
+        return LONG_COLUMNS, None
+    question_ids = [qid for (qid,) in db.session.query(Question.id).filter_by(quiz_id=quiz_id).order_by(Question.id)]
+    return ATTEMPT_COLUMNS + [f'q_{qid}' for qid in question_ids], question_ids
+
+
+def _attempts_select(attempts, submissions, quiz_id, since, until, organization_id):
+    stmt = (
+        select(
+            attempts.id.label('attempt_id'), attempts.user_id, User.username, attempts.quiz_id, attempts.status,
+            attempts.start_time, attempts.end_time, attempts.final_score,
+            submissions.question_id, submissions.score, submissions.graded,
+        )
+        .join(User, User.id == attempts.user_id)
+        .outerjoin(submissions, submissions.attempt_id == attempts.id)
+    )
+    if quiz_id is not None:
+        stmt = stmt.where(attempts.quiz_id == quiz_id)
+    if organization_id is not None:
+        # Archived attempts carry no organization of their own; theirs is their user's.
+        organization = getattr(attempts, 'organization_id', User.organization_id)
+        stmt = stmt.where(organization == organization_id)
+    if since is not None:
+        stmt = stmt.where(attempts.start_time >= since)
+    if until is not None:
+        stmt = stmt.where(attempts.start_time < until)
+    return stmt
+
+
+def _rows_query(quiz_id, since, until, organization_id=None):
+    """Live and archived attempts with their submissions, ordered by attempt. Archived rows keep their ids."""
+    stmt = union_all(
+        _attempts_select(QuizAttempt, Submission, quiz_id, since, until, organization_id),
+        _attempts_select(QuizAttemptArchive, SubmissionArchive, quiz_id, since, until, organization_id),
+    )
+    return stmt.order_by(stmt.selected_columns.attempt_id, stmt.selected_columns.question_id)
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def iter_gradebook_batches(quiz_id=None, since=None, until=None, batch_size=1000, organization_id=None):
+    """Yields lists of at most ``batch_size`` gradebook rows (tuples in column order)."""
+    _, question_ids = gradebook_columns(quiz_id)
+    stmt = _rows_query(quiz_id, since, until, organization_id).execution_options(yield_per=batch_size)
+    result = db.session.execute(stmt)
+
+    batch = []
+    if question_ids is None:
+        for row in result:
+            # Attempts without submissions (expired, in progress) get one row with empty question columns.
+            batch.append((row[0], row[1], row[2], row[3], row[4], _iso(row[5]), _iso(row[6]), row[7],
+                          row.question_id, row.score, row.graded))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    else:
+        position = {qid: i for i, qid in enumerate(question_ids)}
+        current_id, current = None, None
+        for row in result:
+            if row[0] != current_id:
+                if current is not None:
+                    batch.append(tuple(current))
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+                current_id = row[0]
+                current = [row[0], row[1], row[2], row[3], row[4], _iso(row[5]), _iso(row[6]), row[7]]
+                current.extend([None] * len(question_ids))
+            if row.question_id in position:
+                current[len(ATTEMPT_COLUMNS) + position[row.question_id]] = row.score
+        if current is not None:
+            batch.append(tuple(current))
+    if batch:
+        yield batch
+
+
+def stream_csv(quiz_id=None, since=None, until=None, batch_size=1000, organization_id=None):
+    """Yields the gradebook as CSV text, one chunk per batch."""
+    columns, _ = gradebook_columns(quiz_id)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for batch in iter_gradebook_batches(quiz_id, since, until, batch_size, organization_id):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue()
+
+
+class _DrainableSink(io.RawIOBase):
+    """A write-only file object whose contents can be taken out between writes."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def stream_parquet(quiz_id=None, since=None, until=None, batch_size=1000, organization_id=None):
+    """Yields the gradebook as a Parquet file, one row group per batch. Requires pyarrow."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError('Parquet export requires the optional pyarrow package.')
+
+    columns, question_ids = gradebook_columns(quiz_id)
+    fields = [
+        ('attempt_id', pa.int64()), ('user_id', pa.int64()), ('username', pa.string()), ('quiz_id', pa.int64()),
+        ('status', pa.string()), ('start_time', pa.string()), ('end_time', pa.string()),
+        ('final_score', pa.float64()),
+    ]
+    if question_ids is None:
+        fields += [('question_id', pa.int64()), ('score', pa.float64()), ('graded', pa.bool_())]
+    else:
+        fields += [(name, pa.float64()) for name in columns[len(ATTEMPT_COLUMNS):]]
+    schema = pa.schema(fields)
+
+    sink = _DrainableSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for batch in iter_gradebook_batches(quiz_id, since, until, batch_size, organization_id):
+            arrays = [pa.array(list(values), type=field.type) for values, field in zip(zip(*batch), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def stream_gradebook(fmt, quiz_id=None, since=None, until=None, batch_size=1000, organization_id=None):
+    if fmt == 'csv':
+        return stream_csv(quiz_id, since, until, batch_size, organization_id)
+    if fmt == 'parquet':
+        if not parquet_available():
+            raise ExportError('Parquet export requires the optional pyarrow package.')
+        return stream_parquet(quiz_id, since, until, batch_size, organization_id)
+    raise ExportError(f'format must be one of {", ".join(FORMATS)}.')
@@ -0,0 +1,282 @@
+"""
+Scoring of multiple-choice answers, and bulk regrading.
+
+``grade_question_auto`` is the one implementation of the MCQ/MSQ rules; submit
+calls it per answer. A question's score depends only on the selected choices,
+so the regrade engine scores each distinct ``selected_choice_ids`` value of a
+question once, with the same function, and writes the results back with one
+UPDATE ... CASE statement per question. Final scores of the affected attempts
+are then recomputed in SQL from their submissions. Nothing is loaded row by
+row, so correcting an answer key on a quiz with tens of thousands of attempts
+takes a handful of statements. Archived attempts are regraded alongside the
+live ones.
+
+Coding answers are graded by hand; ``grade_submissions`` applies one score to
+any number of them at once (e.g. to a cluster of identical solutions, see
+app/similarity.py) and completes the attempts left with nothing to grade.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import and_, case, exists, func, or_, select, update
+
+from .extensions import cache, db
+from .models import Choice, QuizAttempt, QuizAttemptArchive, Submission, SubmissionArchive
+from .quiz_versions import ChoiceView, current_version, snapshot_quiz
+from .summaries import refresh_summaries
+
+AUTO_GRADED = ('mcq', 'msq')
+# Selections per UPDATE ... CASE statement; a question rarely has more distinct ones.
+CASE_CHUNK = 500
+TAG_CHUNK = 1000
+ATTEMPT_CHUNK = 1000
+
+_TABLES = ((Submission, QuizAttempt), (SubmissionArchive, QuizAttemptArchive))
+
+
+class RegradeError(Exception):
+    pass
+
+
+def grade_question_auto(question, selected_choice_ids):
+    """
+    Automatically grades a multiple-choice or multiple-select question.
+    Accepts a Question row or a QuestionView from a quiz version snapshot.
+    """
+    if question.qtype not in AUTO_GRADED:
+        return 0.0
+
+    correct_choices = [c.id for c in question.choices if c.is_correct]
+    all_choice_ids = [c.id for c in question.choices]
+
+    # Ensure selected_choice_ids is a list of integers if provided
+    try:
+        selected_ids = [int(i) for i in selected_choice_ids] if selected_choice_ids else []
+    except (ValueError, TypeError):
+        selected_ids = []
+
+    selected_set = set(selected_ids)
+    correct_set = set(correct_choices)
+
+    correct_selected = len(selected_set & correct_set)
+    wrong_selected = len(selected_set - correct_set)
+    total_correct = len(correct_set)
+    total_choices = len(all_choice_ids) if all_choice_ids else 1
+
+    if question.qtype == 'mcq':
+        # For MCQ, score is all or nothing
+        return float(question.points) if selected_set == correct_set else 0.0
+
+    if total_correct == 0:
+        # If there are no correct answers, score is full if nothing is selected
+        return float(question.points) if len(selected_set) == 0 else 0.0
+
+    # For MSQ, apply partial scoring with a penalty for incorrect selections
+    raw_score = (correct_selected / total_correct) - (wrong_selected / total_choices)
+    score = max(0.0, raw_score)
+
+    return round(score * question.points, 3)
+
+
+def attempts_tag(user_id):
+    """Cache tag carried by every cached view of a user's attempts."""
+    return f'user:{user_id}:attempts'
+
+
+def _invalidate_attempts(user_ids):
+    tags = [attempts_tag(user_id) for user_id in sorted(user_ids)]
+    for start in range(0, len(tags), TAG_CHUNK):
+        cache.invalidate_tags(*tags[start:start + TAG_CHUNK])
+
+
+def grade_submissions(submissions, score, feedback=''):
+    """
+    Manually grades ``submissions`` (Submission rows) with the same score and
+    feedback, and commits. Attempts left without ungraded submissions get
+    their final score, the sum of their submission scores, and the 'graded'
+    status. Returns the number of attempts completed.
+    """
+    now = datetime.utcnow()
+    for submission in submissions:
+        submission.score = float(score)
+        submission.feedback = feedback
+        submission.graded = True
+        submission.graded_at = now
+    db.session.flush()
+
+    attempt_ids = sorted({s.attempt_id for s in submissions})
+    pending = exists().where(Submission.attempt_id == QuizAttempt.id, Submission.graded.is_(False))
+    total = (
+        select(func.coalesce(func.sum(Submission.score), 0.0))
+        .where(Submission.attempt_id == QuizAttempt.id)
+        .scalar_subquery()
+    )
+    completed = 0
+    for start in range(0, len(attempt_ids), ATTEMPT_CHUNK):
+        completed += db.session.execute(
+            update(QuizAttempt)
+            .where(QuizAttempt.id.in_(attempt_ids[start:start + ATTEMPT_CHUNK]), ~pending)
+            .values(final_score=total, status='graded')
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+    pairs = {(s.user_id, s.quiz_id) for s in submissions if s.quiz_id is not None}
+    # Older submissions have no quiz_id; their attempt has it.
+    unknown = sorted({s.attempt_id for s in submissions if s.quiz_id is None})
+    for start in range(0, len(unknown), ATTEMPT_CHUNK):
+        pairs.update(db.session.execute(
+            select(QuizAttempt.user_id, QuizAttempt.quiz_id)
+            .where(QuizAttempt.id.in_(unknown[start:start + ATTEMPT_CHUNK]))).tuples())
+    refresh_summaries(pairs)
+    db.session.commit()
+    _invalidate_attempts({s.user_id for s in submissions})
+    return completed
+
+
+def _score_stored(question, selected):
+    """Scores a stored selected_choice_ids value ('' for none) like submit scored the original list."""
+    return grade_question_auto(question, selected.split(',') if selected else [])
+
+
+def _selection(submission_model):
+    return func.coalesce(submission_model.selected_choice_ids, '')
+
+
+def _changes(question, submission_model):
+    """Returns ``{selection: new score}`` for the selections whose stored score differs, and the diff rows."""
+    selection = _selection(submission_model)
+    groups = db.session.execute(
+        select(selection, submission_model.score, func.count())
+        .where(submission_model.question_id == question.id)
+        .group_by(selection, submission_model.score)
+    ).all()
+    new_scores, diff = {}, []
+    for selected, old, count in groups:
+        new = _score_stored(question, selected)
+        if old is None or abs(old - new) > 1e-9:
+            new_scores[selected] = new
+            diff.append({'selected_choice_ids': selected or None, 'old_score': old, 'new_score': new,
+                         'submissions': count})
+    return new_scores, diff
+
+
+def _write_scores(question, submission_model, new_scores):
+    selection = _selection(submission_model)
+    keys = list(new_scores)
+    for start in range(0, len(keys), CASE_CHUNK):
+        chunk = keys[start:start + CASE_CHUNK]
+        db.session.execute(
+            update(submission_model)
+            .where(submission_model.question_id == question.id, selection.in_(chunk))
+            .values(score=case({k: new_scores[k] for k in chunk}, value=selection))
+            .execution_options(synchronize_session=False)
+        )
+
+
+def _recompute_final_scores(submission_model, attempt_model, touched):
+    """Sets the final score of the ``touched`` attempts (a select of ids) to the sum of their submission scores."""
+    total = (
+        select(func.coalesce(func.sum(submission_model.score), 0.0))
+        .where(submission_model.attempt_id == attempt_model.id)
+        .scalar_subquery()
+    )
+    return db.session.execute(
+        update(attempt_model).where(attempt_model.id.in_(touched)).values(final_score=total)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def _corrected(question, correct_choice_ids):
+    choice_ids = {c.id for c in question.choices}
+    unknown = set(correct_choice_ids) - choice_ids
+    if unknown:
+        raise RegradeError(f'Choices {sorted(unknown)} do not belong to question {question.id}.')
+    if question.qtype == 'mcq' and len(correct_choice_ids) != 1:
+        raise RegradeError('A multiple-choice question needs exactly one correct choice.')
+    return question._replace(choices=tuple(ChoiceView(c.id, c.id in correct_choice_ids) for c in question.choices))
+
+
+def regrade_quiz(quiz, question_id=None, correct_choice_ids=None, dry_run=False):
+    """
+    Re-scores the MCQ/MSQ submissions of ``quiz`` (or of one of its questions)
+    against its current answer key, updating submission and final scores.
+
+    ``correct_choice_ids`` corrects the key of ``question_id`` first: the
+    choices are updated, a new quiz version is snapshotted, and the regraded
+    attempts, along with every attempt still on the old version, are pinned to it. With ``dry_run`` nothing is written and the
+    returned report only lists what would change. Commits unless ``dry_run``.
+    """
+    snapshot = current_version(quiz)
+    if snapshot is None:
+        raise RegradeError(f'The current version of quiz {quiz.id} does not exist.')
+    questions = [q for q in snapshot.questions.values() if q.qtype in AUTO_GRADED]
+    if question_id is not None:
+        questions = [q for q in questions if q.id == question_id]
+        if not questions:
+            raise RegradeError(f'Question {question_id} is not an automatically graded question of quiz {quiz.id}.')
+    elif correct_choice_ids is not None:
+        raise RegradeError('Correcting an answer key requires a question id.')
+
+    version_id = None
+    if correct_choice_ids is not None:
+        correct_choice_ids = {int(c) for c in correct_choice_ids}
+        questions = [_corrected(questions[0], correct_choice_ids)]
+        if not dry_run:
+            for choice in Choice.query.filter_by(question_id=question_id):
+                choice.is_correct = choice.id in correct_choice_ids
+            version_id = snapshot_quiz(quiz).id
+
+    report = {'quiz_id': quiz.id, 'dry_run': dry_run, 'version_id': version_id or snapshot.id,
+              'questions': [{'question_id': q.id, 'changes': []} for q in questions],
+              'submissions_changed': 0, 'attempts_changed': 0}
+    users = set()
+    repinned = []
+    for submission_model, attempt_model in _TABLES:
+        selection = _selection(submission_model)
+        changed = []
+        for question, entry in zip(questions, report['questions']):
+            new_scores, diff = _changes(question, submission_model)
+            entry['changes'].extend(diff)
+            report['submissions_changed'] += sum(d['submissions'] for d in diff)
+            if new_scores:
+                changed.append(and_(submission_model.question_id == question.id, selection.in_(list(new_scores))))
+                if not dry_run:
+                    _write_scores(question, submission_model, new_scores)
+
+        if version_id is not None:
+            # Attempts that answered the corrected question, and every attempt still on the old version
+            # (including those in progress, which will be graded at submit), move to the new version.
+            repin = and_(attempt_model.quiz_id == quiz.id, or_(
+                attempt_model.quiz_version_id == snapshot.id,
+                attempt_model.id.in_(select(submission_model.attempt_id)
+                                     .where(submission_model.question_id == question_id)),
+            ))
+            repinned.extend(db.session.execute(select(attempt_model.id).where(repin)).scalars())
+            db.session.execute(
+                update(attempt_model)
+                .where(repin)
+                .values(quiz_version_id=version_id)
+                .execution_options(synchronize_session=False)
+            )
+        if not changed:
+            continue
+        touched = select(submission_model.attempt_id).where(or_(*changed))
+        if dry_run:
+            report['attempts_changed'] += db.session.execute(
+                select(func.count()).select_from(touched.distinct().subquery())).scalar()
+        else:
+            report['attempts_changed'] += _recompute_final_scores(submission_model, attempt_model, touched)
+            users.update(db.session.execute(
+                select(attempt_model.user_id).where(attempt_model.id.in_(touched)).distinct()).scalars())
+
+    if dry_run:
+        db.session.rollback()
+        return report
+    refresh_summaries((user_id, quiz.id) for user_id in users)
+    db.session.commit()
+    cache.invalidate_tags('quizzes', f'quiz:{quiz.id}')
+    _invalidate_attempts(users)
+    # Cached attempt states name the version an attempt is pinned to.
+    from .attempt_state import forget_states  # attempt_state imports this module
+    forget_states(repinned)
+    return report
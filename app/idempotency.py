@@ -0,0 +1,121 @@
+import hashlib
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import Response, current_app, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy.exc import IntegrityError
+
+from .extensions import db
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def _request_fingerprint():
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.path.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _replay(record):
+    response = Response(record.response_body, status=record.status_code, mimetype='application/json')
+    response.headers[IDEMPOTENCY_HEADER] = record.key
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _take_over(record, now):
+    """
+    Claims a key whose original request has held it for longer than the lease
+    (its worker was most likely killed mid-request). A conditional UPDATE, so
+    only one of several concurrent retries wins. Returns True if this one did.
+    """
+    stale = now - timedelta(seconds=current_app.config['IDEMPOTENCY_CLAIM_LEASE_SECONDS'])
+    taken = (
+        IdempotencyKey.query
+        .filter(IdempotencyKey.id == record.id, IdempotencyKey.status_code.is_(None),
+                IdempotencyKey.claimed_at < stale)
+        .update({'claimed_at': now}, synchronize_session=False)
+    )
+    db.session.commit()
+    return taken == 1
+
+
+def idempotent(fn):
+    """
+    Makes a JWT-protected endpoint safe to retry. When the client sends an
+    ``Idempotency-Key`` header, the first response is stored for
+    IDEMPOTENCY_KEY_TTL_HOURS and replayed for any retry with the same key and
+    body. A retry that arrives while the original is still running gets a 409,
+    unless the original has held the key for IDEMPOTENCY_CLAIM_LEASE_SECONDS,
+    in which case the retry takes the key over and runs.
+    Requests without the header are passed through unchanged.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return fn(*args, **kwargs)
+        if len(key) > 128:
+            return jsonify({'msg': f'{IDEMPOTENCY_HEADER} must be at most 128 characters.'}), 400
+
+        user_id = int(get_jwt_identity())
+        fingerprint = _request_fingerprint()
+        now = datetime.utcnow()
+
+        record = IdempotencyKey.query.filter_by(user_id=user_id, key=key).first()
+        if record and record.expires_at <= now:
+            db.session.delete(record)
+            db.session.commit()
+            record = None
+        if record:
+            if record.request_hash != fingerprint:
+                return jsonify({'msg': f'{IDEMPOTENCY_HEADER} was already used for a different request.'}), 422
+            if record.status_code is not None:
+                return _replay(record)
+            if not _take_over(record, now):
+                return jsonify({'msg': 'A request with this idempotency key is still being processed.'}), 409
+            record_id = record.id
+        else:
+            # Claim the key before doing any work; the unique constraint settles concurrent retries.
+            ttl = timedelta(hours=current_app.config['IDEMPOTENCY_KEY_TTL_HOURS'])
+            record = IdempotencyKey(user_id=user_id, key=key, request_hash=fingerprint, expires_at=now + ttl,
+                                    claimed_at=now)
+            db.session.add(record)
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                return jsonify({'msg': 'A request with this idempotency key is still being processed.'}), 409
+            record_id = record.id
+
+        try:
+            response = make_response(fn(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            IdempotencyKey.query.filter_by(id=record_id).delete()
+            db.session.commit()
+            raise
+
+        if response.status_code >= 500:
+            # Server errors are not final; let the client retry with the same key.
+            IdempotencyKey.query.filter_by(id=record_id).delete()
+        else:
+            IdempotencyKey.query.filter_by(id=record_id).update({
+                'status_code': response.status_code,
+                'response_body': response.get_data(as_text=True),
+            })
+        db.session.commit()
+        response.headers[IDEMPOTENCY_HEADER] = key
+        return response
+    return wrapper
+
+
+def purge_expired_keys():
+    """Deletes stored responses past their TTL. Returns the number of rows removed."""
+    removed = IdempotencyKey.query.filter(IdempotencyKey.expires_at <= datetime.utcnow()).delete()
+    db.session.commit()
+    return removed
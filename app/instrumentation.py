@@ -0,0 +1,213 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (in seconds) of the latency histogram buckets.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Histogram:
+    """A cumulative Prometheus-style histogram."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class Metrics:
+    """
+    Per-request performance instrumentation.
+
+    Records per-endpoint latency histograms and SQL query count/time per
+    request, logs slow requests and slow statements, and adds a
+    ``Server-Timing`` header to every response. Metrics are kept per process,
+    so under gunicorn each worker exposes its own series.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._requests = defaultdict(int)
+        self._queries = defaultdict(int)
+        self._query_seconds = defaultdict(float)
+        self._slow_requests = defaultdict(int)
+        self._slow_queries = 0
+        self.buckets = DEFAULT_BUCKETS
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('SLOW_REQUEST_MS', 500)
+        app.config.setdefault('SLOW_QUERY_MS', 100)
+        app.config.setdefault('SERVER_TIMING_HEADER', True)
+        app.extensions['metrics'] = self
+
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        # Listening on the Engine class covers every engine (and bind) the app creates.
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        # after_request is skipped when an exception escapes the view (or a later after_request hook);
+        # teardown always runs, so such requests are still counted, as 500s.
+        app.teardown_request(self._teardown_request)
+
+    def _start_request(self):
+        g.perf = {'start': time.perf_counter(), 'queries': 0, 'query_seconds': 0.0}
+
+    def _record(self, perf, status):
+        """Observes the current request once, with ``status``; returns its elapsed time."""
+        elapsed = time.perf_counter() - perf['start']
+        perf['elapsed'] = elapsed
+        perf['recorded'] = True
+        endpoint = request.endpoint or 'unmatched'
+        self.observe(endpoint, request.method, status, elapsed, perf['queries'], perf['query_seconds'])
+
+        if elapsed * 1000 >= current_app.config['SLOW_REQUEST_MS']:
+            with self._lock:
+                self._slow_requests[endpoint] += 1
+            logger.warning(
+                'Slow request: %s %s (%s) took %.1f ms with %d queries (%.1f ms in SQL)',
+                request.method, request.path, endpoint, elapsed * 1000,
+                perf['queries'], perf['query_seconds'] * 1000,
+            )
+        return elapsed
+
+    def _finish_request(self, response):
+        perf = g.get('perf')
+        if perf is None:
+            return response
+
+        elapsed = self._record(perf, response.status_code)
+        if current_app.config['SERVER_TIMING_HEADER']:
+            response.headers.add(
+                'Server-Timing',
+                f'app;dur={elapsed * 1000:.1f}, '
+                f'db;dur={perf["query_seconds"] * 1000:.1f};desc="{perf["queries"]} queries"',
+            )
+        return response
+
+    def _teardown_request(self, exc):
+        perf = g.get('perf')
+        if perf is not None and not perf.get('recorded'):
+            self._record(perf, 500)
+
+    def observe(self, endpoint, method, status, elapsed, queries, query_seconds):
+        """Records a finished request."""
+        with self._lock:
+            hist = self._latency.get(endpoint)
+            if hist is None:
+                hist = self._latency[endpoint] = _Histogram(self.buckets)
+            hist.observe(elapsed)
+            self._requests[(endpoint, method, status)] += 1
+            self._queries[endpoint] += queries
+            self._query_seconds[endpoint] += query_seconds
+
+    def record_slow_query(self):
+        with self._lock:
+            self._slow_queries += 1
+
+    def render_prometheus(self):
+        """Returns all collected series in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            lines.append('# HELP quiz_http_requests_total Total HTTP requests by endpoint, method and status.')
+            lines.append('# TYPE quiz_http_requests_total counter')
+            for (endpoint, method, status), count in sorted(self._requests.items()):
+                lines.append(
+                    f'quiz_http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}'
+                )
+
+            lines.append('# HELP quiz_http_request_duration_seconds Request latency by endpoint.')
+            lines.append('# TYPE quiz_http_request_duration_seconds histogram')
+            for endpoint, hist in sorted(self._latency.items()):
+                for bound, count in zip(hist.buckets, hist.counts):
+                    lines.append(
+                        f'quiz_http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}'
+                    )
+                lines.append(
+                    f'quiz_http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {hist.count}'
+                )
+                lines.append(f'quiz_http_request_duration_seconds_sum{{endpoint="{endpoint}"}} {hist.sum:.6f}')
+                lines.append(f'quiz_http_request_duration_seconds_count{{endpoint="{endpoint}"}} {hist.count}')
+
+            lines.append('# HELP quiz_db_queries_total SQL statements executed, by endpoint.')
+            lines.append('# TYPE quiz_db_queries_total counter')
+            for endpoint, count in sorted(self._queries.items()):
+                lines.append(f'quiz_db_queries_total{{endpoint="{endpoint}"}} {count}')
+
+            lines.append('# HELP quiz_db_query_seconds_total Time spent in SQL, by endpoint.')
+            lines.append('# TYPE quiz_db_query_seconds_total counter')
+            for endpoint, seconds in sorted(self._query_seconds.items()):
+                lines.append(f'quiz_db_query_seconds_total{{endpoint="{endpoint}"}} {seconds:.6f}')
+
+            lines.append('# HELP quiz_slow_requests_total Requests slower than SLOW_REQUEST_MS.')
+            lines.append('# TYPE quiz_slow_requests_total counter')
+            for endpoint, count in sorted(self._slow_requests.items()):
+                lines.append(f'quiz_slow_requests_total{{endpoint="{endpoint}"}} {count}')
+
+            lines.append('# HELP quiz_slow_queries_total SQL statements slower than SLOW_QUERY_MS.')
+            lines.append('# TYPE quiz_slow_queries_total counter')
+            lines.append(f'quiz_slow_queries_total {self._slow_queries}')
+        return '\n'.join(lines) + '\n'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _handle_error(context):
+    # A statement that failed never reaches after_cursor_execute; drop its start time. A connection runs
+    # one statement at a time, so whatever is pending belongs to the failed one.
+    if context.connection is not None:
+        context.connection.info.pop('query_start_time', None)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get('query_start_time')
+    if not start_times:
+        return
+    elapsed = time.perf_counter() - start_times.pop()
+
+    # Statements run outside a request (CLI commands, migrations) are not attributed.
+    if not has_app_context():
+        return
+    perf = g.get('perf')
+    if perf is None:
+        return
+    perf['queries'] += 1
+    perf['query_seconds'] += elapsed
+
+    config = current_app.config
+    if elapsed * 1000 >= config['SLOW_QUERY_MS']:
+        metrics = current_app.extensions.get('metrics')
+        if metrics is not None:
+            metrics.record_slow_query()
+        logger.warning(
+            'Slow query in %s (%.1f ms): %s',
+            request.endpoint if has_request_context() else None, elapsed * 1000, statement,
+        )
+
+
@@ -1,18 +1,44 @@
 from datetime import datetime, timezone
 
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import DDL, Index, UniqueConstraint, event, func, literal_column
+# Registers the Postgres full-text functions (to_tsvector) used by search_vector below.
+import sqlalchemy.dialects.postgresql  # noqa: F401
 from .extensions import db
 from passlib.hash import pbkdf2_sha256
 
+class Organization(db.Model):
+    """A school or course; the tenant that users, quizzes and attempts belong to (see app/tenancy.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(64), unique=True, nullable=False)
+    name = db.Column(db.String(200), nullable=False)
+    # Key of the SQLALCHEMY_BINDS database holding this organization's data (None = main database)
+    bind_key = db.Column(db.String(64), nullable=True)
+    # Flask-Limiter limit shared by all of the organization's requests, e.g. "6000 per minute"
+    rate_limit = db.Column(db.String(64), nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+# organization_id columns are plain integers: organizations always live in the main
+# database, while an organization's rows may live in a database of its own.
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
+    organization_id = db.Column(db.Integer, default=1, nullable=False)
+    # Unique per organization (see __table_args__); logins are looked up within the request's organization.
+    username = db.Column(db.String(80), nullable=False)
+    email = db.Column(db.String(120), nullable=False)
     password_hash = db.Column(db.String(256), nullable=False)
     role = db.Column(db.String(20), default='user', nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    # Tokens issued before this moment are rejected (set on role changes and forced logouts)
+    tokens_revoked_at = db.Column(db.DateTime, nullable=True, index=True)
     submissions = db.relationship('Submission', backref='user', lazy=True)
 
+    __table_args__ = (
+        UniqueConstraint('organization_id', 'username', name='uq_user_organization_id_username'),
+        UniqueConstraint('organization_id', 'email', name='uq_user_organization_id_email'),
+        Index('ix_user_organization_id_role', 'organization_id', 'role'),
+    )
+
     def set_password(self, password: str):
         self.password_hash = pbkdf2_sha256.hash(password)
 
@@ -21,13 +47,34 @@ class User(db.Model):
 
 class Quiz(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    organization_id = db.Column(db.Integer, default=1, nullable=False)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     is_published = db.Column(db.Boolean, default=False)
     time_limit_minutes = db.Column(db.Integer, nullable=True) # In minutes
+    # Per-attempt randomization: sample this many questions from the pool (None = all of them)
+    question_pool_size = db.Column(db.Integer, nullable=True)
+    shuffle_questions = db.Column(db.Boolean, default=False)
+    shuffle_choices = db.Column(db.Boolean, default=False)
+    # Latest QuizVersion snapshot; a plain integer to avoid a circular foreign key with quiz_version
+    current_version_id = db.Column(db.Integer, nullable=True)
+    # Set when an admin closes the quiz; attempts of closed quizzes can be archived
+    closed_at = db.Column(db.DateTime, nullable=True)
     questions = db.relationship('Question', backref='quiz', lazy=True, cascade='all, delete-orphan')
 
+    __table_args__ = (
+        # Serves the catalogue listing of one organization
+        Index('ix_quiz_organization_id_published_created', 'organization_id', 'is_published', 'created_at'),
+    )
+
+def search_vector(column):
+    """
+    The text search document of ``column`` on Postgres. The configuration is a
+    literal, not a parameter, so that queries match the expression indexes.
+    """
+    return func.to_tsvector(literal_column("'english'"), column)
+
 class Question(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
@@ -36,38 +83,169 @@ class Question(db.Model):
     points = db.Column(db.Integer, default=1, nullable=False)
     choices = db.relationship('Choice', backref='question', lazy=True, cascade='all, delete-orphan')
 
+    __table_args__ = (
+        # Full-text search of the question bank (app/search.py)
+        Index('ix_question_text_fts', search_vector(text),
+              postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+
+# SQLite has no full-text indexes; app/search.py keeps question and choice text in this FTS5 table instead.
+QUESTION_SEARCH_TABLE = 'question_search'
+event.listen(Question.__table__, 'after_create', DDL(
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {QUESTION_SEARCH_TABLE} "
+    f"USING fts5(question, choices, tokenize='porter unicode61')"
+).execute_if(dialect='sqlite'))
+event.listen(Question.__table__, 'before_drop',
+             DDL(f'DROP TABLE IF EXISTS {QUESTION_SEARCH_TABLE}').execute_if(dialect='sqlite'))
+
 class Choice(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False, index=True)
     text = db.Column(db.String(500), nullable=False)
     is_correct = db.Column(db.Boolean, default=False)
 
+    __table_args__ = (
+        Index('ix_choice_text_fts', search_vector(text),
+              postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+
+class QuizVersion(db.Model):
+    """Immutable snapshot of a quiz with its questions and choices, addressed by content hash."""
+    id = db.Column(db.Integer, primary_key=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False, index=True)
+    content_hash = db.Column(db.String(64), unique=True, nullable=False)
+    content = db.Column(db.Text, nullable=False) # Canonical JSON, see app/quiz_versions.py
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
 class QuizAttempt(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    organization_id = db.Column(db.Integer, default=1, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
     start_time = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
     end_time = db.Column(db.DateTime, nullable=True)
     status = db.Column(db.String(20), default='in-progress', nullable=False) # e.g., 'in-progress', 'submitted', 'time_expired'
     final_score = db.Column(db.Float, nullable=True)
+    # The quiz content this attempt is rendered and graded against
+    quiz_version_id = db.Column(db.Integer, db.ForeignKey('quiz_version.id'), nullable=True)
     
     # A user can only have one 'in-progress' attempt for any given quiz
     __table_args__ = (
         UniqueConstraint('user_id', 'quiz_id', name='_user_quiz_uc'),
+        Index('ix_quiz_attempt_organization_id_quiz_id', 'organization_id', 'quiz_id'),
     )
 
 
 class Submission(db.Model):
+    # On Postgres the table is range-partitioned by month on submitted_at, so its
+    # primary key there is (id, submitted_at); ids stay unique through one sequence.
     id = db.Column(db.Integer, primary_key=True)
-    attempt_id = db.Column(db.Integer, db.ForeignKey('quiz_attempt.id'), nullable=False)
+    attempt_id = db.Column(db.Integer, db.ForeignKey('quiz_attempt.id'), nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=True)
-    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=True, index=True) # Regrading works per question
     selected_choice_ids = db.Column(db.String(200), nullable=True)
     code = db.Column(db.Text, nullable=True)
     language = db.Column(db.String(50), nullable=True)
     score = db.Column(db.Float, nullable=True)
     graded = db.Column(db.Boolean, default=False)
     feedback = db.Column(db.Text, nullable=True)
-    submitted_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
-    graded_at = db.Column(db.DateTime, nullable=True)
\ No newline at end of file
+    submitted_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    graded_at = db.Column(db.DateTime, nullable=True)
+
+
+
+class UserQuizSummary(db.Model):
+    """
+    A user's finalized attempts at one quiz, summarized for dashboards and kept
+    up to date in the transactions that finalize and grade attempts (app/summaries.py).
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True, autoincrement=False)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), primary_key=True, autoincrement=False)
+    attempts = db.Column(db.Integer, nullable=False)
+    graded_attempts = db.Column(db.Integer, nullable=False)
+    pending_grading = db.Column(db.Integer, nullable=False) # Submitted, waiting for coding answers to be graded
+    best_score = db.Column(db.Float, nullable=True) # Over graded attempts
+    last_score = db.Column(db.Float, nullable=True)
+    last_status = db.Column(db.String(20), nullable=False)
+    last_finished_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+class QuizAttemptArchive(db.Model):
+    """Cold storage for finalized attempts of closed quizzes; rows keep their original ids."""
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=True)
+    status = db.Column(db.String(20), nullable=False)
+    final_score = db.Column(db.Float, nullable=True)
+    quiz_version_id = db.Column(db.Integer, nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+
+class SubmissionArchive(db.Model):
+    """Cold storage for the submissions of archived attempts; rows keep their original ids."""
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    attempt_id = db.Column(db.Integer, nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    quiz_id = db.Column(db.Integer, nullable=True)
+    question_id = db.Column(db.Integer, nullable=True, index=True)
+    selected_choice_ids = db.Column(db.String(200), nullable=True)
+    code = db.Column(db.Text, nullable=True)
+    language = db.Column(db.String(50), nullable=True)
+    score = db.Column(db.Float, nullable=True)
+    graded = db.Column(db.Boolean, default=False)
+    feedback = db.Column(db.Text, nullable=True)
+    submitted_at = db.Column(db.DateTime, nullable=False)
+    graded_at = db.Column(db.DateTime, nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+class IdempotencyKey(db.Model):
+    """Stored response of a request made with an ``Idempotency-Key`` header, replayed on retries."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    key = db.Column(db.String(128), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=True) # None while the original request is still running
+    response_body = db.Column(db.Text, nullable=True)
+    # When the running request claimed the key; a claim older than the lease is taken over by a retry
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'key', name='_user_idempotency_key_uc'),
+    )
+
+
+class RevokedToken(db.Model):
+    """A revoked JWT, kept until the token would have expired anyway (see app/tokens.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), unique=True, nullable=False)
+    token_type = db.Column(db.String(10), nullable=False)
+    organization_id = db.Column(db.Integer, default=1, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False) # No foreign key: the user may live in an organization's own database
+    reason = db.Column(db.String(50), nullable=True) # e.g. 'logout', 'rotated'
+    revoked_at = db.Column(db.DateTime, nullable=False, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class CodeSignature(db.Model):
+    """Normalized hash of a coding submission, identical for copies up to renaming and formatting (app/similarity.py)."""
+    # No foreign key: on Postgres submission is partitioned, with (id, submitted_at) as its primary key
+    submission_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
+    normalized_hash = db.Column(db.String(40), nullable=False)
+    fingerprint_count = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        Index('ix_code_signature_question_id_normalized_hash', 'question_id', 'normalized_hash'),
+    )
+
+
+class CodeFingerprint(db.Model):
+    """One winnowed fingerprint of a coding submission; the primary key is the per-question inverted index."""
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), primary_key=True, autoincrement=False)
+    hash = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    submission_id = db.Column(db.Integer, primary_key=True, autoincrement=False, index=True)
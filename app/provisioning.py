@@ -0,0 +1,180 @@
+"""
+Bulk user provisioning from CSV rosters.
+
+A roster has a header row with username and email columns, and optionally
+password and role. Rows are validated individually, then checked for taken
+usernames and emails in one query for the whole roster. Passwords (generated
+when the row has none) are hashed in parallel, since pbkdf2 is CPU-bound and
+would otherwise dominate: in a process pool from the command line, and in a
+thread pool inside a request, where forking the (possibly multi-threaded) web
+worker is not safe; hashlib releases the GIL while hashing, so the threads can
+still run on several cores. New users are written with a single bulk insert.
+Every row gets an entry in the returned report.
+"""
+
+import csv
+import os
+import secrets
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from marshmallow import ValidationError
+from passlib.hash import pbkdf2_sha256
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+
+from .extensions import db
+from .models import User
+from .schemas import RosterRowSchema
+from .tenancy import DEFAULT_TENANT
+
+REQUIRED_COLUMNS = ('username', 'email')
+# Below this many passwords starting a pool costs more than it saves.
+POOL_THRESHOLD = 32
+
+
+class RosterError(Exception):
+    pass
+
+
+def _hash_password(password):
+    return pbkdf2_sha256.hash(password)
+
+
+def hash_passwords(passwords, workers=None, processes=False):
+    """
+    Hashes ``passwords`` like User.set_password, spread over ``workers`` threads,
+    or processes with ``processes`` (only where forking is safe, e.g. the CLI).
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(passwords) < POOL_THRESHOLD:
+        return [_hash_password(p) for p in passwords]
+    if processes:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(_hash_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_hash_password, passwords))
+
+
+def read_roster(stream, max_rows=None):
+    """Parses a CSV roster into ``[(line_number, row_dict), ...]``."""
+    reader = csv.DictReader(stream)
+    if not reader.fieldnames:
+        raise RosterError('The roster is empty.')
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    missing = [name for name in REQUIRED_COLUMNS if name not in reader.fieldnames]
+    if missing:
+        raise RosterError(f'The roster is missing the column(s): {", ".join(missing)}.')
+
+    rows = []
+    for row in reader:
+        rows.append((reader.line_num, row))
+        if max_rows and len(rows) > max_rows:
+            raise RosterError(f'The roster has more than {max_rows} rows.')
+    return rows
+
+
+def _taken(usernames, emails, organization_id):
+    """Returns the usernames and emails among the given ones that already belong to a user of the organization."""
+    if not usernames and not emails:
+        return set(), set()
+    rows = db.session.execute(
+        select(User.username, User.email).where(
+            User.organization_id == organization_id,
+            or_(User.username.in_(usernames), User.email.in_(emails)),
+        )
+    ).all()
+    return {r.username for r in rows}, {r.email for r in rows}
+
+
+def _reject_taken(pending, organization_id):
+    taken_usernames, taken_emails = _taken([d['username'] for _, d in pending], [d['email'] for _, d in pending],
+                                           organization_id)
+    remaining = []
+    for entry, data in pending:
+        errors = {}
+        if data['username'] in taken_usernames:
+            errors['username'] = ['Username already exists.']
+        if data['email'] in taken_emails:
+            errors['email'] = ['Email already exists.']
+        if errors:
+            entry.pop('password', None)
+            entry.update(status='error', errors=errors)
+        else:
+            remaining.append((entry, data))
+    return remaining
+
+
+def provision_users(rows, dry_run=False, workers=None, organization_id=DEFAULT_TENANT.id, processes=False):
+    """
+    Creates users of ``organization_id`` for the parsed roster ``rows``. Returns a summary with one
+    report entry per row: status is 'created' ('valid' in a dry run) or 'error'.
+    Generated passwords are included in the report, as they are not stored anywhere else.
+    ``workers`` and ``processes`` are passed to hash_passwords.
+    """
+    schema = RosterRowSchema()
+    fields = set(schema.fields)
+    report, pending = [], []
+    seen_usernames, seen_emails = set(), set()
+    for line, raw in rows:
+        entry = {'line': line, 'username': (raw.get('username') or '').strip()}
+        report.append(entry)
+        values = {k: v.strip() for k, v in raw.items() if k in fields and isinstance(v, str) and v.strip()}
+        try:
+            data = schema.load(values)
+        except ValidationError as err:
+            entry.update(status='error', errors=err.messages)
+            continue
+        errors = {}
+        if data['username'] in seen_usernames:
+            errors['username'] = ['Duplicate username in roster.']
+        if data['email'] in seen_emails:
+            errors['email'] = ['Duplicate email in roster.']
+        seen_usernames.add(data['username'])
+        seen_emails.add(data['email'])
+        if errors:
+            entry.update(status='error', errors=errors)
+            continue
+        pending.append((entry, data))
+
+    pending = _reject_taken(pending, organization_id)
+
+    if dry_run:
+        for entry, _ in pending:
+            entry['status'] = 'valid'
+    elif pending:
+        passwords = []
+        for entry, data in pending:
+            if data['password'] is None:
+                data['password'] = entry['password'] = secrets.token_urlsafe(12)
+            passwords.append(data['password'])
+        hashes = dict(zip((entry['line'] for entry, _ in pending), hash_passwords(passwords, workers, processes)))
+
+        now = datetime.now(timezone.utc)
+        for retry in (True, False):
+            try:
+                db.session.execute(insert(User), [
+                    {'organization_id': organization_id,
+                     'username': d['username'], 'email': d['email'], 'role': d['role'],
+                     'password_hash': hashes[entry['line']], 'created_at': now}
+                    for entry, d in pending
+                ])
+                db.session.commit()
+                break
+            except IntegrityError:
+                db.session.rollback()
+                if not retry:
+                    raise
+                # Someone registered one of these names since the check; reject those rows and retry.
+                pending = _reject_taken(pending, organization_id)
+                if not pending:
+                    break
+        for entry, _ in pending:
+            entry['status'] = 'created'
+
+    return {
+        'created': sum(1 for e in report if e['status'] == 'created'),
+        'valid': sum(1 for e in report if e['status'] in ('created', 'valid')),
+        'errors': sum(1 for e in report if e['status'] == 'error'),
+        'rows': report,
+    }
@@ -0,0 +1,146 @@
+"""
+Immutable, content-addressed quiz snapshots.
+
+A QuizVersion stores a quiz with its questions and choices as one JSON blob,
+keyed by the SHA-256 of its canonical serialization. Attempts pin the version
+they started on, and rendering and grading read the snapshot instead of the
+live Quiz/Question/Choice rows, so later edits never change what an attempt
+sees or how it is scored. Versions never change once written, so parsed
+snapshots are cached per process without invalidation (keyed by database as
+well, since organizations with their own database reuse version ids).
+"""
+
+import hashlib
+import json
+from collections import namedtuple
+from functools import lru_cache
+
+from sqlalchemy.exc import IntegrityError
+
+from .extensions import db
+from .models import Quiz, QuizVersion
+from .schemas import QuizSchema
+from .tenancy import current_tenant
+
+# Attribute-compatible stand-ins for Question/Choice, as used by grade_question_auto.
+ChoiceView = namedtuple('ChoiceView', 'id is_correct')
+QuestionView = namedtuple('QuestionView', 'id qtype points choices')
+
+# Publication state is not content; it is read from the live quiz row.
+_MUTABLE_FIELDS = ('is_published',)
+
+
+class QuizSnapshot:
+    """A parsed QuizVersion with the lookups rendering and grading need precomputed."""
+
+    def __init__(self, version_id, quiz_id, content_hash, data):
+        self.id = version_id
+        self.quiz_id = quiz_id
+        self.content_hash = content_hash
+        self.data = data
+        self.public_data = dict(data, questions=[
+            dict(q, choices=[{k: v for k, v in c.items() if k != 'is_correct'} for c in q['choices']])
+            for q in data['questions']
+        ])
+        self.questions = {
+            q['id']: QuestionView(q['id'], q['qtype'], q['points'],
+                                  tuple(ChoiceView(c['id'], c['is_correct']) for c in q['choices']))
+            for q in data['questions']
+        }
+        self.question_ids = tuple(q['id'] for q in data['questions'])
+        self.choice_ids = tuple(tuple(c['id'] for c in q['choices']) for q in data['questions'])
+
+    @property
+    def time_limit_minutes(self):
+        return self.data.get('time_limit_minutes')
+
+    @property
+    def question_pool_size(self):
+        return self.data.get('question_pool_size')
+
+    @property
+    def shuffle_questions(self):
+        return bool(self.data.get('shuffle_questions'))
+
+    @property
+    def shuffle_choices(self):
+        return bool(self.data.get('shuffle_choices'))
+
+
+def serialize_quiz(quiz):
+    """Returns the canonical snapshot content of ``quiz`` (questions and choices ordered by id)."""
+    data = QuizSchema().dump(quiz)
+    for field in _MUTABLE_FIELDS:
+        data.pop(field, None)
+    data['questions'] = sorted(data['questions'], key=lambda q: q['id'])
+    for q in data['questions']:
+        q['choices'] = sorted(q.get('choices') or [], key=lambda c: c['id'])
+    return data
+
+
+def _encode(data):
+    return json.dumps(data, sort_keys=True, separators=(',', ':'))
+
+
+def snapshot_quiz(quiz):
+    """
+    Records the current content of ``quiz`` as a version (reusing an identical
+    existing one) and makes it the quiz's current version. Flushes but does not commit.
+    """
+    content = _encode(serialize_quiz(quiz))
+    content_hash = hashlib.sha256(content.encode()).hexdigest()
+    version = QuizVersion.query.filter_by(content_hash=content_hash).first()
+    if version is None:
+        version = QuizVersion(quiz_id=quiz.id, content_hash=content_hash, content=content)
+        db.session.add(version)
+        db.session.flush()
+    quiz.current_version_id = version.id
+    return version
+
+
+def load_version(version_id):
+    """
+    Returns the QuizSnapshot for a version id; a single-row fetch, then cached
+    forever. None if there is no such version; misses are not cached.
+    """
+    try:
+        return _load_version(current_tenant().bind_key, version_id)
+    except LookupError:
+        return None
+
+
+@lru_cache(maxsize=512)
+def _load_version(bind_key, version_id):
+    version = db.session.get(QuizVersion, version_id)
+    if version is None:
+        # Raised rather than returned, so lru_cache does not remember the miss.
+        raise LookupError(version_id)
+    return QuizSnapshot(version.id, version.quiz_id, version.content_hash, json.loads(version.content))
+
+
+def current_version(quiz):
+    """Returns the snapshot of the quiz's current version, taking one first for quizzes that predate versioning."""
+    if quiz.current_version_id is None:
+        try:
+            snapshot_quiz(quiz)
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent request stored the same content first; reuse its version.
+            db.session.rollback()
+            snapshot_quiz(quiz)
+            db.session.commit()
+    return load_version(quiz.current_version_id)
+
+
+def attempt_version(attempt, quiz=None):
+    """
+    Returns the snapshot an attempt is pinned to (the quiz's current one for
+    older attempts), or None if that version or quiz no longer exists.
+    """
+    if attempt.quiz_version_id is not None:
+        return load_version(attempt.quiz_version_id)
+    if quiz is None:
+        quiz = db.session.get(Quiz, attempt.quiz_id)
+        if quiz is None:
+            return None
+    return current_version(quiz)
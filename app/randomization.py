@@ -0,0 +1,72 @@
+"""
+Attempt-scoped question sampling and choice shuffling.
+
+Layouts are derived deterministically from the attempt id and the
+ATTEMPT_SHUFFLE_SEED secret, so nothing per student is stored: the same
+attempt always sees the same questions in the same order, and grading only
+needs to know which question ids belong to the attempt. Layouts are computed
+from the quiz version snapshot the attempt is pinned to (app/quiz_versions.py).
+"""
+
+import hashlib
+import random
+from functools import lru_cache
+
+from flask import current_app
+
+
+def is_randomized(snapshot):
+    return bool(snapshot.question_pool_size or snapshot.shuffle_questions or snapshot.shuffle_choices)
+
+
+@lru_cache(maxsize=8192)
+def _layout(seed, attempt_id, question_ids, choice_ids, pool_size, shuffle_questions, shuffle_choices):
+    digest = hashlib.sha256(f'{seed}:{attempt_id}'.encode()).digest()
+    rng = random.Random(int.from_bytes(digest[:8], 'big'))
+
+    indexes = list(range(len(question_ids)))
+    if pool_size and pool_size < len(indexes):
+        indexes = rng.sample(indexes, pool_size)
+        if not shuffle_questions:
+            indexes.sort()
+    elif shuffle_questions:
+        rng.shuffle(indexes)
+
+    layout = []
+    for i in indexes:
+        choices = list(choice_ids[i])
+        if shuffle_choices:
+            rng.shuffle(choices)
+        layout.append((question_ids[i], tuple(choices)))
+    return tuple(layout)
+
+
+def attempt_layout(snapshot, attempt_id):
+    """
+    Returns the attempt's layout as a tuple of ``(question_id, (choice_id, ...))``
+    in display order. Layouts are cached per attempt, so repeated timer polls
+    cost a dictionary lookup.
+    """
+    return _layout(
+        current_app.config['ATTEMPT_SHUFFLE_SEED'],
+        attempt_id,
+        snapshot.question_ids,
+        snapshot.choice_ids,
+        snapshot.question_pool_size,
+        snapshot.shuffle_questions,
+        snapshot.shuffle_choices,
+    )
+
+
+def apply_layout(quiz_data, layout):
+    """
+    Returns a copy of a dumped quiz with its questions and choices sampled and
+    reordered per ``layout``. The input (usually a cached snapshot) is left untouched.
+    """
+    questions = {q['id']: q for q in quiz_data.get('questions', [])}
+    ordered = []
+    for question_id, choice_ids in layout:
+        question = questions[question_id]
+        choices = {c['id']: c for c in question.get('choices', [])}
+        ordered.append(dict(question, choices=[choices[cid] for cid in choice_ids]))
+    return dict(quiz_data, questions=ordered)
@@ -0,0 +1,265 @@
+"""
+Structured request and event logging.
+
+Every request produces one JSON access record: endpoint, status, latency,
+query count, user, organization and the quiz/attempt it concerns, plus a
+request id that is also returned in the X-Request-ID header. The app's own
+log records (``app.*`` loggers, including Flask's unhandled-exception log)
+are written as JSON too, tagged with the request id of the request that
+emitted them.
+
+Request threads never write to the log themselves: records go onto a
+bounded in-memory queue and a background thread (a QueueListener) formats
+and writes them. If the writer falls behind and the queue fills up, records
+are dropped and counted rather than blocking requests.
+
+High-volume endpoints can be sampled (REQUEST_LOG_SAMPLING maps endpoint
+names to the fraction of requests to keep; REQUEST_LOG_SAMPLE_RATE is the
+default). Requests that fail (status >= 400) or are slower than
+SLOW_REQUEST_MS are always logged, and every record carries the rate it was
+sampled at.
+"""
+
+import atexit
+import itertools
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+import weakref
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import current_app, g, has_request_context, request
+
+ACCESS_LOGGER = 'app.requests'
+# Parent of every module logger in the package (and the name of Flask's app.logger).
+APP_LOGGER = 'app'
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+_RESERVED = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+access_logger = logging.getLogger(ACCESS_LOGGER)
+
+# Request ids are a random per-boot prefix, the worker's pid and a counter: unique, and much
+# cheaper than a uuid4 per request (os.urandom is a system call).
+_ID_PREFIX = uuid.uuid4().hex[:8]
+_request_counter = itertools.count(1)
+
+
+def new_request_id():
+    return f'{_ID_PREFIX}-{os.getpid():x}-{next(_request_counter):x}'
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line, including any ``extra`` fields."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        elif record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, separators=(',', ':'))
+
+
+class _RequestContextFilter(logging.Filter):
+    """Tags records emitted during a request with its id, so events can be matched to access records."""
+
+    def filter(self, record):
+        if has_request_context() and not hasattr(record, 'request_id'):
+            record.request_id = g.get('request_id')
+        return True
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """A QueueHandler that drops records when its queue is full instead of raising or blocking."""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+        self._reported = 0
+
+    def prepare(self, record):
+        # Only what cannot cross threads is resolved here; JSON encoding happens in the writer thread.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped != self._reported:
+            lost, self._reported = self.dropped - self._reported, self.dropped
+            try:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                    'msg': f'Log queue was full; dropped {lost} records', 'dropped_total': self.dropped,
+                }))
+            except queue.Full:
+                pass
+
+
+def _open_stream(path):
+    if not path:
+        return sys.stderr
+    if path == '-':
+        return sys.stdout
+    return open(path, 'a', buffering=1, encoding='utf-8')
+
+
+class RequestLog:
+    """Flask extension writing structured access and event logs off the request path; see the module docstring."""
+
+    def __init__(self, app=None):
+        self.handler = None
+        self.listener = None
+        self._stream = None
+        self._config = None
+        _request_logs.add(self)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('REQUEST_LOG_ENABLED', True)
+        app.config.setdefault('REQUEST_LOG_PATH', '')
+        app.config.setdefault('REQUEST_LOG_LEVEL', 'INFO')
+        app.config.setdefault('REQUEST_LOG_SAMPLE_RATE', 1.0)
+        app.config.setdefault('REQUEST_LOG_SAMPLING', {})
+        app.config.setdefault('REQUEST_LOG_QUEUE_SIZE', 10000)
+        app.config.setdefault('SLOW_REQUEST_MS', 500)
+        app.extensions['request_log'] = self
+
+        if not app.config['REQUEST_LOG_ENABLED']:
+            return
+        self._start(app.config)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def _start(self, config, forked=False):
+        """(Re)creates the queue, handler and writer thread. Replaces any previous setup, e.g. of an earlier app."""
+        if forked:
+            # The parent's writer thread and queue are not ours to stop; just let go of them.
+            self.listener = self._stream = None
+        self.stop()
+        self._config = config
+        self._stream = _open_stream(config['REQUEST_LOG_PATH'])
+        writer = logging.StreamHandler(self._stream)
+        writer.setFormatter(JsonFormatter())
+
+        self.handler = _NonBlockingQueueHandler(queue.Queue(config['REQUEST_LOG_QUEUE_SIZE']))
+        self.handler.addFilter(_RequestContextFilter())
+        self.listener = QueueListener(self.handler.queue, writer)
+        self.listener.start()
+
+        logger = logging.getLogger(APP_LOGGER)
+        for handler in [h for h in logger.handlers if isinstance(h, _NonBlockingQueueHandler)]:
+            logger.removeHandler(handler)
+        logger.addHandler(self.handler)
+        logger.setLevel(config['REQUEST_LOG_LEVEL'])
+        # Records end up in our log only, not also in whatever the root logger prints.
+        logger.propagate = False
+
+    def _restart_in_child(self):
+        if self.listener is not None:
+            self._start(self._config, forked=True)
+
+    def stop(self):
+        """Flushes queued records and stops the writer thread."""
+        if self.listener is not None:
+            try:
+                self.listener.stop()
+            except queue.Full:
+                pass  # no room for the stop signal; the writer is a daemon thread and ends with the process
+            self.listener = None
+        if self._stream not in (None, sys.stdout, sys.stderr):
+            self._stream.close()
+        self._stream = None
+
+    def _start_request(self):
+        # A caller's id (e.g. from a proxy) is kept so its logs and ours can be joined.
+        g.request_id = request.headers.get(REQUEST_ID_HEADER, '')[:64] or new_request_id()
+        g.request_log_start = time.perf_counter()
+
+    def _sample_rate(self, config):
+        return config['REQUEST_LOG_SAMPLING'].get(request.endpoint, config['REQUEST_LOG_SAMPLE_RATE'])
+
+    def _finish_request(self, response):
+        start = g.get('request_log_start')
+        if start is None:
+            return response
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+
+        config = current_app.config
+        latency_ms = (time.perf_counter() - start) * 1000
+        rate = self._sample_rate(config)
+        always = response.status_code >= 400 or latency_ms >= config['SLOW_REQUEST_MS']
+        if not always and (rate <= 0 or (rate < 1 and random.random() >= rate)):
+            return response
+
+        view_args = request.view_args or {}
+        perf = g.get('perf') or {}
+        tenant = g.get('tenant')
+        event = {
+            'request_id': g.request_id,
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'latency_ms': round(latency_ms, 2),
+            'queries': perf.get('queries'),
+            'query_ms': round(perf['query_seconds'] * 1000, 2) if 'query_seconds' in perf else None,
+            'user_id': _user_id(),
+            'organization': tenant.slug if tenant is not None else None,
+            'quiz_id': view_args.get('quiz_id'),
+            'attempt_id': view_args.get('attempt_id'),
+            'remote_addr': request.remote_addr,
+            'sample_rate': 1.0 if always else rate,
+        }
+        access_logger.info('request', extra=event)
+        return response
+
+
+_request_logs = weakref.WeakSet()
+
+
+def _restart_writers():
+    # The writer thread does not survive a fork (gunicorn --preload); give each child its own.
+    for log in list(_request_logs):
+        log._restart_in_child()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_writers)
+
+
+def _user_id():
+    from flask_jwt_extended import get_jwt_identity
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        return None  # the view does not use JWTs
+
+
+@atexit.register
+def _flush_at_exit():
+    from .extensions import request_log
+    request_log.stop()
@@ -1,10 +1,17 @@
-from marshmallow import Schema, fields, validates, ValidationError
+from marshmallow import Schema, fields, validate, validates, ValidationError
 
 class RegisterSchema(Schema):
     username = fields.Str(required=True)
     email = fields.Email(required=True)
     password = fields.Str(required=True)
 
+class RosterRowSchema(Schema):
+    """One row of a bulk-provisioning CSV roster; a missing password is generated."""
+    username = fields.Str(required=True, validate=validate.Length(min=1, max=80))
+    email = fields.Email(required=True, validate=validate.Length(max=120))
+    password = fields.Str(load_default=None)
+    role = fields.Str(load_default='user', validate=validate.OneOf(('user', 'admin')))
+
 class LoginSchema(Schema):
     username = fields.Str(required=True)
     password = fields.Str(required=True)
@@ -32,8 +39,16 @@ class QuizSchema(Schema):
     description = fields.Str()
     is_published = fields.Bool(load_default=False)
     time_limit_minutes = fields.Int(allow_none=True, load_default=None)
+    question_pool_size = fields.Int(allow_none=True, load_default=None)
+    shuffle_questions = fields.Bool(load_default=False)
+    shuffle_choices = fields.Bool(load_default=False)
     questions = fields.List(fields.Nested(QuestionSchema), required=True)
 
+    @validates('question_pool_size')
+    def validate_question_pool_size(self, val, **kwargs):
+        if val is not None and val < 1:
+            raise ValidationError('question_pool_size must be at least 1.')
+
 class QuizAttemptSchema(Schema):
     id = fields.Int(dump_only=True)
     user_id = fields.Int(required=True)
@@ -0,0 +1,154 @@
+"""
+Full-text search over the question bank.
+
+On Postgres, questions and choices are searched through GIN indexes on
+``to_tsvector('english', text)`` (declared on the models), which the
+database keeps up to date by itself. SQLite has no such indexes, so there
+the text of each question and its choices is copied into the
+``question_search`` FTS5 table (rowid = question id; it is created along
+with the question table, see app/models.py). create_quiz indexes new
+questions in the same transaction as the quiz, and ``flask
+reindex-questions`` rebuilds the table.
+
+Results are ranked by ts_rank (Postgres) or bm25 (SQLite), with a match in
+the question text weighing more than one in its choices, and only cover the
+current organization's quizzes.
+"""
+
+import re
+
+from sqlalchemy import column, delete, func, insert, literal_column, select, table, union_all
+
+from .extensions import db
+from .models import QUESTION_SEARCH_TABLE as FTS_TABLE, Choice, Question, Quiz, search_vector
+from .tenancy import tenant_id
+
+# Relative weight of a match in a choice compared to one in the question text
+CHOICE_WEIGHT = 0.5
+INDEX_CHUNK = 500
+
+_fts = table(FTS_TABLE, column('rowid'), column('question'), column('choices'))
+
+
+def include_name(name, type_, parent_names):
+    """Keeps the FTS5 table and its shadow tables out of migration autogenerate."""
+    return not (type_ == 'table' and name.startswith(FTS_TABLE))
+
+
+def _dialect():
+    return db.session.get_bind(mapper=Question).dialect.name
+
+
+def _fts_query(terms):
+    """
+    Turns search input into an FTS5 query the way websearch_to_tsquery reads it
+    on Postgres: all words must match, "quoted phrases" match as phrases and
+    -word excludes. Returns None if nothing searchable is left.
+    """
+    include, exclude = [], []
+    for negate, phrase, word in re.findall(r'(-?)(?:"([^"]*)"|(\S+))', terms):
+        tokens = re.findall(r'\w+', phrase or word)
+        if tokens:
+            (exclude if negate else include).append('"' + ' '.join(tokens) + '"')
+    if not include:
+        return None
+    return ' '.join(include) + ''.join(f' NOT {t}' for t in exclude)
+
+
+def _postgres_matches(terms):
+    query = func.websearch_to_tsquery(literal_column("'english'"), terms)
+    question_vector = search_vector(Question.text)
+    choice_vector = search_vector(Choice.text)
+    matches = union_all(
+        select(Question.id.label('question_id'), func.ts_rank(question_vector, query).label('rank'))
+        .where(question_vector.op('@@')(query)),
+        select(Choice.question_id, (func.ts_rank(choice_vector, query) * CHOICE_WEIGHT).label('rank'))
+        .where(choice_vector.op('@@')(query)),
+    ).subquery()
+    return (select(matches.c.question_id, func.sum(matches.c.rank).label('rank'))
+            .group_by(matches.c.question_id).subquery())
+
+
+def _sqlite_matches(terms):
+    fts = literal_column(FTS_TABLE)
+    # bm25 is lower for better matches.
+    return (select(_fts.c.rowid.label('question_id'), (-func.bm25(fts, 1.0, CHOICE_WEIGHT)).label('rank'))
+            .where(fts.op('MATCH')(terms)).subquery())
+
+
+def search_questions(terms, qtype=None, quiz_id=None, limit=20, offset=0):
+    """
+    Returns ``(results, has_more)``: up to ``limit`` questions of the current
+    organization matching ``terms``, best first, each with its quiz and choices.
+    """
+    if _dialect() == 'postgresql':
+        matches = _postgres_matches(terms)
+    else:
+        terms = _fts_query(terms)
+        if terms is None:
+            return [], False
+        matches = _sqlite_matches(terms)
+
+    stmt = (
+        select(Question.id, Question.quiz_id, Quiz.title, Question.qtype, Question.text, Question.points,
+               matches.c.rank)
+        .join(matches, matches.c.question_id == Question.id)
+        .join(Quiz, Quiz.id == Question.quiz_id)
+        .where(Quiz.organization_id == tenant_id())
+        .order_by(matches.c.rank.desc(), Question.id)
+        .limit(limit + 1).offset(offset)
+    )
+    if qtype:
+        stmt = stmt.where(Question.qtype == qtype)
+    if quiz_id is not None:
+        stmt = stmt.where(Question.quiz_id == quiz_id)
+    rows = db.session.execute(stmt).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    choices = {}
+    if rows:
+        for choice in Choice.query.filter(Choice.question_id.in_([r.id for r in rows])).order_by(Choice.id):
+            choices.setdefault(choice.question_id, []).append(
+                {'id': choice.id, 'text': choice.text, 'is_correct': choice.is_correct})
+    results = [{
+        'id': r.id,
+        'quiz_id': r.quiz_id,
+        'quiz_title': r.title,
+        'qtype': r.qtype,
+        'text': r.text,
+        'points': r.points,
+        'rank': round(float(r.rank), 6),
+        'choices': choices.get(r.id, []),
+    } for r in rows]
+    return results, has_more
+
+
+def _index_rows(question_ids=None):
+    stmt = (select(Question.id, Question.text, func.group_concat(Choice.text, ' '))
+            .outerjoin(Choice, Choice.question_id == Question.id)
+            .group_by(Question.id))
+    if question_ids is not None:
+        stmt = stmt.where(Question.id.in_(question_ids))
+    return insert(_fts).from_select(['rowid', 'question', 'choices'], stmt)
+
+
+def index_questions(question_ids):
+    """(Re)indexes the given questions. The caller commits. Postgres indexes itself, so this is a no-op there."""
+    if _dialect() != 'sqlite':
+        return
+    question_ids = list(question_ids)
+    for start in range(0, len(question_ids), INDEX_CHUNK):
+        chunk = question_ids[start:start + INDEX_CHUNK]
+        db.session.execute(delete(_fts).where(_fts.c.rowid.in_(chunk)))
+        db.session.execute(_index_rows(chunk))
+
+
+def rebuild_index():
+    """Rebuilds the search index of the current database from scratch and commits. Returns the questions indexed."""
+    if _dialect() != 'sqlite':
+        return db.session.query(Question.id).count()
+    db.session.execute(delete(_fts))
+    count = db.session.execute(_index_rows()).rowcount
+    db.session.commit()
+    return count
@@ -0,0 +1,285 @@
+"""
+Detection of identical and near-identical coding submissions.
+
+Each coding submission is reduced to a normalized token stream: comments and
+whitespace are dropped, and identifiers, numbers and strings are replaced by
+placeholders (keywords and operators are kept), so renaming variables or
+reformatting does not hide a copy. The stream's hash identifies submissions
+that are identical after normalization. For near-identical ones, the
+stream's k-gram hashes are winnowed (the minimum of every window of
+WINNOW_WINDOW hashes is kept), which guarantees that any shared run of at
+least WINNOW_K + WINNOW_WINDOW - 1 tokens yields a shared fingerprint.
+
+Fingerprints are stored per question in code_fingerprint, which is keyed
+(question_id, hash, submission_id) and so doubles as the inverted index
+that finds the submissions sharing fingerprints with a given one.
+Similarity is the Jaccard index of two submissions' fingerprint sets.
+Submissions are fingerprinted when they are submitted; flask
+fingerprint-submissions backfills older ones.
+"""
+
+import hashlib
+import re
+from collections import Counter, defaultdict
+from itertools import combinations
+
+from flask import current_app
+from sqlalchemy import func, insert, select
+
+from .extensions import db
+from .models import CodeFingerprint, CodeSignature, Submission
+
+WINNOW_K = 6
+WINNOW_WINDOW = 4
+# Fingerprints found in more than this fraction of a question's distinct solutions (and in at
+# least COMMON_MIN_SOLUTIONS of them) are starter code or idioms, and are ignored when comparing.
+COMMON_FRACTION = 0.5
+COMMON_MIN_SOLUTIONS = 10
+
+_TOKEN_RE = re.compile(r'''
+    (?P<comment>\#[^\n]*|//[^\n]*|/\*.*?\*/)
+  | (?P<string>"""(?:\\.|.)*?"""|\'\'\'(?:\\.|.)*?\'\'\'|"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`)
+  | (?P<number>\d[\w.]*|\.\d[\w]*)
+  | (?P<name>[^\W\d][\w$]*)
+  | (?P<op>\S)
+''', re.S | re.X)
+
+# Keywords of the languages students submit in most (Python, JavaScript, Java, C, C++, Go, SQL).
+KEYWORDS = frozenset('''
+    and as assert async await break case catch class const continue def default del do elif else enum
+    except export extends false finally for from func function go if import in instanceof interface is
+    lambda let match new nil none not null or package pass private protected public raise return self
+    static struct super switch this throw throws true try typeof var void while with yield
+    include int long short float double char bool boolean string unsigned signed auto template typename
+    select where insert update delete join group order by having limit values into create table
+'''.split())
+
+
+def normalize(code):
+    """The submission's tokens, with identifiers, numbers and strings replaced by placeholders."""
+    tokens = []
+    for match in _TOKEN_RE.finditer(code or ''):
+        kind = match.lastgroup
+        if kind == 'comment':
+            continue
+        if kind == 'name':
+            word = match.group().lower()
+            tokens.append(word if word in KEYWORDS else 'V')
+        elif kind == 'number':
+            tokens.append('N')
+        elif kind == 'string':
+            tokens.append('S')
+        else:
+            tokens.append(match.group())
+    return tokens
+
+
+_MASK = (1 << 64) - 1
+_BASE = 0x100000001B3
+_token_values = {}
+
+
+def _token_value(token):
+    value = _token_values.get(token)
+    if value is None:
+        # Normalized tokens are a small vocabulary (keywords, placeholders, operators), so this stays small.
+        value = _token_values[token] = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), 'big')
+    return value
+
+
+def _signed(value):
+    # Stored in a BIGINT column
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _kgram_hashes(tokens, k):
+    """Rolling (Rabin-Karp) hashes of every run of ``k`` consecutive tokens."""
+    values = [_token_value(t) for t in tokens]
+    top = pow(_BASE, k - 1, 1 << 64)
+    h = 0
+    for value in values[:k]:
+        h = (h * _BASE + value) & _MASK
+    hashes = [h]
+    for i in range(k, len(values)):
+        h = ((h - values[i - k] * top) * _BASE + values[i]) & _MASK
+        hashes.append(h)
+    return hashes
+
+
+def winnow(tokens, k=WINNOW_K, window=WINNOW_WINDOW):
+    """The winnowed fingerprints (a set of k-gram hashes) of a token stream."""
+    if not tokens:
+        return set()
+    grams = _kgram_hashes(tokens, min(k, len(tokens)))
+    if len(grams) <= window:
+        return {_signed(min(grams))}
+    minima = map(min, zip(*(grams[i:len(grams) - window + 1 + i] for i in range(window))))
+    return {_signed(h) for h in set(minima)}
+
+
+def signature(code):
+    """``(normalized hash, fingerprints)`` of a piece of code."""
+    tokens = normalize(code)
+    return hashlib.sha1(' '.join(tokens).encode()).hexdigest(), winnow(tokens)
+
+
+def record_fingerprints(submissions):
+    """Stores the signature and fingerprints of new, flushed coding submissions. The caller commits."""
+    submissions = [s for s in submissions if s.code]
+    if not submissions:
+        return
+    signatures, fingerprints = [], []
+    for submission in submissions:
+        normalized_hash, hashes = signature(submission.code)
+        signatures.append({'submission_id': submission.id, 'question_id': submission.question_id,
+                           'normalized_hash': normalized_hash, 'fingerprint_count': len(hashes)})
+        fingerprints.extend({'question_id': submission.question_id, 'hash': h, 'submission_id': submission.id}
+                            for h in hashes)
+    db.session.execute(insert(CodeSignature), signatures)
+    if fingerprints:
+        db.session.execute(insert(CodeFingerprint), fingerprints)
+
+
+def backfill(batch_size=500, log=None):
+    """Fingerprints coding submissions that have no signature yet, committing per batch. Returns the number done."""
+    done = 0
+    while True:
+        batch = (
+            Submission.query
+            .outerjoin(CodeSignature, CodeSignature.submission_id == Submission.id)
+            .filter(Submission.code.isnot(None), Submission.code != '', CodeSignature.submission_id.is_(None))
+            .order_by(Submission.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            return done
+        record_fingerprints(batch)
+        db.session.commit()
+        done += len(batch)
+        if log:
+            log(f'fingerprinted {done} submissions')
+
+
+def _jaccard(shared, size_a, size_b):
+    union = size_a + size_b - shared
+    return shared / union if union else 1.0
+
+
+def similar_submissions(submission, limit=5, threshold=None):
+    """
+    Submissions to the same question most similar to ``submission``, found
+    through the fingerprint index: ``[{'submission_id', 'similarity'}]``.
+    """
+    if threshold is None:
+        threshold = current_app.config['SIMILARITY_THRESHOLD']
+    own = db.session.get(CodeSignature, submission.id)
+    if own is None or not own.fingerprint_count:
+        return []
+    hashes = select(CodeFingerprint.hash).where(CodeFingerprint.submission_id == submission.id)
+    shared = (
+        select(CodeFingerprint.submission_id, func.count().label('shared'))
+        .where(CodeFingerprint.question_id == submission.question_id, CodeFingerprint.hash.in_(hashes),
+               CodeFingerprint.submission_id != submission.id)
+        .group_by(CodeFingerprint.submission_id)
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(shared.c.submission_id, shared.c.shared, CodeSignature.fingerprint_count)
+        .join(CodeSignature, CodeSignature.submission_id == shared.c.submission_id)
+        .join(Submission, Submission.id == shared.c.submission_id)
+    ).all()
+    matches = [{'submission_id': sid, 'similarity': round(_jaccard(n, own.fingerprint_count, count), 3)}
+               for sid, n, count in rows]
+    matches = [m for m in matches if m['similarity'] >= threshold]
+    matches.sort(key=lambda m: (-m['similarity'], m['submission_id']))
+    return matches[:limit]
+
+
+def clusters(question_id, threshold=None, ungraded_only=False):
+    """
+    Groups the live submissions to a question that are identical or at least
+    ``threshold`` similar (transitively). Returns the clusters of two or
+    more submissions, largest first; within a cluster, submissions with the
+    same ``variant`` are identical after normalization.
+    """
+    if threshold is None:
+        threshold = current_app.config['SIMILARITY_THRESHOLD']
+    members = db.session.execute(
+        select(CodeSignature.submission_id, CodeSignature.normalized_hash, Submission.user_id,
+               Submission.attempt_id, Submission.graded, Submission.score)
+        .join(Submission, Submission.id == CodeSignature.submission_id)
+        .where(CodeSignature.question_id == question_id)
+        .order_by(CodeSignature.submission_id)
+    ).all()
+    if ungraded_only:
+        members = [m for m in members if not m.graded]
+
+    # Identical submissions are compared once, through the first of them.
+    variants, representative = {}, {}
+    for m in members:
+        if m.normalized_hash not in variants:
+            variants[m.normalized_hash] = len(variants)
+            representative[m.submission_id] = variants[m.normalized_hash]
+    fingerprints = defaultdict(set)
+    for submission_id, fingerprint in db.session.execute(
+        select(CodeFingerprint.submission_id, CodeFingerprint.hash)
+        .where(CodeFingerprint.question_id == question_id)
+    ):
+        if submission_id in representative:
+            fingerprints[representative[submission_id]].add(fingerprint)
+
+    index = defaultdict(list)
+    for variant, hashes in fingerprints.items():
+        for fingerprint in hashes:
+            index[fingerprint].append(variant)
+    common_above = max(COMMON_MIN_SOLUTIONS, len(variants) * COMMON_FRACTION)
+    common = {h for h, found_in in index.items() if len(found_in) > common_above}
+    sizes = {variant: len(hashes - common) for variant, hashes in fingerprints.items()}
+    shared = Counter()
+    for fingerprint, found_in in index.items():
+        if fingerprint not in common:
+            shared.update(combinations(found_in, 2))
+
+    parent = list(range(len(variants)))
+
+    def find(v):
+        while parent[v] != v:
+            parent[v] = parent[parent[v]]
+            v = parent[v]
+        return v
+
+    links = []
+    for (a, b), count in shared.items():
+        similarity = _jaccard(count, sizes[a], sizes[b])
+        if similarity >= threshold:
+            parent[find(b)] = find(a)
+            links.append((a, similarity))
+    lowest = {}
+    for variant, similarity in links:
+        root = find(variant)
+        lowest[root] = min(similarity, lowest.get(root, 1.0))
+
+    groups = defaultdict(list)
+    for m in members:
+        groups[find(variants[m.normalized_hash])].append(m)
+    result = []
+    for root, group in groups.items():
+        if len(group) < 2:
+            continue
+        group_variants = {variants[m.normalized_hash] for m in group}
+        result.append({
+            'size': len(group),
+            'identical': len(group_variants) == 1,
+            'min_similarity': round(lowest.get(root, 1.0), 3),
+            'submissions': [{
+                'id': m.submission_id,
+                'user_id': m.user_id,
+                'attempt_id': m.attempt_id,
+                'variant': variants[m.normalized_hash],
+                'graded': m.graded,
+                'score': m.score,
+            } for m in group],
+        })
+    result.sort(key=lambda c: (-c['size'], c['submissions'][0]['id']))
+    return result
@@ -0,0 +1,155 @@
+"""
+Per-user attempt summaries for dashboards.
+
+user_quiz_summary holds one row per user and quiz: how many finalized
+attempts the user made (live and archived), how many are graded or still
+waiting for manual grading, the best graded score and the latest attempt's
+score and status. Dashboards read these rows with one indexed query instead
+of joining attempts, quizzes and submissions on every load.
+
+Rows are recomputed from the attempt tables for the (user, quiz) pairs a
+transaction touches, in that transaction, whenever an attempt is finalized
+(submit or expiry), graded or regraded. Recomputing rather than adjusting
+counters keeps them correct whatever the order of events. ``flask
+rebuild-summaries`` recomputes every row, e.g. after attempts were loaded
+in bulk.
+"""
+
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import delete, insert, select, union_all
+
+from .extensions import db
+from .models import QuizAttempt, QuizAttemptArchive, Quiz, UserQuizSummary
+
+FINAL_STATUSES = ('submitted', 'graded', 'time_expired')
+USER_CHUNK = 1000
+_UPDATED_COLUMNS = ('attempts', 'graded_attempts', 'pending_grading', 'best_score', 'last_score', 'last_status',
+                    'last_finished_at', 'updated_at')
+
+
+def _finalized_attempts(conditions):
+    """Finalized live and archived attempts; ``conditions(model)`` returns extra criteria for each table."""
+    return union_all(*(
+        select(model.user_id, model.quiz_id, model.status, model.final_score, model.end_time)
+        .where(model.status.in_(FINAL_STATUSES), *conditions(model))
+        for model in (QuizAttempt, QuizAttemptArchive)
+    ))
+
+
+def _summarize(rows, now):
+    """Summary rows (dicts) from attempt rows ``(user_id, quiz_id, status, final_score, end_time)``."""
+    by_pair = defaultdict(list)
+    for row in rows:
+        by_pair[row.user_id, row.quiz_id].append(row)
+    summaries = []
+    for (user_id, quiz_id), attempts in by_pair.items():
+        last = max(attempts, key=lambda a: a.end_time or datetime.min)
+        graded = [a.final_score for a in attempts if a.status == 'graded' and a.final_score is not None]
+        summaries.append({
+            'user_id': user_id,
+            'quiz_id': quiz_id,
+            'attempts': len(attempts),
+            'graded_attempts': sum(1 for a in attempts if a.status == 'graded'),
+            'pending_grading': sum(1 for a in attempts if a.status == 'submitted'),
+            'best_score': max(graded) if graded else None,
+            'last_score': last.final_score,
+            'last_status': last.status,
+            'last_finished_at': last.end_time,
+            'updated_at': now,
+        })
+    return summaries
+
+
+def _upsert(summaries):
+    if not summaries:
+        return
+    dialect = db.session.get_bind(mapper=UserQuizSummary).dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        db.session.execute(delete(UserQuizSummary).where(
+            UserQuizSummary.user_id.in_({s['user_id'] for s in summaries}),
+            UserQuizSummary.quiz_id.in_({s['quiz_id'] for s in summaries})))
+        db.session.execute(insert(UserQuizSummary), summaries)
+        return
+    stmt = dialect_insert(UserQuizSummary).values(summaries)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['user_id', 'quiz_id'],
+        set_={column: stmt.excluded[column] for column in _UPDATED_COLUMNS},
+    ))
+
+
+def refresh_summaries(pairs):
+    """Recomputes the summaries of the given ``(user_id, quiz_id)`` pairs. The caller commits."""
+    users_by_quiz = defaultdict(set)
+    for user_id, quiz_id in pairs:
+        users_by_quiz[quiz_id].add(int(user_id))
+    now = datetime.utcnow()
+    for quiz_id, user_ids in users_by_quiz.items():
+        user_ids = sorted(user_ids)
+        for start in range(0, len(user_ids), USER_CHUNK):
+            chunk = user_ids[start:start + USER_CHUNK]
+            rows = db.session.execute(_finalized_attempts(
+                lambda model: (model.quiz_id == quiz_id, model.user_id.in_(chunk)))).all()
+            _upsert(_summarize(rows, now))
+
+
+def rebuild_summaries(batch_size=USER_CHUNK, log=None):
+    """Recomputes every summary of the current database, committing per batch of users. Returns the rows written.
+
+    Each batch is upserted, then the batch's rows it did not write (pairs left without finalized attempts) are
+    deleted, so dashboards keep their rows while the rebuild runs and concurrent refreshes do not conflict with it.
+    """
+    from .models import User
+    written, after = 0, 0
+    now = datetime.utcnow()
+    while True:
+        user_ids = db.session.execute(
+            select(User.id).where(User.id > after).order_by(User.id).limit(batch_size)).scalars().all()
+        if not user_ids:
+            return written
+        rows = db.session.execute(_finalized_attempts(
+            lambda model: (model.user_id.in_(user_ids),))).all()
+        summaries = _summarize(rows, now)
+        _upsert(summaries)
+        db.session.execute(delete(UserQuizSummary).where(
+            UserQuizSummary.user_id.in_(user_ids), UserQuizSummary.updated_at < now))
+        db.session.commit()
+        written += len(summaries)
+        after = user_ids[-1]
+        if log:
+            log(f'summarized {written} user/quiz pairs')
+
+
+def dashboard(user_id):
+    """The dashboard of ``user_id``: totals and one entry per quiz, most recently finished first."""
+    rows = db.session.execute(
+        select(UserQuizSummary, Quiz.title)
+        .join(Quiz, Quiz.id == UserQuizSummary.quiz_id)
+        .where(UserQuizSummary.user_id == user_id)
+        .order_by(UserQuizSummary.last_finished_at.desc(), UserQuizSummary.quiz_id)
+    ).all()
+    quizzes = [{
+        'quiz_id': summary.quiz_id,
+        'quiz_title': title,
+        'attempts': summary.attempts,
+        'graded_attempts': summary.graded_attempts,
+        'pending_grading': summary.pending_grading,
+        'best_score': summary.best_score,
+        'last_score': summary.last_score,
+        'last_status': summary.last_status,
+        'last_finished_at': summary.last_finished_at.isoformat() if summary.last_finished_at else None,
+    } for summary, title in rows]
+    return {
+        'totals': {
+            'quizzes': len(quizzes),
+            'attempts': sum(q['attempts'] for q in quizzes),
+            'graded_attempts': sum(q['graded_attempts'] for q in quizzes),
+            'pending_grading': sum(q['pending_grading'] for q in quizzes),
+        },
+        'quizzes': quizzes,
+    }
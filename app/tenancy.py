@@ -0,0 +1,176 @@
+"""
+Organization (tenant) scoping.
+
+Every request is resolved to an organization before anything else runs: from
+the ``org`` claim of its bearer token when it has one, otherwise from the
+X-Organization header (an organization slug), otherwise the default
+organization. Users, quizzes and attempts carry an organization_id, and the
+routes filter on it.
+
+An organization can live in its own database: set its bind_key to one of the
+databases configured in TENANT_DATABASE_URLS (exposed as SQLALCHEMY_BINDS).
+TenantSession then sends every query of that organization's requests to that
+database, except for the global tables (organizations and revoked tokens),
+which always stay in the main one. Ids are only unique per database, so
+anything keyed by id outside the database (caches, revocation markers) is
+also keyed by organization.
+"""
+
+import logging
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, jsonify, request
+from flask_limiter.util import get_remote_address
+from flask_sqlalchemy.session import Session
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.sql.util import find_tables
+
+logger = logging.getLogger(__name__)
+
+Tenant = namedtuple('Tenant', 'id slug bind_key rate_limit')
+
+# Rows that exist before any organization is created belong to organization 1.
+DEFAULT_TENANT = Tenant(1, 'default', None, None)
+GLOBAL_TABLES = frozenset({'organization', 'revoked_token'})
+HEADER = 'X-Organization'
+
+
+def current_tenant():
+    if not has_app_context():
+        return DEFAULT_TENANT
+    return g.get('tenant') or DEFAULT_TENANT
+
+
+def tenant_id():
+    return current_tenant().id
+
+
+@contextmanager
+def use_tenant(tenant):
+    """Runs a block (e.g. a CLI command) as ``tenant``, including database routing."""
+    previous = g.get('tenant')
+    g.tenant = tenant
+    try:
+        yield tenant
+    finally:
+        g.tenant = previous
+
+
+def _is_global(mapper, clause):
+    if mapper is not None:
+        return sa_inspect(mapper).local_table.name in GLOBAL_TABLES
+    if clause is not None:
+        names = {t.name for t in find_tables(clause, include_crud=True)}
+        return bool(names) and names <= GLOBAL_TABLES
+    return False
+
+
+class TenantSession(Session):
+    """Routes the current organization's queries to its own database bind, if it has one."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            tenant = g.get('tenant')
+            if tenant is not None and tenant.bind_key and not _is_global(mapper, clause):
+                return self._db.engines[tenant.bind_key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _token_org():
+    """The ``org`` claim of the request's bearer token; signature-checked, but expiry and revocation are left to the view."""
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        return None
+    from flask_jwt_extended import decode_token
+    try:
+        return decode_token(header[len('Bearer '):], allow_expired=True).get('org')
+    except Exception:
+        return None  # the view's own token check reports the error
+
+
+class Tenancy:
+    """Flask extension resolving the organization of each request; see the module docstring."""
+
+    def __init__(self, app=None):
+        self._by_id = {}
+        self._by_slug = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('TENANT_CACHE_SECONDS', 30)
+        app.config.setdefault('TENANT_RATE_LIMIT', None)
+        app.before_request(self._resolve)
+        app.extensions['tenancy'] = self
+
+        # Cached entries are namespaced per organization, as ids repeat across databases.
+        from .extensions import cache
+        cache.namespace = lambda: f'org{tenant_id()}'
+
+    def _load(self):
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._loaded_at < current_app.config['TENANT_CACHE_SECONDS']:
+            return
+        with self._lock:
+            if self._loaded_at is not None and now - self._loaded_at < current_app.config['TENANT_CACHE_SECONDS']:
+                return
+            from .extensions import db
+            from .models import Organization
+            try:
+                orgs = [Tenant(o.id, o.slug, o.bind_key, o.rate_limit) for o in Organization.query.all()]
+                db.session.rollback()
+            except Exception:
+                # Keep serving with what we had (health checks must still answer when the database is down).
+                logger.exception('Could not load organizations')
+                db.session.rollback()
+                self._loaded_at = now
+                return
+            self._by_id = {t.id: t for t in orgs}
+            self._by_slug = {t.slug: t for t in orgs}
+            self._loaded_at = now
+
+    def get(self, org_id=None, slug=None):
+        self._load()
+        if org_id is not None:
+            tenant = self._by_id.get(org_id)
+            return tenant or (DEFAULT_TENANT if org_id == DEFAULT_TENANT.id else None)
+        tenant = self._by_slug.get(slug)
+        return tenant or (DEFAULT_TENANT if slug == DEFAULT_TENANT.slug else None)
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def _resolve(self):
+        org_id = _token_org()
+        slug = request.headers.get(HEADER)
+        if org_id is not None:
+            tenant = self.get(org_id=org_id)
+        elif slug:
+            tenant = self.get(slug=slug)
+        else:
+            tenant = self.get(org_id=DEFAULT_TENANT.id)
+        if tenant is None:
+            return jsonify({'msg': 'Unknown organization'}), 400
+        if tenant.bind_key and tenant.bind_key not in (current_app.config.get('SQLALCHEMY_BINDS') or {}):
+            logger.error('Organization %s is routed to unconfigured bind %r', tenant.slug, tenant.bind_key)
+            return jsonify({'msg': 'Organization database unavailable'}), 503
+        g.tenant = tenant
+
+
+def client_key():
+    """Limiter key: clients are counted per organization, so schools behind one NAT don't share buckets."""
+    return f'{current_tenant().slug}:{get_remote_address()}'
+
+
+def organization_key():
+    return f'org:{tenant_id()}'
+
+
+def organization_rate_limit():
+    """The limit shared by all requests of the organization; an empty string means none."""
+    return current_tenant().rate_limit or current_app.config['TENANT_RATE_LIMIT'] or ''
@@ -0,0 +1,220 @@
+"""
+Token revocation for short-lived access and rotating refresh tokens.
+
+Revoked token ids (jti) are stored in the revoked_token table, which every
+worker shares. Each worker mirrors it into an in-memory Bloom filter, so the
+check run on every authenticated request is a few bit lookups: a negative
+answer is definitive and needs no query, and only a positive one (a revoked
+token, or a rare false positive) is confirmed against the table.
+
+Revoking every token of a user at once (on a role change, or when an account
+is compromised) sets ``User.tokens_revoked_at``; tokens issued before it are
+rejected. User ids repeat across organization databases (app/tenancy.py), so
+markers are keyed by (organization, user) and read from every database.
+Both are synced incrementally every REVOCATION_SYNC_SECONDS, so a
+revocation made by another worker takes effect within that interval; the
+worker that revokes sees it immediately.
+"""
+
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+from .extensions import db
+from .models import RevokedToken, User
+from .tenancy import DEFAULT_TENANT
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """A fixed-size Bloom filter over strings."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(capacity, 1)
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _timestamp(value):
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+class RevocationList:
+    """Flask extension keeping the per-process view of revoked tokens; see the module docstring."""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._reset()
+        if app is not None:
+            self.init_app(app)
+
+    def _reset(self):
+        self.bloom = BloomFilter(1)
+        self.revoked_after = {}  # (organization id, user id) -> POSIX time before which the user's tokens are invalid
+        self._watermark = None
+        self._synced_at = 0.0
+        self._rebuilt_at = 0.0
+
+    def init_app(self, app):
+        app.config.setdefault('REVOCATION_SYNC_SECONDS', 5)
+        app.config.setdefault('REVOCATION_REBUILD_SECONDS', 3600)
+        app.config.setdefault('REVOCATION_BLOOM_CAPACITY', 100_000)
+        app.config.setdefault('REVOCATION_BLOOM_ERROR_RATE', 0.001)
+        app.extensions['revocations'] = self
+
+        from .extensions import jwt
+        jwt.token_in_blocklist_loader(self._is_revoked)
+
+    def _is_revoked(self, jwt_header, jwt_payload):
+        self.sync()
+        revoked_after = self.revoked_after.get((jwt_payload.get('org', DEFAULT_TENANT.id), int(jwt_payload['sub'])))
+        if revoked_after is not None and jwt_payload['iat'] <= revoked_after:
+            return True
+        jti = jwt_payload['jti']
+        if jti not in self.bloom:
+            return False
+        return db.session.query(RevokedToken.id).filter_by(jti=jti).first() is not None
+
+    def sync(self, force=False):
+        """Pulls revocations made since the last sync; rebuilds the filter from scratch periodically."""
+        config = current_app.config
+        now = time.monotonic()
+        if not force and now - self._synced_at < config['REVOCATION_SYNC_SECONDS']:
+            return
+        # Until the first sync has finished every thread waits for it; afterwards one stale check is harmless.
+        if not self._lock.acquire(blocking=force or self._watermark is None):
+            return
+        try:
+            if not force and time.monotonic() - self._synced_at < config['REVOCATION_SYNC_SECONDS']:
+                return  # the thread we waited for has just synced
+            started = _utcnow()
+            rebuild = force or now - self._rebuilt_at >= config['REVOCATION_REBUILD_SECONDS']
+            # Overlap the window so revocations committed late by slow transactions are not missed.
+            since = None if rebuild or self._watermark is None else self._watermark - timedelta(
+                seconds=config['REVOCATION_SYNC_SECONDS'] * 2)
+
+            tokens = db.session.query(RevokedToken.jti).filter(RevokedToken.expires_at > started)
+            users = (select(User.organization_id, User.id, User.tokens_revoked_at)
+                     .where(User.tokens_revoked_at.isnot(None)))
+            if since is not None:
+                tokens = tokens.filter(RevokedToken.revoked_at >= since)
+                users = users.where(User.tokens_revoked_at >= since)
+
+            if since is None:
+                live = db.session.query(RevokedToken.id).filter(RevokedToken.expires_at > started).count()
+                bloom = BloomFilter(max(config['REVOCATION_BLOOM_CAPACITY'], live * 2),
+                                    config['REVOCATION_BLOOM_ERROR_RATE'])
+                revoked_after = {}
+            else:
+                bloom, revoked_after = self.bloom, dict(self.revoked_after)
+            for (jti,) in tokens:
+                bloom.add(jti)
+            incomplete = False
+            for key, engine in db.engines.items():
+                try:
+                    rows = db.session.execute(users, bind_arguments={'bind': engine}).all()
+                except SQLAlchemyError:
+                    # One unreachable organization database must not lock every organization out.
+                    logger.exception('Could not sync revocations from database %r', key)
+                    db.session.rollback()
+                    incomplete = True
+                    continue
+                for org_id, user_id, revoked_at in rows:
+                    revoked_after[(org_id, user_id)] = _timestamp(revoked_at)
+
+            if incomplete or (since is not None and bloom.count > bloom.capacity):
+                self._rebuilt_at = 0.0  # retry the skipped database, or over capacity: rebuild bigger next time
+            elif since is None:
+                self._rebuilt_at = now
+            self.bloom, self.revoked_after = bloom, revoked_after
+            self._watermark = started
+            self._synced_at = now
+        finally:
+            self._lock.release()
+
+    def revoke(self, jwt_payload, reason=None):
+        """Revokes one decoded token. Returns False if it was already revoked. The caller commits."""
+        jti = jwt_payload['jti']
+        self.bloom.add(jti)
+        if db.session.query(RevokedToken.id).filter_by(jti=jti).first() is not None:
+            return False
+        db.session.add(RevokedToken(
+            jti=jti,
+            token_type=jwt_payload.get('type', 'access'),
+            organization_id=jwt_payload.get('org', DEFAULT_TENANT.id),
+            user_id=int(jwt_payload['sub']),
+            reason=reason,
+            revoked_at=_utcnow(),
+            expires_at=datetime.fromtimestamp(jwt_payload['exp'], timezone.utc).replace(tzinfo=None),
+        ))
+        return True
+
+    def revoke_user(self, user):
+        """
+        Revokes every token issued to ``user`` so far. Token timestamps have
+        whole-second precision, so tokens issued in the rest of the current
+        second are rejected too. The caller commits.
+        """
+        user.tokens_revoked_at = _utcnow()
+        self.revoked_after[(user.organization_id, user.id)] = _timestamp(user.tokens_revoked_at)
+
+
+revocations = RevocationList()
+
+
+def issue_tokens(user):
+    """
+    Returns a new access/refresh token pair. Both name the user's organization;
+    the role travels in the access token so admin checks need no query.
+    """
+    identity = str(user.id)
+    return {
+        'access_token': create_access_token(identity=identity,
+                                            additional_claims={'org': user.organization_id, 'role': user.role}),
+        'refresh_token': create_refresh_token(identity=identity, additional_claims={'org': user.organization_id}),
+    }
+
+
+def decode_refresh_token(token):
+    """Decodes a refresh token passed in a request body; returns None if it is invalid or not a refresh token."""
+    try:
+        payload = decode_token(token)
+    except Exception:
+        return None
+    return payload if payload.get('type') == 'refresh' else None
+
+
+def purge_expired_tokens():
+    """Deletes revoked_token rows whose tokens have expired anyway. Returns the number removed."""
+    removed = RevokedToken.query.filter(RevokedToken.expires_at <= _utcnow()).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
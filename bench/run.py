@@ -0,0 +1,197 @@
+"""
+Exam-day benchmark for the quiz API.
+
+Builds the app against SQLite (default) or a local Postgres, seeds a profile
+from bench/seed.py, replays the exam-day mix from bench/scenarios.py and
+reports throughput, p50/p95/p99 latency and SQL queries per request for every
+phase. Results can be compared against a stored baseline so regressions show
+up in review.
+
+Examples:
+  python -m bench.run
+  python -m bench.run --profile medium --concurrency 16
+  python -m bench.run --database-url postgresql://localhost/quiz_bench --profile exam
+  python -m bench.run --save-baseline
+  python -m bench.run --url http://127.0.0.1:8080   # against a server, see gunicorn.conf.py
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(results):
+    summary = {}
+    for r in results:
+        count = len(r.latencies)
+        summary[r.name] = {
+            'requests': count,
+            'errors': r.errors,
+            'throughput_rps': round(count / r.wall_seconds, 1) if r.wall_seconds else 0.0,
+            'p50_ms': round(percentile(r.latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(r.latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(r.latencies, 99) * 1000, 2),
+            'queries_per_request': round(sum(r.queries) / count, 2) if count else 0.0,
+        }
+    return summary
+
+
+def print_report(summary):
+    header = f'{"phase":<16}{"reqs":>7}{"errs":>6}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"q/req":>8}'
+    print(header)
+    print('-' * len(header))
+    for name, s in summary.items():
+        print(f'{name:<16}{s["requests"]:>7}{s["errors"]:>6}{s["throughput_rps"]:>9}'
+              f'{s["p50_ms"]:>9}{s["p95_ms"]:>9}{s["p99_ms"]:>9}{s["queries_per_request"]:>8}')
+
+
+def compare(summary, baseline, latency_tolerance):
+    """Returns a list of human readable regressions of ``summary`` against ``baseline``."""
+    regressions = []
+    for name, base in baseline.get('phases', {}).items():
+        current = summary.get(name)
+        if current is None:
+            regressions.append(f'{name}: phase missing from this run')
+            continue
+        if current['queries_per_request'] > base['queries_per_request']:
+            regressions.append(
+                f'{name}: queries/request {base["queries_per_request"]} -> {current["queries_per_request"]}')
+        if base['p95_ms'] and current['p95_ms'] > base['p95_ms'] * (1 + latency_tolerance):
+            regressions.append(f'{name}: p95 {base["p95_ms"]} ms -> {current["p95_ms"]} ms')
+        if current['errors'] > base['errors']:
+            regressions.append(f'{name}: errors {base["errors"]} -> {current["errors"]}')
+    return regressions
+
+
+def print_diff(summary, baseline):
+    print(f'\nAgainst baseline ({baseline.get("profile")} profile, recorded {baseline.get("recorded_at")}):')
+    for name, s in summary.items():
+        base = baseline.get('phases', {}).get(name)
+        if not base:
+            print(f'  {name:<16}(new phase)')
+            continue
+
+        def delta(key):
+            if not base[key]:
+                return f'{s[key]}'
+            return f'{s[key]} ({(s[key] - base[key]) / base[key] * 100:+.0f}%)'
+
+        print(f'  {name:<16}p95 {delta("p95_ms")} ms, q/req {delta("queries_per_request")}, '
+              f'req/s {delta("throughput_rps")}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profile', default='small', help='data set size: small, medium or exam')
+    parser.add_argument('--database-url', default=None,
+                        help='SQLAlchemy URL to benchmark against (default: sqlite:///bench.db)')
+    parser.add_argument('--url', default=None,
+                        help='replay the requests against a server running the benchmark config at this URL '
+                             'instead of the in-process test client; the database is still seeded from here')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--students', type=int, default=None,
+                        help='students taking the exam (default: every seeded student)')
+    parser.add_argument('--skip-seed', action='store_true', help='reuse an already seeded database')
+    parser.add_argument('--output', default=None, help='write the JSON results to this file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--latency-tolerance', type=float, default=0.5,
+                        help='allowed relative p95 increase before a phase counts as regressed')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args(argv)
+
+    # The benchmark config reads its database URL at import time.
+    if args.database_url:
+        os.environ['BENCH_DATABASE_URL'] = args.database_url
+
+    from app import create_app
+    from .scenarios import HttpRunner, Runner, exam_day
+    from .seed import PROFILES, seed
+
+    profile = PROFILES[args.profile]
+    app = create_app('benchmark')
+    with app.app_context():
+        if args.skip_seed:
+            from .seed import SeededData, ADMIN_USERNAME
+            data = _load_seeded(profile, ADMIN_USERNAME, SeededData)
+        else:
+            start = time.perf_counter()
+            data = seed(profile)
+            print(f'seeding took {time.perf_counter() - start:.1f}s')
+
+    runner = HttpRunner(args.url, args.concurrency) if args.url else Runner(app, args.concurrency)
+    results = exam_day(runner, data, students=args.students or len(data.student_usernames))
+    summary = summarize(results)
+    print()
+    print_report(summary)
+
+    record = {
+        'profile': args.profile,
+        'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0],
+        'concurrency': args.concurrency,
+        'python': platform.python_version(),
+        'recorded_at': time.strftime('%Y-%m-%d'),
+        'phases': summary,
+    }
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(record, fh, indent=2)
+
+    status = 0
+    if args.save_baseline:
+        with open(args.baseline, 'w') as fh:
+            json.dump(record, fh, indent=2)
+            fh.write('\n')
+        print(f'\nbaseline written to {args.baseline}')
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        print_diff(summary, baseline)
+        regressions = compare(summary, baseline, args.latency_tolerance)
+        if regressions:
+            print('\nRegressions:')
+            for line in regressions:
+                print(f'  {line}')
+            status = 1 if args.fail_on_regression else 0
+    return status
+
+
+def _load_seeded(profile, admin_username, seeded_cls):
+    """
+    Rebuilds the SeededData description from an existing benchmark database
+    and clears the exam attempts left behind by the previous run.
+    """
+    from app.extensions import db
+    from app.models import User, Quiz, Question, QuizAttempt, Submission
+
+    exam = Quiz.query.filter_by(title='Final exam').order_by(Quiz.id.desc()).first()
+    if exam is None:
+        sys.exit('no seeded exam found; run without --skip-seed first')
+    Submission.query.filter_by(quiz_id=exam.id).delete()
+    QuizAttempt.query.filter_by(quiz_id=exam.id).delete()
+    db.session.commit()
+    students = [u for (u,) in User.query.with_entities(User.username)
+                .filter(User.role == 'user').order_by(User.id).limit(profile.users)]
+    questions = []
+    for q in Question.query.filter_by(quiz_id=exam.id).order_by(Question.id):
+        questions.append((q.id, q.qtype, [c.id for c in q.choices], [c.id for c in q.choices if c.is_correct]))
+    return seeded_cls(admin_username, students, exam.id, questions)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+The exam-day request mix, replayed phase by phase against the Flask test client
+(Runner) or a running server (HttpRunner, e.g. gunicorn with one of the
+gunicorn.conf.py presets).
+
+Each phase issues its requests from a thread pool so handlers overlap the way
+they would across gunicorn threads; every request is timed by the harness and
+its SQL statement count is read back from the ``Server-Timing`` header added by
+app/instrumentation.py.
+"""
+
+import http.client
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from json import dumps, loads
+from urllib.parse import urlsplit
+
+from .seed import ADMIN_PASSWORD, STUDENT_PASSWORD
+
+_QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+
+@dataclass
+class PhaseResult:
+    name: str
+    wall_seconds: float = 0.0
+    latencies: list = field(default_factory=list)
+    queries: list = field(default_factory=list)
+    errors: int = 0
+
+
+class Runner:
+    def __init__(self, app, concurrency):
+        self.app = app
+        self.concurrency = concurrency
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        return client
+
+    def request(self, result, method, url, expect, **kwargs):
+        start = time.perf_counter()
+        response = self._client().open(url, method=method, **kwargs)
+        elapsed = time.perf_counter() - start
+        match = _QUERIES_RE.search(response.headers.get('Server-Timing', ''))
+        result.latencies.append(elapsed)
+        result.queries.append(int(match.group(1)) if match else 0)
+        if response.status_code not in expect:
+            result.errors += 1
+            return None
+        return response.get_json(silent=True)
+
+    def phase(self, name, tasks):
+        """Runs ``tasks`` (callables taking a PhaseResult) concurrently."""
+        result = PhaseResult(name)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for future in [pool.submit(task, result) for task in tasks]:
+                future.result()
+        result.wall_seconds = time.perf_counter() - start
+        return result
+
+
+class _HttpResponse:
+    def __init__(self, response):
+        self.status_code = response.status
+        self.headers = response.headers
+        self.data = response.read()
+
+    def get_json(self, silent=False):
+        try:
+            return loads(self.data)
+        except ValueError:
+            if silent:
+                return None
+            raise
+
+
+class _HttpClient:
+    """A keep-alive HTTP connection with the part of the test client's interface the scenarios use."""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self._connect = lambda: http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+        self._prefix = parts.path.rstrip('/')
+        self._conn = self._connect()
+
+    def open(self, url, method='GET', json=None, headers=None):
+        headers = dict(headers or {})
+        body = None
+        if json is not None:
+            body = dumps(json)
+            headers['Content-Type'] = 'application/json'
+        for retry in (False, True):
+            try:
+                self._conn.request(method, self._prefix + url, body=body, headers=headers)
+                return _HttpResponse(self._conn.getresponse())
+            except (http.client.HTTPException, ConnectionError):
+                # The server closed the kept-alive connection (e.g. a worker hit max_requests).
+                self._conn.close()
+                self._conn = self._connect()
+                if retry:
+                    raise
+
+
+
+class HttpRunner(Runner):
+    """Runs the phases against a server listening at ``base_url`` instead of the test client."""
+
+    def __init__(self, base_url, concurrency):
+        super().__init__(None, concurrency)
+        self.base_url = base_url
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = _HttpClient(self.base_url)
+        return client
+
+
+def _auth(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def _answers(questions, rng_index):
+    answers = []
+    for i, (qid, qtype, choice_ids, correct) in enumerate(questions):
+        if qtype == 'coding':
+            answers.append({'question_id': qid, 'code': f'print({rng_index + i})', 'language': 'python'})
+        elif (rng_index + i) % 3:
+            answers.append({'question_id': qid, 'selected_choice_ids': correct})
+        else:
+            answers.append({'question_id': qid, 'selected_choice_ids': choice_ids[:1]})
+    return answers
+
+
+def exam_day(runner, data, students, polls_per_student=3, grading_ops=50):
+    """Replays the exam-day mix and returns one PhaseResult per phase."""
+    students = data.student_usernames[:students]
+    tokens, attempts, results = {}, {}, []
+    quiz_id = data.exam_quiz_id
+
+    def login(username, password):
+        def task(result):
+            body = runner.request(result, 'POST', '/api/auth/login', (200,),
+                                  json={'username': username, 'password': password})
+            if body:
+                tokens[username] = body['access_token']
+        return task
+
+    results.append(runner.phase('login_storm', [login(u, STUDENT_PASSWORD) for u in students]))
+
+    def get_quiz(username):
+        return lambda result: runner.request(result, 'GET', f'/api/quizzes/{quiz_id}', (200,),
+                                             headers=_auth(tokens[username]))
+
+    results.append(runner.phase('get_quiz_burst', [get_quiz(u) for u in students if u in tokens]))
+
+    def start(username):
+        def task(result):
+            body = runner.request(result, 'POST', f'/api/quizzes/{quiz_id}/start', (201,),
+                                  headers=_auth(tokens[username]))
+            if body:
+                attempts[username] = body['attempt_id']
+        return task
+
+    results.append(runner.phase('start_quiz', [start(u) for u in students if u in tokens]))
+
+    def poll(username):
+        return lambda result: runner.request(result, 'GET', f'/api/quizzes/attempts/{attempts[username]}', (200,),
+                                             headers=_auth(tokens[username]))
+
+    results.append(runner.phase(
+        'timer_poll', [poll(u) for _ in range(polls_per_student) for u in students if u in attempts]))
+
+    def submit(index, username):
+        return lambda result: runner.request(
+            result, 'POST', f'/api/quizzes/attempts/{attempts[username]}/submit', (201,),
+            headers=_auth(tokens[username]), json={'answers': _answers(data.exam_questions, index)})
+
+    results.append(runner.phase(
+        'submit_spike', [submit(i, u) for i, u in enumerate(students) if u in attempts]))
+
+    admin = PhaseResult('admin_login')
+    admin_token = runner.request(admin, 'POST', '/api/auth/login', (200,),
+                                 json={'username': data.admin_username, 'password': ADMIN_PASSWORD})['access_token']
+    pending = runner.request(admin, 'GET', '/api/admin/pending_coding', (200,), headers=_auth(admin_token)) or []
+    exam_pending = [s['id'] for s in pending if s['quiz_id'] == quiz_id][:grading_ops]
+
+    def grade(submission_id):
+        def task(result):
+            runner.request(result, 'GET', f'/api/admin/submission/{submission_id}', (200,),
+                           headers=_auth(admin_token))
+            runner.request(result, 'POST', f'/api/admin/grade/{submission_id}', (200,),
+                           headers=_auth(admin_token), json={'score': 1, 'feedback': 'ok'})
+        return task
+
+    results.append(runner.phase('admin_grading', [grade(sid) for sid in exam_pending]))
+
+    def dashboard(username):
+        return lambda result: runner.request(result, 'GET', '/api/submissions/mine', (200,),
+                                             headers=_auth(tokens[username]))
+
+    results.append(runner.phase('dashboard', [dashboard(u) for u in students if u in tokens]))
+    return results
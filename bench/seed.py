@@ -0,0 +1,193 @@
+"""
+Seeds a benchmark database with a realistic exam-day data set.
+
+Students share one precomputed password hash so seeding thousands of users
+does not spend minutes in pbkdf2. Historical attempts and submissions are
+written with bulk inserts in batches, so the large profiles (millions of
+submission rows) stay within memory.
+"""
+
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from passlib.hash import pbkdf2_sha256
+from sqlalchemy import insert
+
+from app.extensions import db, cache
+from app.models import User, Quiz, Question, Choice, QuizAttempt, Submission
+from app.quiz_versions import snapshot_quiz
+
+STUDENT_PASSWORD = 'benchpass'
+ADMIN_USERNAME = 'bench-admin'
+ADMIN_PASSWORD = 'bench-admin-pass'
+BATCH_SIZE = 10_000
+
+
+@dataclass
+class Profile:
+    users: int
+    history_quizzes: int
+    questions_per_quiz: int
+    # Fraction of questions in each quiz of each type; the rest are coding questions.
+    mcq_ratio: float = 0.7
+    msq_ratio: float = 0.2
+
+
+PROFILES = {
+    # Fast enough to run on every review (~45k historical submissions).
+    'small': Profile(users=300, history_quizzes=3, questions_per_quiz=50),
+    # Mid-sized course (~600k historical submissions).
+    'medium': Profile(users=2_000, history_quizzes=5, questions_per_quiz=60),
+    # Exam day at full scale (~3M historical submissions).
+    'exam': Profile(users=5_000, history_quizzes=10, questions_per_quiz=60),
+}
+
+
+@dataclass
+class SeededData:
+    admin_username: str
+    student_usernames: list
+    exam_quiz_id: int
+    exam_questions: list  # [(question_id, qtype, [choice_id, ...], [correct_choice_id, ...])]
+
+
+def _flush(model, rows):
+    if rows:
+        db.session.execute(insert(model), rows)
+        rows.clear()
+
+
+def _build_quiz(quiz_id, title, profile, next_ids, rng, published, created_at):
+    """Returns the quiz row, question/choice rows and a compact description of the questions."""
+    quiz_row = {
+        'id': quiz_id, 'title': title, 'description': f'{title} (benchmark)',
+        'created_at': created_at, 'is_published': published, 'time_limit_minutes': 90,
+    }
+    question_rows, choice_rows, questions = [], [], []
+    n = profile.questions_per_quiz
+    n_mcq = int(n * profile.mcq_ratio)
+    n_msq = int(n * profile.msq_ratio)
+    for i in range(n):
+        qtype = 'mcq' if i < n_mcq else 'msq' if i < n_mcq + n_msq else 'coding'
+        qid = next_ids['question']
+        next_ids['question'] += 1
+        question_rows.append({
+            'id': qid, 'quiz_id': quiz_id, 'qtype': qtype, 'points': rng.choice((1, 2, 3)),
+            'text': f'Question {i + 1} of {title}: which of the following statements hold?',
+        })
+        choice_ids, correct = [], []
+        if qtype != 'coding':
+            n_choices = 4 if qtype == 'mcq' else 5
+            correct_idx = {rng.randrange(n_choices)} if qtype == 'mcq' else set(rng.sample(range(n_choices), 2))
+            for c in range(n_choices):
+                cid = next_ids['choice']
+                next_ids['choice'] += 1
+                choice_rows.append({
+                    'id': cid, 'question_id': qid, 'text': f'Option {c + 1}', 'is_correct': c in correct_idx,
+                })
+                choice_ids.append(cid)
+                if c in correct_idx:
+                    correct.append(cid)
+        questions.append((qid, qtype, choice_ids, correct))
+    return quiz_row, question_rows, choice_rows, questions
+
+
+def seed(profile, seed_value=1234, log=print):
+    """Drops and recreates all tables, then fills them according to ``profile``."""
+    rng = random.Random(seed_value)
+    db.drop_all()
+    db.create_all()
+    # The shared cache tier outlives the process; entries for the old rows must go.
+    cache.clear()
+
+    now = datetime.utcnow()
+    admin = User(username=ADMIN_USERNAME, email='bench-admin@example.com', role='admin')
+    admin.set_password(ADMIN_PASSWORD)
+    db.session.add(admin)
+    db.session.flush()
+
+    student_hash = pbkdf2_sha256.hash(STUDENT_PASSWORD)
+    usernames = []
+    rows = []
+    first_student_id = admin.id + 1
+    for i in range(profile.users):
+        username = f'student{i:05d}'
+        usernames.append(username)
+        rows.append({
+            'id': first_student_id + i, 'username': username, 'email': f'{username}@example.com',
+            'password_hash': student_hash, 'role': 'user', 'created_at': now,
+        })
+        if len(rows) >= BATCH_SIZE:
+            _flush(User, rows)
+    _flush(User, rows)
+    log(f'seeded {profile.users} students')
+
+    next_ids = {'question': 1, 'choice': 1}
+    attempt_id, submission_id = 1, 1
+    total_submissions = 0
+    for qz in range(profile.history_quizzes):
+        quiz_id = qz + 1
+        created_at = now - timedelta(days=7 * (profile.history_quizzes - qz) + 7)
+        quiz_row, question_rows, choice_rows, questions = _build_quiz(
+            quiz_id, f'Week {qz + 1} quiz', profile, next_ids, rng, True, created_at)
+        _flush(Quiz, [quiz_row])
+        _flush(Question, question_rows)
+        _flush(Choice, choice_rows)
+
+        attempts, submissions = [], []
+        for u in range(profile.users):
+            user_id = first_student_id + u
+            start = created_at + timedelta(minutes=rng.randrange(0, 600))
+            total = 0.0
+            for qid, qtype, choice_ids, correct in questions:
+                row = {
+                    'id': submission_id, 'attempt_id': attempt_id, 'user_id': user_id, 'quiz_id': quiz_id,
+                    'question_id': qid, 'selected_choice_ids': None, 'code': None, 'language': None,
+                    'score': None, 'graded': True, 'feedback': None, 'submitted_at': start + timedelta(minutes=45),
+                    'graded_at': start + timedelta(days=1),
+                }
+                if qtype == 'coding':
+                    row['code'] = f'def solve(xs):\n    return sorted(xs)[:{rng.randrange(1, 9)}]\n'
+                    row['language'] = 'python'
+                    row['score'] = float(rng.randrange(0, 4))
+                else:
+                    picked = correct if rng.random() < 0.6 else [rng.choice(choice_ids)]
+                    row['selected_choice_ids'] = ','.join(map(str, picked))
+                    row['score'] = 1.0 if picked == correct else 0.0
+                total += row['score']
+                submissions.append(row)
+                submission_id += 1
+            attempts.append({
+                'id': attempt_id, 'user_id': user_id, 'quiz_id': quiz_id, 'start_time': start,
+                'end_time': start + timedelta(minutes=45), 'status': 'graded', 'final_score': total,
+            })
+            attempt_id += 1
+            if len(submissions) >= BATCH_SIZE:
+                _flush(QuizAttempt, attempts)
+                total_submissions += len(submissions)
+                _flush(Submission, submissions)
+        _flush(QuizAttempt, attempts)
+        total_submissions += len(submissions)
+        _flush(Submission, submissions)
+        db.session.commit()
+        log(f'seeded history quiz {quiz_id}: {total_submissions} submissions so far')
+
+    exam_quiz_id = profile.history_quizzes + 1
+    quiz_row, question_rows, choice_rows, exam_questions = _build_quiz(
+        exam_quiz_id, 'Final exam', profile, next_ids, rng, True, now)
+    _flush(Quiz, [quiz_row])
+    _flush(Question, question_rows)
+    _flush(Choice, choice_rows)
+    # Quizzes created through the API get a version snapshot straight away.
+    for quiz in Quiz.query.order_by(Quiz.id):
+        snapshot_quiz(quiz)
+    db.session.commit()
+    log(f'seeded exam quiz {exam_quiz_id} with {len(exam_questions)} questions')
+
+    return SeededData(
+        admin_username=ADMIN_USERNAME,
+        student_usernames=usernames,
+        exam_quiz_id=exam_quiz_id,
+        exam_questions=exam_questions,
+    )
@@ -0,0 +1,110 @@
+"""
+Gunicorn settings for the quiz API (gunicorn reads ./gunicorn.conf.py by default).
+
+GUNICORN_PRESET picks the worker model; the worker and thread counts follow
+from the CPUs the container may use:
+
+  sync     2 x cores + 1 single-threaded workers. Each worker serves one
+           request at a time, so a request never waits on another one's
+           Python code; the choice when password hashing (login, register,
+           roster provisioning) dominates.
+  gthread  (default) cores + 1 workers with GUNICORN_THREADS (4) threads
+           each. Requests spend most of their time waiting on the database,
+           and a thread waiting on a socket releases the GIL, so each worker
+           overlaps that wait; it also uses fewer connections and less memory
+           than the same concurrency in sync workers.
+  gevent   One worker per core serving up to GUNICORN_WORKER_CONNECTIONS
+           (100) requests as greenlets; for many slow, mostly idle clients.
+           Needs ``pip install gevent``, and psycogreen for psycopg2 to yield
+           while it waits on Postgres (otherwise each query blocks the worker).
+           The app is not preloaded: gevent has to patch the standard library
+           before the app creates its locks and threads.
+
+WEB_CONCURRENCY and GUNICORN_THREADS override the derived counts. Workers
+are restarted after GUNICORN_MAX_REQUESTS requests, plus a random jitter so
+they do not all restart at once, which bounds slow memory growth.
+
+With the app preloaded, each worker drops the database connections it
+inherited from the master at fork (app/__init__.py registers dispose_engines
+with os.register_at_fork), so workers never share a socket.
+"""
+
+import math
+import os
+
+PRESETS = {
+    'sync': {'worker_class': 'sync', 'threads': 1, 'preload_app': True},
+    'gthread': {'worker_class': 'gthread', 'threads': 4, 'preload_app': True},
+    'gevent': {'worker_class': 'gevent', 'threads': 1, 'preload_app': False},
+}
+
+
+def available_cores():
+    """CPUs this process may run on, capped by the container's CPU quota (cgroup v2) if it has one."""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as fh:
+            quota, period = fh.read().split()
+        if quota != 'max':
+            cores = min(cores, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+def default_workers(preset, cores):
+    if preset == 'sync':
+        return 2 * cores + 1
+    if preset == 'gthread':
+        return cores + 1
+    return cores
+
+
+preset = os.environ.get('GUNICORN_PRESET', 'gthread').lower()
+if preset not in PRESETS:
+    raise RuntimeError(f"GUNICORN_PRESET must be one of {', '.join(PRESETS)}, not {preset!r}")
+settings = PRESETS[preset]
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+worker_class = settings['worker_class']
+workers = int(os.environ.get('WEB_CONCURRENCY') or default_workers(preset, available_cores()))
+threads = int(os.environ.get('GUNICORN_THREADS') or settings['threads'])
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100))
+preload_app = settings['preload_app']
+
+# A worker silent for this long (e.g. a sync worker stuck in one request) is killed and restarted.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+# On shutdown or reload, in-flight requests (e.g. submissions) get this long to finish.
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+# Slightly longer than the idle timeout of the platform's load balancer, so it closes idle connections first.
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 75))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', max_requests // 10))
+
+# Worker heartbeats go to memory rather than the container's (possibly slow) overlay filesystem.
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+# The app writes its own structured access log (app/request_log.py).
+accesslog = None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    if worker_class != 'gevent':
+        return
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        server.log.warning('psycogreen is not installed; Postgres queries will block gevent workers')
+        return
+    # Before the worker loads the app and opens its first connection
+    patch_psycopg()
+
+
+def when_ready(server):
+    server.log.info('Serving with the %s preset: %d workers x %d threads', preset, workers,
+                    worker_connections if worker_class == 'gevent' else threads)
@@ -13,13 +13,11 @@ import sys
 import os
 from flask_migrate import init as _init, migrate as _migrate, upgrade as _upgrade
 from app import create_app
-from app.extensions import db
-from app.models import User
-from datetime import datetime
+from app.cli import ensure_admin
 
 def ensure_app():
-    # create app using same factory
-    app = create_app()
+    # create app using same factory; with_cli sets up Flask-Migrate
+    app = create_app(with_cli=True)
     return app
 
 def do_init(app):
@@ -40,17 +38,10 @@ def do_upgrade(app):
 
 def do_create_admin(app):
     with app.app_context():
-        username = os.environ.get('ADMIN_USERNAME', 'admin')
-        email = os.environ.get('ADMIN_EMAIL', 'admin@example.com')
-        password = os.environ.get('ADMIN_PASSWORD', 'adminpass')
-        if User.query.filter_by(username=username).first():
+        if ensure_admin():
+            print("admin created:", os.environ.get('ADMIN_USERNAME', 'admin'))
+        else:
             print("admin already exists")
-            return
-        u = User(username=username, email=email, role='admin')
-        u.set_password(password)
-        db.session.add(u)
-        db.session.commit()
-        print("admin created:", username)
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -0,0 +1,157 @@
+"""Add archive tables, quiz.closed_at and monthly partitions of submission
+
+Revision ID: e3b7a2c61f48
+Revises: 9d41c7be5f20
+Create Date: 2026-10-19 14:42:10.318245
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3b7a2c61f48'
+down_revision = '9d41c7be5f20'
+branch_labels = None
+depends_on = None
+
+# Monthly partitions created ahead of the current month; flask release keeps extending them.
+MONTHS_AHEAD = 3
+
+
+def _next_month(value):
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def _partition_submission():
+    """Rebuilds submission as a table range-partitioned by month on submitted_at (Postgres)."""
+    bind = op.get_bind()
+    op.execute('ALTER TABLE submission RENAME TO submission_unpartitioned')
+    op.execute('ALTER TABLE submission_unpartitioned RENAME CONSTRAINT submission_pkey TO submission_unpartitioned_pkey')
+    op.execute(
+        'CREATE TABLE submission (LIKE submission_unpartitioned INCLUDING DEFAULTS) '
+        'PARTITION BY RANGE (submitted_at)'
+    )
+    # The partition key has to be part of the primary key.
+    op.execute('ALTER TABLE submission ADD CONSTRAINT submission_pkey PRIMARY KEY (id, submitted_at)')
+    op.execute('ALTER SEQUENCE submission_id_seq OWNED BY submission.id')
+    op.execute('ALTER TABLE submission ADD FOREIGN KEY (attempt_id) REFERENCES quiz_attempt (id)')
+    op.execute('ALTER TABLE submission ADD FOREIGN KEY (user_id) REFERENCES "user" (id)')
+    op.execute('ALTER TABLE submission ADD FOREIGN KEY (quiz_id) REFERENCES quiz (id)')
+    op.execute('ALTER TABLE submission ADD FOREIGN KEY (question_id) REFERENCES question (id)')
+    op.execute('CREATE TABLE submission_default PARTITION OF submission DEFAULT')
+
+    first = bind.execute(sa.text('SELECT min(submitted_at) FROM submission_unpartitioned')).scalar()
+    now = datetime.utcnow()
+    month = datetime((first or now).year, (first or now).month, 1)
+    last = datetime(now.year, now.month, 1)
+    for _ in range(MONTHS_AHEAD):
+        last = _next_month(last)
+    while month <= last:
+        op.execute(
+            f"CREATE TABLE submission_p{month:%Y%m} PARTITION OF submission "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_next_month(month):%Y-%m-%d}')"
+        )
+        month = _next_month(month)
+
+    op.execute('INSERT INTO submission SELECT * FROM submission_unpartitioned')
+    op.execute('DROP TABLE submission_unpartitioned')
+    op.create_index('ix_submission_attempt_id', 'submission', ['attempt_id'], unique=False)
+
+
+def _unpartition_submission():
+    op.execute('ALTER TABLE submission RENAME TO submission_partitioned')
+    op.execute('ALTER TABLE submission_partitioned RENAME CONSTRAINT submission_pkey TO submission_partitioned_pkey')
+    op.execute('DROP INDEX ix_submission_attempt_id')
+    op.execute('CREATE TABLE submission (LIKE submission_partitioned INCLUDING DEFAULTS)')
+    op.execute('ALTER TABLE submission ADD CONSTRAINT submission_pkey PRIMARY KEY (id)')
+    op.execute('ALTER SEQUENCE submission_id_seq OWNED BY submission.id')
+    op.execute('ALTER TABLE submission ADD FOREIGN KEY (attempt_id) REFERENCES quiz_attempt (id)')
+    op.execute('ALTER TABLE submission ADD FOREIGN KEY (user_id) REFERENCES "user" (id)')
+    op.execute('ALTER TABLE submission ADD FOREIGN KEY (quiz_id) REFERENCES quiz (id)')
+    op.execute('ALTER TABLE submission ADD FOREIGN KEY (question_id) REFERENCES question (id)')
+    op.execute('INSERT INTO submission SELECT * FROM submission_partitioned')
+    op.execute('DROP TABLE submission_partitioned CASCADE')
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('quiz_attempt_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('quiz_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('end_time', sa.DateTime(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('final_score', sa.Float(), nullable=True),
+    sa.Column('quiz_version_id', sa.Integer(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['quiz_id'], ['quiz.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('quiz_attempt_archive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_quiz_attempt_archive_user_id'), ['user_id'], unique=False)
+
+    op.create_table('submission_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('attempt_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('quiz_id', sa.Integer(), nullable=True),
+    sa.Column('question_id', sa.Integer(), nullable=True),
+    sa.Column('selected_choice_ids', sa.String(length=200), nullable=True),
+    sa.Column('code', sa.Text(), nullable=True),
+    sa.Column('language', sa.String(length=50), nullable=True),
+    sa.Column('score', sa.Float(), nullable=True),
+    sa.Column('graded', sa.Boolean(), nullable=True),
+    sa.Column('feedback', sa.Text(), nullable=True),
+    sa.Column('submitted_at', sa.DateTime(), nullable=False),
+    sa.Column('graded_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('submission_archive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_submission_archive_attempt_id'), ['attempt_id'], unique=False)
+
+    with op.batch_alter_table('quiz', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('closed_at', sa.DateTime(), nullable=True))
+
+    # ### end Alembic commands ###
+
+    # submitted_at becomes the partition key on Postgres, so it can no longer be NULL.
+    op.execute('UPDATE submission SET submitted_at = COALESCE(graded_at, CURRENT_TIMESTAMP) WHERE submitted_at IS NULL')
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column('submission', 'submitted_at', existing_type=sa.DateTime(), nullable=False)
+        _partition_submission()
+    else:
+        with op.batch_alter_table('submission', schema=None) as batch_op:
+            batch_op.alter_column('submitted_at', existing_type=sa.DateTime(), nullable=False)
+            batch_op.create_index(batch_op.f('ix_submission_attempt_id'), ['attempt_id'], unique=False)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        _unpartition_submission()
+        op.alter_column('submission', 'submitted_at', existing_type=sa.DateTime(), nullable=True)
+    else:
+        with op.batch_alter_table('submission', schema=None) as batch_op:
+            batch_op.drop_index(batch_op.f('ix_submission_attempt_id'))
+            batch_op.alter_column('submitted_at', existing_type=sa.DateTime(), nullable=True)
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table('quiz', schema=None) as batch_op:
+        batch_op.drop_column('closed_at')
+
+    with op.batch_alter_table('submission_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_submission_archive_attempt_id'))
+
+    op.drop_table('submission_archive')
+    with op.batch_alter_table('quiz_attempt_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_quiz_attempt_archive_user_id'))
+
+    op.drop_table('quiz_attempt_archive')
+    # ### end Alembic commands ###